@@ -6,6 +6,8 @@ from sqlalchemy import func, select
 
 from const import date_format, date_format_2
 from db.models import LastUpdateDate
+from db.session import get_db_name
+from services.response_cache import response_cache
 
 
 async def add_last_load_date(async_session: Callable, metrics_type: str) -> None:
@@ -33,6 +35,9 @@ async def add_last_load_date(async_session: Callable, metrics_type: str) -> None
         else:
             print(f"Date {current_date} already exists.")
 
+    # данные тенанта обновились - закэшированные ответы таблиц больше не актуальны
+    await response_cache.invalidate(get_db_name(async_session))
+
 
 async def get_last_load_date(async_session: Callable, metrics_type: str) -> str | None:
     async with async_session() as s:
@@ -52,6 +57,15 @@ async def get_last_load_date(async_session: Callable, metrics_type: str) -> str
     return None
 
 
+async def get_last_load_marker(async_session: Callable) -> str:
+    """Последняя загрузка тенанта по всем типам метрик: меняется с каждой новой загрузкой"""
+    async with async_session() as s:
+        last_id, last_date = (await s.execute(
+            select(func.max(LastUpdateDate.id), func.max(LastUpdateDate.date))
+        )).one()
+    return f"{last_id}:{last_date.strftime(date_format_2) if last_date else ''}"
+
+
 async def get_last_date(async_session: Callable, metric_type):
     async with async_session() as s:
         res = (await s.execute(select(func.max(metric_type.date)))).scalars().first()
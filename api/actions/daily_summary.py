@@ -0,0 +1,10 @@
+from typing import Callable
+
+from db.dals import DailySummaryDAL
+
+
+async def _refresh_daily_summary(metrics_type: str, date_from, session: Callable):
+    async with session() as s:
+        summary_dal = DailySummaryDAL(s)
+        await summary_dal.refresh(metrics_type, date_from)
+
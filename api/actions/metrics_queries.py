@@ -1,6 +1,6 @@
 from typing import Callable
 
-from db.dals import MetricQueryDAL
+from db.dals import MetricQueryDAL, QueryDAL, bulk_transaction
 
 from datetime import date
 
@@ -14,6 +14,15 @@ async def _add_new_metrics(urls, session: Callable):
         return order_id
 
 
+
+async def _bulk_add_metrics(keys, records, session: Callable):
+    """Ключи и строки метрик одной страницы выгрузки - одной транзакцией"""
+    async with session() as s:
+        async with bulk_transaction(s):
+            await QueryDAL(s).add_new_urls(keys, bulk=True)
+            await MetricQueryDAL(s).add_new_metrics(records, bulk=True)
+
+
 async def _get_top_data_query(top: int, session: Callable):
     async with session() as s:
         order_dal = MetricQueryDAL(s)
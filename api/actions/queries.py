@@ -10,41 +10,55 @@ async def _add_new_urls(urls, session):
         return order_id
 
 
-async def _get_urls_with_pagination_query(page, per_page, date_start, date_end, state, state_date, metric_type, state_type, session):
+async def _get_urls_with_pagination_query(page, per_page, date_start, date_end, state, state_date, metric_type, state_type, session,
+                                          cursor=None):
     async with session() as s:
         url_dal = QueryDAL(s)
-        urls = await url_dal.get_urls_with_pagination(
-            page, per_page, date_start, date_end, state, state_date, metric_type, state_type,
+        urls, next_cursor = await url_dal.get_urls_with_pagination(
+            page, per_page, date_start, date_end, state, state_date, metric_type, state_type, cursor,
         )
-        return urls
+        return urls, next_cursor
 
 
-async def _get_urls_with_pagination_and_like_query(page, per_page, date_start, date_end, search_text, state, state_date, metric_type, state_type, session):
+async def _get_urls_with_pagination_and_like_query(page, per_page, date_start, date_end, search_text, state, state_date, metric_type, state_type, session,
+                                                   cursor=None):
     async with session() as s:
         url_dal = QueryDAL(s)
-        urls = await url_dal.get_urls_with_pagination_and_like(
-            page, per_page, date_start, date_end, search_text, state, state_date, metric_type, state_type
+        urls, next_cursor = await url_dal.get_urls_with_pagination_and_like(
+            page, per_page, date_start, date_end, search_text, state, state_date, metric_type, state_type, cursor
         )
-        return urls
+        return urls, next_cursor
 
 
-async def _get_urls_with_pagination_sort_query(page, per_page, date_start, date_end, sort_desc, session):
+async def _get_urls_with_pagination_sort_query(page, per_page, date_start, date_end, sort_desc, session, cursor=None):
     async with session() as s:
         url_dal = QueryDAL(s)
-        urls = await url_dal.get_urls_with_pagination_sort(
-            page, per_page, date_start, date_end, sort_desc
+        urls, next_cursor = await url_dal.get_urls_with_pagination_sort(
+            page, per_page, date_start, date_end, sort_desc, cursor
         )
-        return urls
+        return urls, next_cursor
 
 
 async def _get_urls_with_pagination_and_like_sort_query(page, per_page, date_start, date_end, search_text, sort_desc,
-                                                  session):
+                                                  session, cursor=None):
     async with session() as s:
         url_dal = QueryDAL(s)
-        urls = await url_dal.get_urls_with_pagination_and_like_sort(
-            page, per_page, date_start, date_end, search_text, sort_desc
+        urls, next_cursor = await url_dal.get_urls_with_pagination_and_like_sort(
+            page, per_page, date_start, date_end, search_text, sort_desc, cursor
         )
-        return urls
+        return urls, next_cursor
+
+
+async def _stream_queries_export(date_start, date_end, session, **filters):
+    async with session() as s:
+        url_dal = QueryDAL(s)
+        async for row in url_dal.stream_export(date_start, date_end, **filters):
+            yield row
+
+async def _count_queries_export(date_start, date_end, session, **filters):
+    async with session() as s:
+        url_dal = QueryDAL(s)
+        return await url_dal.count_export(date_start, date_end, **filters)
 
 async def _get_metrics_daily_summary(date_start, date_end, session):
     async with session() as s:
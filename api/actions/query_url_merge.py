@@ -11,6 +11,12 @@ async def _get_approach_query(session):
         return queries
 
 
+async def _add_merge(values, date, session: Callable):
+    async with session() as s:
+        merge_dal = MergeDAL(s)
+        await merge_dal.add_merge(values, date)
+
+
 async def _get_merge_with_pagination(date, page, per_page, session: Callable):
     async with session() as s:
         url_dal = MergeDAL(s)
@@ -27,6 +33,13 @@ async def _get_merge_query(date_start, date_end, queries, session: Callable):
         return queries
 
 
+async def _stream_merge_export(date, search_text_url, search_text_query, sort_desc, session: Callable):
+    async with session() as s:
+        url_dal = MergeDAL(s)
+        async for row in url_dal.stream_export(date, search_text_url, search_text_query, sort_desc):
+            yield row
+
+
 async def _get_merge_with_pagination_sort(date, search_text, page, per_page, session: Callable):
     async with session() as s:
         url_dal = MergeDAL(s)
@@ -22,13 +22,15 @@ async def _get_urls_with_pagination(
         list_name, 
         session,
         general_session,
+        cursor=None,
         ):
     async with session() as s:
         url_dal = UrlDAL(s)
-        urls = await url_dal.get_urls_with_pagination(
+        urls, next_cursor = await url_dal.get_urls_with_pagination(
             page, per_page, date_start, date_end, state, state_date, metric_type, state_type, list_name, general_session,
+            cursor,
         )
-        return urls
+        return urls, next_cursor
 
 
 async def _get_urls_with_pagination_and_like(
@@ -44,13 +46,15 @@ async def _get_urls_with_pagination_and_like(
         list_name, 
         session,
         general_session,
+        cursor=None,
         ):
     async with session() as s:
         url_dal = UrlDAL(s)
-        urls = await url_dal.get_urls_with_pagination_and_like(
+        urls, next_cursor = await url_dal.get_urls_with_pagination_and_like(
             page, per_page, date_start, date_end, search_text, state, state_date, metric_type, state_type, list_name, general_session,
+            cursor,
         )
-        return urls
+        return urls, next_cursor
 
 
 async def _get_urls_with_pagination_sort(
@@ -61,13 +65,14 @@ async def _get_urls_with_pagination_sort(
         sort_desc,
         list_name, 
         session,
-        general_session):
+        general_session,
+        cursor=None):
     async with session() as s:
         url_dal = UrlDAL(s)
-        urls = await url_dal.get_urls_with_pagination_sort(
-            page, per_page, date_start, date_end, sort_desc, list_name, general_session,
+        urls, next_cursor = await url_dal.get_urls_with_pagination_sort(
+            page, per_page, date_start, date_end, sort_desc, list_name, general_session, cursor,
         )
-        return urls
+        return urls, next_cursor
 
 
 async def _get_urls_with_pagination_and_like_sort(
@@ -80,13 +85,14 @@ async def _get_urls_with_pagination_and_like_sort(
         list_name,
         session,
         general_session,
+        cursor=None,
         ):
     async with session() as s:
         url_dal = UrlDAL(s)
-        urls = await url_dal.get_urls_with_pagination_and_like_sort(
-            page, per_page, date_start, date_end, search_text, sort_desc, list_name, general_session
+        urls, next_cursor = await url_dal.get_urls_with_pagination_and_like_sort(
+            page, per_page, date_start, date_end, search_text, sort_desc, list_name, general_session, cursor,
         )
-        return urls
+        return urls, next_cursor
     
 async def _get_metrics_daily_summary(date_start, date_end, list_name, session, general_session):
     async with session() as s:
@@ -118,4 +124,15 @@ async def _get_not_void_count_daily_summary_like(date_start, date_end, search_te
         urls = await url_dal.get_not_void_count_daily_summary_like(
             date_start, date_end, search_text, list_name, general_session
         )
-        return urls
\ No newline at end of file
+        return urls
+
+async def _stream_urls_export(date_start, date_end, list_name, session, general_session, **filters):
+    async with session() as s:
+        url_dal = UrlDAL(s)
+        async for row in url_dal.stream_export(date_start, date_end, list_name, general_session, **filters):
+            yield row
+
+async def _count_urls_export(date_start, date_end, list_name, session, general_session, **filters):
+    async with session() as s:
+        url_dal = UrlDAL(s)
+        return await url_dal.count_export(date_start, date_end, list_name, general_session, **filters)
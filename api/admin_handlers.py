@@ -31,6 +31,7 @@ from api.history_api.router import router as history_router
 from api.merge_api.router import router as merge_router
 from api.live_search_api.router import router as live_search_router
 from db.session import get_db_general
+from services.response_cache import response_cache
 from utils import CommaNewLineSeparatedValues, import_users_from_excel
 from scheduler import scheduler, CronTrigger
 
@@ -178,6 +179,7 @@ async def add_list(
         session.add(new_list)
         session.add_all(new_uris)
         await session.commit()
+        await response_cache.invalidate_lists()
     except IntegrityError:
         await session.rollback()
         return JSONResponse(
@@ -252,6 +254,7 @@ async def delete_list(
         # Удаляем объект списка
         await session.delete(list_to_delete)
         await session.commit()  # Сохраняем изменения
+        await response_cache.invalidate_lists()
 
         return {
             "status": 200,
@@ -310,6 +313,7 @@ async def delete_list_record(
     await session.delete(uri_model)
 
     await session.commit()
+    await response_cache.invalidate_lists()
 
     return {
         "status": 200,
@@ -335,6 +339,7 @@ async def change_list_record(
     uri_model.uri = new_uri
 
     await session.commit()
+    await response_cache.invalidate_lists()
     
     return {
         "status": 200,
@@ -359,6 +364,7 @@ async def add_uri(
     session.add(record)
 
     await session.commit()
+    await response_cache.invalidate_lists()
 
     return {
         "status": 200,
@@ -1,22 +1,53 @@
-from fastapi import Depends, HTTPException
+import jwt
+from fastapi import Depends, HTTPException, Request
 from fastapi_users import FastAPIUsers
 from fastapi_users.authentication import AuthenticationBackend, JWTStrategy, CookieTransport
+from fastapi_users.jwt import decode_jwt, generate_jwt
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
 from api.auth.manager import get_user_manager
-from api.auth.models import User
+from api.auth.models import GroupUserAssociation, User
+from api.config.cache import SidebarCache, sidebar_cache
 from api.config.models import Role
-from config import SECRET
-from db.session import get_db_general
+from config import AUTH_STATE_CACHE_TTL, SECRET
+from db.session import async_session_general, get_db_general
 
 cookie_transport = CookieTransport(cookie_name="bonds", cookie_secure=False, cookie_samesite="lax",
                                    cookie_max_age=31536000)
 
 
-def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=31536000)
+class ClaimsJWTStrategy(JWTStrategy):
+    """JWT с ролью и группами пользователя: RoleChecker проверяет права по токену,
+    не читая пользователя из БД на каждый запрос"""
+
+    async def write_token(self, user: User) -> str:
+        async with async_session_general() as session:
+            role_name = (await session.execute(select(Role.name).where(Role.id == user.role))).scalar()
+            group_ids = (await session.execute(
+                select(GroupUserAssociation.group_id).where(GroupUserAssociation.user_id == user.id)
+            )).scalars().all()
+        data = {
+            "sub": str(user.id),
+            "aud": self.token_audience,
+            "role_id": user.role,
+            "role": role_name,
+            "groups": list(group_ids),
+        }
+        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+
+    def read_claims(self, token: str | None) -> dict | None:
+        if token is None:
+            return None
+        try:
+            return decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+        except jwt.PyJWTError:
+            return None
+
+
+def get_jwt_strategy() -> ClaimsJWTStrategy:
+    return ClaimsJWTStrategy(secret=SECRET, lifetime_seconds=31536000)
 
 
 auth_backend = AuthenticationBackend(
@@ -34,6 +65,25 @@ current_superuser = fastapi_users.current_user(active=True, superuser=True)
 current_user = fastapi_users.current_user(active=True, optional=True)
 
 
+async def get_role_name(session: AsyncSession, role_id: int) -> str:
+    async def load():
+        return ((await session.execute(select(Role.name).where(Role.id == role_id))).fetchone())[0]
+
+    return await sidebar_cache.get_or_load(("role", role_id), load)
+
+
+# (is_active, role) пользователя: короткий TTL ограничивает, сколько живет токен заблокированного пользователя
+auth_state_cache = SidebarCache(ttl=AUTH_STATE_CACHE_TTL)
+
+
+async def get_auth_state(session: AsyncSession, user_id: int) -> tuple[bool, int] | None:
+    async def load():
+        row = (await session.execute(select(User.is_active, User.role).where(User.id == user_id))).one_or_none()
+        return tuple(row) if row else None
+
+    return await auth_state_cache.get_or_load(("auth_state", user_id), load)
+
+
 class RoleChecker:
 
     def __init__(self, required_permissions: set[str]) -> None:
@@ -41,15 +91,27 @@ class RoleChecker:
 
     async def __call__(
             self,
-            user: User = Depends(current_user),
+            request: Request,
             session: AsyncSession = Depends(get_db_general),
     ) -> bool:
-        if not user:
+        claims = get_jwt_strategy().read_claims(request.cookies.get(cookie_transport.cookie_name))
+        try:
+            user_id = int(claims["sub"]) if claims else None
+        except (KeyError, TypeError, ValueError):
+            # подписанный токен без sub или с нечисловым sub - как и неразборчивый токен, 401
+            user_id = None
+        state = await get_auth_state(session, user_id) if user_id is not None else None
+        if not state or not state[0]:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail='not enough permissions'
             )
-        user_role = ((await session.execute(select(Role.name).where(Role.id == user.role))).fetchone())[0]
+        role_id = state[1]
+        if claims.get("role_id") == role_id and "role" in claims:
+            user_role = claims["role"]
+        else:
+            # роль сменилась после выдачи токена или токен выдан до появления claims
+            user_role = await get_role_name(session, role_id)
         if user_role not in self.required_permissions:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
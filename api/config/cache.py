@@ -0,0 +1,49 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from config import SIDEBAR_CACHE_TTL
+
+
+class SidebarCache:
+    """Редко меняющиеся данные для шапки и меню страниц (конфиги группы, группы пользователя,
+    справочник групп, названия ролей) в памяти процесса.
+
+    Ключ - кортеж (вид, параметр...), например ("group_names", user_id). Записи живут ttl секунд,
+    мутации в /config сбрасывают их сразу через invalidate.
+    """
+
+    def __init__(self, ttl: int = SIDEBAR_CACHE_TTL):
+        self.ttl = ttl
+        self._data: dict[tuple, tuple[float, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_load(self, key: tuple, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        value = await loader()
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, kind: str, *params):
+        """Сбрасывает записи вида kind; с параметрами - только запись с этим ключом"""
+        if params:
+            self._data.pop((kind, *params), None)
+            return
+        for key in [key for key in self._data if key[0] == kind]:
+            del self._data[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0,
+        }
+
+
+sidebar_cache = SidebarCache()
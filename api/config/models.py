@@ -1,7 +1,9 @@
 import enum
 import uuid
+from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, String, Integer, ForeignKey, Uuid, Enum
+from sqlalchemy import ARRAY, Boolean, Column, DateTime, Index, String, Integer, ForeignKey, Uuid, Enum, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import DeclarativeBase, relationship
 
 
@@ -139,6 +141,35 @@ class ListLrSearchSystem(Base):
     google_results = relationship("QueryLiveSearchGoogle", back_populates="lr_list", cascade="all, delete-orphan")
 
 
+class LiveSearchRun(Base):
+    """Съем позиций по одному региону/поисковику за день; done_query_ids - чекпоинт для дозапуска"""
+    __tablename__ = "live_search_run"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    lr_list_id = Column(Integer, ForeignKey("list_lr_search_system.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(Integer, ForeignKey("user.id", ondelete="SET NULL"), nullable=True)
+    date = Column(DateTime, nullable=False)
+    status = Column(String, nullable=False)
+    queries_total = Column(Integer, nullable=False)
+    done_query_ids = Column(ARRAY(Integer), nullable=False, default=list)
+    started_at = Column(DateTime, nullable=False, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class SerpCache(Base):
+    """Выдача xmlstock за день, разобранная до топ-N: [[позиция, url, domain], ...].
+    Общая для всех списков live search и merge; hits - сколько раз запись отдана из кэша"""
+    __tablename__ = "serp_cache"
+
+    search_system = Column(String, primary_key=True)
+    lr = Column(String, primary_key=True)
+    query = Column(String, primary_key=True)
+    date = Column(DateTime, primary_key=True, index=True)
+    results = Column(JSONB, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
 class LiveSearchListQuery(Base):
     __tablename__ = "live_search_list_query"
 
@@ -195,4 +226,59 @@ class YandexLr(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     Geo = Column(String, nullable=False)
     Geoid = Column(Integer, nullable=False)
-    
+
+
+class LoadJobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class LoadJob(Base):
+    __tablename__ = "load_job"
+    __table_args__ = (
+        # не больше одной активной выгрузки одного типа на конфиг
+        Index("uq_load_job_active", "config_id", "kind", unique=True,
+              postgresql_where=text("status IN ('queued', 'running')")),
+    )
+
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    config_id = Column(Integer, ForeignKey("config.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)
+    status = Column(Enum(LoadJobStatus), nullable=False, default=LoadJobStatus.queued)
+    author = Column(Integer, ForeignKey("user.id", ondelete="SET NULL"), nullable=True)
+    pages_done = Column(Integer, nullable=False, default=0)
+    pages_total = Column(Integer, nullable=True)
+    rows_written = Column(Integer, nullable=False, default=0)
+    message = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ExportJob(Base):
+    """Фоновая выгрузка отчета url/query в CSV/XLSX. Файл лежит в EXPORT_DIR до expires_at"""
+    __tablename__ = "export_job"
+    __table_args__ = (
+        # поиск такой же выгрузки конфига за последние EXPORT_DEDUPE_WINDOW секунд
+        Index("ix_export_job_dedupe", "config_id", "params_hash", "created_at"),
+    )
+
+    id = Column(Uuid(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    config_id = Column(Integer, ForeignKey("config.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False)
+    format = Column(String, nullable=False)
+    params = Column(JSONB, nullable=False)
+    params_hash = Column(String, nullable=False)
+    status = Column(Enum(LoadJobStatus), nullable=False, default=LoadJobStatus.queued)
+    author = Column(Integer, ForeignKey("user.id", ondelete="SET NULL"), nullable=True)
+    rows_done = Column(Integer, nullable=False, default=0)
+    rows_total = Column(Integer, nullable=True)
+    file_path = Column(String, nullable=True)
+    file_size = Column(Integer, nullable=True)
+    message = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True, index=True)
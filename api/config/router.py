@@ -2,22 +2,21 @@ import logging
 import re
 from typing import Dict
 
-from alembic import command
 from fastapi import APIRouter, Depends, Request, HTTPException
 from sqlalchemy import and_, delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from api.auth.auth_config import current_user
+from api.auth.auth_config import auth_state_cache, current_user, get_role_name
 from api.auth.models import GroupUserAssociation, User
 from api.config.models import Config, GroupConfigAssociation, List, ListURI, Role, Group, UserQueryCount
+from api.config.cache import sidebar_cache
 from api.config.utils import get_config_info
 from config import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+from db.migrate import upgrade_tenant_database
 from db.session import get_db_general
 
 from fastapi_users.password import PasswordHelper
 
-from alembic.config import Config as AlembicConfig
-
 import asyncpg
 
 router = APIRouter()
@@ -48,6 +47,7 @@ async def add_config(request: Request,
 
     session.add(config)
     await session.commit()
+    sidebar_cache.invalidate("config_names")
 
     conn = await asyncpg.connect(user=DB_USER, password=DB_PASSWORD, host=DB_HOST, port=DB_PORT, database="postgres")
     try:
@@ -61,10 +61,7 @@ async def add_config(request: Request,
         await conn.close()
 
     # Применение миграций Alembic
-    alembic_cfg = AlembicConfig("alembic.ini")
-    alembic_cfg.set_main_option("sqlalchemy.url",
-                                f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{database_name}")
-    command.upgrade(alembic_cfg, "head")
+    upgrade_tenant_database(database_name)
 
     return {"status": 200}
 
@@ -165,7 +162,7 @@ async def get_usernames(
         session: AsyncSession = Depends(get_db_general),
 ) -> dict:
     # Получаем роль текущего пользователя
-    user_role = ((await session.execute(select(Role.name).where(Role.id == user.role))).fetchone())[0]
+    user_role = await get_role_name(session, user.role)
 
     # Получаем список ролей, которые текущий пользователь может видеть
     allowed_roles = ROLES_PERMISSIONS.get(user_role, set())
@@ -197,7 +194,7 @@ async def add_user_to_group(
 ):
     group_name, username = formData.values()
 
-    user_role = ((await session.execute(select(Role.name).where(Role.id == user.role))).fetchone())[0]
+    user_role = await get_role_name(session, user.role)
     group = ((await session.execute(select(Group).where(Group.name == group_name))).fetchone())
     new_user, role = (await session.execute(
         select(User, Role.name)
@@ -217,6 +214,7 @@ async def add_user_to_group(
     group = group[0]
     group.users.append(new_user)
     await session.commit()
+    sidebar_cache.invalidate("group_names", new_user.id)
 
     return {
         "status": "success",
@@ -275,6 +273,7 @@ async def delete_user_from_group(
         
         group.users.remove(user)
         await session.commit()
+        sidebar_cache.invalidate("group_names", user.id)
         return {
             "status": "success",
             "message": f"{username} removed from {group_name}"
@@ -313,6 +312,7 @@ async def edit_user(
     #if is_active:
     user_query_coount.query_count = query_count
     await session.commit()
+    auth_state_cache.invalidate("auth_state", id)
 
     return {
         "status": 200,
@@ -332,6 +332,8 @@ async def delete_user(
     await session.delete(user)
 
     await session.commit()
+    sidebar_cache.invalidate("group_names", id)
+    auth_state_cache.invalidate("auth_state", id)
 
     return {
         "status": 200,
@@ -379,6 +381,7 @@ async def delete_group_for_user(
     await session.delete(group_obj)
 
     await session.commit()
+    sidebar_cache.invalidate("group_names", user_id)
 
     return {
         "status": 200,
@@ -397,6 +400,7 @@ async def add_group_for_user(
     session.add(GroupUserAssociation(user_id = user_id, group_id=group_id))
 
     await session.commit()
+    sidebar_cache.invalidate("group_names", user_id)
 
     return {
         "status": 200,
@@ -442,6 +446,8 @@ async def add_group(
     # Добавление новой группы в базу данных
     session.add(new_group)
     await session.commit()
+    sidebar_cache.invalidate("groups_dict")
+    sidebar_cache.invalidate("config_names", group_name)
 
     return {"status": "success", "group": new_group.id}
 
@@ -459,6 +465,9 @@ async def delete_group(
     await session.delete(group_obj)
 
     await session.commit()
+    sidebar_cache.invalidate("groups_dict")
+    sidebar_cache.invalidate("group_names")
+    sidebar_cache.invalidate("config_names")
 
     return {
         "status": 200,
@@ -507,6 +516,7 @@ async def delete_config_from_group(
     await session.delete(group_config_obj)
 
     await session.commit()
+    sidebar_cache.invalidate("config_names")
 
     return {
         "status": 200,
@@ -525,6 +535,7 @@ async def add_group_for_user(
     session.add(GroupConfigAssociation(group_id = group_id, config_id=config_id))
 
     await session.commit()
+    sidebar_cache.invalidate("config_names")
 
     return {
         "status": 200,
@@ -560,6 +571,7 @@ async def edit_config(
     print(config.name)
 
     await session.commit()
+    sidebar_cache.invalidate("config_names")
 
     return {
         "status": 200,
@@ -582,6 +594,7 @@ async def delete_config(
 
     await session.delete(config_obj)
     await session.commit()
+    sidebar_cache.invalidate("config_names")
 
     return {
         "status": 200,
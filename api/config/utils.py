@@ -1,14 +1,41 @@
+import asyncio
+
 from sqlalchemy import case, exists, or_, select, and_, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from sqlalchemy.orm import aliased
 
 from api.auth.models import User, GroupUserAssociation
+from api.config.cache import sidebar_cache
 from api.config.models import Config, Group, GroupConfigAssociation, List, LiveSearchList, Role, UserQueryCount, \
      ListLrSearchSystem, YandexLr
+from config import LIVE_SEARCH_PARALLEL_UNITS
 from db.session import async_session_general
 from services.load_live_search import main as live_search_main
 
+# регион x поисковик - единица съема; общая на процесс, чтобы расписания разных списков не перегружали пул БД
+_units_semaphore: asyncio.Semaphore | None = None
+
+
+def _get_units_semaphore() -> asyncio.Semaphore:
+    global _units_semaphore
+    if _units_semaphore is None:
+        _units_semaphore = asyncio.Semaphore(LIVE_SEARCH_PARALLEL_UNITS)
+    return _units_semaphore
+
+
+async def _run_live_search_unit(user: User, list_id: int, main_domain: str, list_lr_id: int, lr: int, search_system: str):
+    # у каждой единицы своя сессия: чекпоинты идут независимыми транзакциями, а лимит единица резервирует
+    # одним атомарным UPDATE (reserve_queries), так что параллельные единицы не уводят его в минус
+    async with _get_units_semaphore():
+        async with async_session_general() as session:
+            try:
+                return await live_search_main(list_lr_id, list_id, main_domain, lr, search_system, user, session)
+            except Exception as e:
+                print(f"Съем live search не выполнен. Список: {list_id} lr: {lr} Search System: {search_system} Ошибка: {e}")
+                return None
+
+
 async def update_list(user: User, list_id: int):
     print("UPDATING")
     async with async_session_general() as session:
@@ -16,16 +43,19 @@ async def update_list(user: User, list_id: int):
             await session.execute(select(LiveSearchList).where(LiveSearchList.id == list_id))
         ).scalars().first()
         main_domain = live_search_list.main_domain
-        lists_lr: list[ListLrSearchSystem] = (await session.execute(
-            select(ListLrSearchSystem)
+        units = (await session.execute(
+            select(ListLrSearchSystem.id, ListLrSearchSystem.lr, ListLrSearchSystem.search_system)
             .where(ListLrSearchSystem.list_id == live_search_list.id)
-        )).scalars().all()
+        )).all()
 
-        for list_lr in lists_lr:
-            lr, search_system = list_lr.lr, list_lr.search_system
-            status = await live_search_main(list_lr.id, list_id, main_domain, lr, search_system, user, session)
-            if status == 0:
-                return
+    # выдача грузится через общий SerpFetcher: лимиты xmlstock на поисковик общие для всех единиц,
+    # одинаковые запросы по одному региону из параллельных списков загружаются один раз
+    statuses = await asyncio.gather(*(
+        _run_live_search_unit(user, list_id, main_domain, list_lr_id, lr, search_system)
+        for list_lr_id, lr, search_system in units
+    ))
+    if 0 in statuses:
+        print(f"Недостаточно лимита запросов для съема списка {list_id}")
 
 
 async def load_live_search(user, list_lr_id: int, session: AsyncSession):
@@ -39,15 +69,14 @@ async def load_live_search(user, list_lr_id: int, session: AsyncSession):
 
 
 async def get_config_names(session: AsyncSession, user: User, group_name):
-    query = select(Group.id).where(Group.name == group_name)
-    group_id = (await session.execute(query)).fetchone()
-    if group_id:
-        group_id = group_id[0]
-    query = (select(Config.name)
-             .join(GroupConfigAssociation, GroupConfigAssociation.config_id == Config.id)
-             .where(GroupConfigAssociation.group_id == group_id))
-    res = (await session.execute(query)).all()
-    return res
+    async def load():
+        query = (select(Config.name)
+                 .join(GroupConfigAssociation, GroupConfigAssociation.config_id == Config.id)
+                 .join(Group, Group.id == GroupConfigAssociation.group_id)
+                 .where(Group.name == group_name))
+        return (await session.execute(query)).all()
+
+    return list(await sidebar_cache.get_or_load(("config_names", group_name), load))
 
 
 async def get_config_info(
@@ -61,21 +90,25 @@ async def get_config_info(
 
 
 async def get_group_names(session: AsyncSession, user: User):
-    query = (
-        select(Group.name)
-        .join(GroupUserAssociation, GroupUserAssociation.group_id == Group.id)
-        .where(GroupUserAssociation.user_id == user.id)
-    )
-    result = (await session.execute(query)).all()
-    return [row[0] for row in result]
+    async def load():
+        query = (
+            select(Group.name)
+            .join(GroupUserAssociation, GroupUserAssociation.group_id == Group.id)
+            .where(GroupUserAssociation.user_id == user.id)
+        )
+        result = (await session.execute(query)).all()
+        return [row[0] for row in result]
+
+    return list(await sidebar_cache.get_or_load(("group_names", user.id), load))
 
 
 async def get_groups_names_dict(
     session: AsyncSession,
 ):
-    group_dict = (await session.execute(select(Group.id, Group.name))).fetchall()
+    async def load():
+        return dict((await session.execute(select(Group.id, Group.name))).fetchall())
 
-    return dict(group_dict)
+    return dict(await sidebar_cache.get_or_load(("groups_dict",), load))
 
 
 async def get_lists_names(
@@ -7,8 +7,7 @@ import logging
 import sys
 
 from fastapi import APIRouter, Depends, Request
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import StreamingResponse
 from fastapi.templating import Jinja2Templates
 from openpyxl import Workbook
 
@@ -23,6 +22,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.config.utils import get_config_names, get_group_names
 from db.session import connect_db, get_db_general
+from services.response_cache import cached_response
+from services.responses import ORJSONResponse
+from services.table_payload import compact_response, history_page, is_compact
 
 from const import date_format, date_format_2, date_format_out
 
@@ -67,6 +69,7 @@ async def get_history(
 
 
 @router.post("/")
+@cached_response("history")
 async def get_history(
         request: Request, data_request: dict,
         user: User = Depends(current_user)
@@ -85,10 +88,18 @@ async def get_history(
         grouped_data = [(key, sorted(list(group), key=lambda x: x[2])) for key, group in
                         groupby(indicators, key=lambda x: x[0])]
     except TypeError as e:
-        return JSONResponse({"data": []})
+        return ORJSONResponse({"data": []})
 
     if len(grouped_data) == 0:
-        return JSONResponse({"data": []})
+        return ORJSONResponse({"data": []})
+
+    TOP = 3, 5, 10, 20, 30
+    query_tops = [(top, sorted(await _get_top_query(start_date, end_date, top, async_session), key=lambda x: x[-1]))
+                  for top in TOP]
+    url_tops = [(top, sorted(await _get_top_url(start_date, end_date, top, async_session), key=lambda x: x[-1]))
+                for top in TOP]
+    if is_compact(data_request):
+        return compact_response(history_page(grouped_data, query_tops, url_tops))
 
     data = []
     for count, el in enumerate(grouped_data):
@@ -131,15 +142,12 @@ async def get_history(
         data.append(res)
     data[-1], data[-2] = data[-2], data[-1]
 
-    TOP = 3, 5, 10, 20, 30
     query_front = []
-    for top in TOP:
+    for top, query_top in query_tops:
         grouped_data_sum = {
             "query":
                 f"<div style='width:355px; height: 55px; overflow: auto; white-space: nowrap;'><span>TOP {top}</span></div>"
         }
-        query_top = await _get_top_query(start_date, end_date, top, async_session)
-        query_top.sort(key=lambda x: x[-1])
         total_position, total_clicks, total_impression, total_count, count_for_avg = 0, 0, 0, 0, 0
         for position, clicks, impression, count, date in query_top:
             grouped_data_sum[date.strftime(
@@ -167,13 +175,11 @@ async def get_history(
         query_front.append(grouped_data_sum)
 
     url_front = []
-    for top in TOP:
+    for top, query_top in url_tops:
         grouped_data_sum = {
             "query":
                 f"<div style='width:355px; height: 55px; overflow: auto; white-space: nowrap;'><span>TOP {top}</span></div>"
         }
-        query_top = await _get_top_url(start_date, end_date, top, async_session)
-        query_top.sort(key=lambda x: x[-1])
         total_position, total_clicks, total_impression, total_count, count_for_avg = 0, 0, 0, 0, 0
         for position, clicks, impression, count, date in query_top:
             grouped_data_sum[date.strftime(
@@ -200,12 +206,9 @@ async def get_history(
 
         url_front.append(grouped_data_sum)
 
-    json_data = jsonable_encoder(data)
-    json_query_top = jsonable_encoder(query_front)
-    json_url_top = jsonable_encoder(url_front)
-    return JSONResponse({"data": json_data,
-                         "query_top": json_query_top,
-                         "url_top": json_url_top}
+    return ORJSONResponse({"data": data,
+                         "query_top": query_front,
+                         "url_top": url_front}
                         )
 
 
@@ -1,8 +1,7 @@
 from datetime import datetime
-from itertools import groupby
+
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import and_, select
 from api.auth.models import User
@@ -10,6 +9,9 @@ from api.config.models import ListLrSearchSystem, UserQueryCount, YandexLr
 from api.config.utils import get_config_names, get_group_names
 from api.live_search_api.db import get_urls_with_pagination, get_urls_with_pagination_and_like, get_urls_with_pagination_sort, get_urls_with_pagination_sort_and_like
 from db.session import get_db_general
+from services.metric_matrix import MetricMatrix
+from services.responses import ORJSONResponse
+from services.table_payload import compact_response, is_compact, live_search_page
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -144,60 +146,50 @@ async def get_live_search(
                 search_system,
                 session,
                 )
-    try:
-        if urls:
-            urls.sort(key=lambda x: x[-1])
-        
-        grouped_data = [(key, sorted(list(group), key=lambda x: x[0])) for key, group in
-                        groupby(urls, key=lambda x: x[-1])]
-
-        if data_request["button_state"]:
-            if data_request["metric_type"] == "P":
-                grouped_data.sort(
-                    key=lambda x: next(
-                        (
-                            sub_item[2] if sub_item[2] != 0 else 
-                            (-float('inf') if data_request["button_state"] == "decrease" else float('inf'))
-                            for sub_item in x[1]
-                            if sub_item[0] == state_date
-                        ),
-                        -float('inf') if data_request["button_state"] == "decrease" else float('inf')
-                    ),
-                    reverse=data_request["button_state"] == "decrease"
-                )
-    except TypeError as e:
-        return JSONResponse({"data": []})
-
-    if len(grouped_data) == 0:
-        return JSONResponse({"data": []})
-    
+    if not urls:
+        return ORJSONResponse({"data": []})
+    # строки: (date, url, position, query); запросы - по алфавиту
+    matrix = MetricMatrix.from_rows(urls, metric_columns=(2,), metrics=("position",), label_column=1,
+                                    keys=sorted({row[-1] for row in urls}))
+
+    if data_request["button_state"]:
+        if data_request["metric_type"] == "P":
+            matrix = matrix.order_by_day("position", state_date,
+                                         descending=data_request["button_state"] == "decrease")
+
+    if len(matrix.keys) == 0:
+        return ORJSONResponse({"data": []})
+    if is_compact(data_request):
+        return compact_response(live_search_page(matrix, all_queries))
+
+    trend = matrix.deltas("position")
     data = []
     current_query = set()
-    for el in grouped_data:
+    for row, key in enumerate(matrix.keys):
         res = {"query":
-                   f"<div style='width:355px; height: 55px; overflow: auto; white-space: nowrap;'><span>{el[0]}</span></div>"}
-        current_query.add(el[0])
-        url, pos = "", float("inf")
-        for k, stat in enumerate(el[1]):
-            if stat[2] < pos:
+                   f"<div style='width:355px; height: 55px; overflow: auto; white-space: nowrap;'><span>{key}</span></div>"}
+        current_query.add(key)
+        for day in matrix.present_days(row):
+            up = trend[row, day]
+            if np.isnan(up) or up < 0:
                 color = "#9DE8BD"
                 color_text = "green"
-            elif stat[2] > pos:
+            elif up > 0:
                 color = "#FDC4BD"
                 color_text = "red"
             else:
                 color = "#B4D7ED"
                 color_text = "blue"
-            pos = stat[2]
-            if stat[2] > 0:
-                res[stat[0].strftime(
+            position = int(matrix.cell(row, day)[0])
+            if position > 0:
+                res[matrix.dates[day].strftime(
                     date_format_2)] = f"""<div style='height: 55px; width: 100px; margin: 0px; padding: 0px; background-color: {color}; text-align: center; display: flex; align-items: center; justify-content: center;'>
-                                        <a href='{stat[1]}' style='font-size: 18px; text-decoration: none; color: inherit;'>
-                                            {stat[2]}
+                                        <a href='{matrix.labels[row, day]}' style='font-size: 18px; text-decoration: none; color: inherit;'>
+                                            {position}
                                         </a>
                                     </div>"""
             else:   
-                res[stat[0].strftime(
+                res[matrix.dates[day].strftime(
                 date_format_2)] = f"""<div style='height: 55px; width: 100px; margin: 0px; padding: 0px; background-color: #FFFF99; text-align: center; display: flex; align-items: center; justify-content: center;'>
                                         <span style='font-size: 18px'>-</span></div>"""
         data.append(res)
@@ -209,9 +201,7 @@ async def get_live_search(
                    f"<div style='width:355px; height: 55px; overflow: auto; white-space: nowrap;'><span>{query}</span></div>"}
                    )
 
-    json_data = jsonable_encoder(data)
-
-    return JSONResponse({"data": json_data})
+    return ORJSONResponse({"data": data})
 
 
 @router.get("/update_query_count")
@@ -1,18 +1,22 @@
+import asyncio
+import json
+import os
+import uuid
+
 from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy import select
 
 from api.auth.auth_config import RoleChecker
 from api.auth.models import User
-from api.config.models import ListLrSearchSystem, LiveSearchList, YandexLr
+from api.config.cache import sidebar_cache
+from api.config.models import ExportJob, ListLrSearchSystem, LiveSearchList, LoadJob, LoadJobStatus, YandexLr
 from api.config.utils import load_live_search
-from db.session import get_db_general
-from services.load_all_queries import get_all_data as get_all_data_queries
-
-from services.load_all_urls import get_all_data as get_all_data_urls
-
-from services.load_all_history import main as all_history_main
-
-from services.load_query_url_merge import main as merge_main
+from db.session import get_db_general, tenant_engines
+from services.export_jobs import EXPORT_FORMATS, EXPORT_KINDS, export_job_to_dict, get_export_job, start_export_job
+from services.load_jobs import get_load_job, load_job_to_dict, start_load_job
+from services.response_cache import response_cache
+from services.serp_cache import get_serp_cache_stats
 
 from services.load_live_search import main as live_search_main
 
@@ -22,54 +26,177 @@ from api.auth.auth_config import current_user
 
 router = APIRouter()
 
+
+async def _start_load(kind: str, request: Request, user: User) -> dict:
+    if request.session.get("config", {}).get("config_id", -1) == -1:
+        raise HTTPException(status_code=400, detail="Конфигурация не выбрана")
+    job, created = await start_load_job(kind, request.session, user.id)
+    return {"status": 200, "created": created, "job": load_job_to_dict(job)}
+
+
 @router.get('/load-queries-script')
 async def load_queries_script(
         request: Request,
+        user: User = Depends(current_user),
         required: bool = Depends(RoleChecker(required_permissions={"Administrator", "Superuser"}))
 ):
-    request_session = request.session
-    res = await get_all_data_queries(request_session)
-    if res["status"] == 400:
-        raise HTTPException(status_code=400, detail="Нет новых обновлений")
-    return res
+    return await _start_load("queries", request, user)
 
 
 @router.get('/load-urls-script')
 async def load_urls_script(
         request: Request,
+        user: User = Depends(current_user),
         required: bool = Depends(RoleChecker(required_permissions={"Administrator", "Superuser"}))
 ):
-    request_session = request.session
-    res = await get_all_data_urls(request_session)
-    if res["status"] == 400:
-        raise HTTPException(status_code=400, detail="Нет новых обновлений")
-    return res
+    return await _start_load("urls", request, user)
 
 
 @router.get('/load-history-script')
 async def load_history_script(
         request: Request,
+        user: User = Depends(current_user),
         required: bool = Depends(RoleChecker(required_permissions={"Administrator", "Superuser"}))
 ) -> dict:
-    try:
-        request_session = request.session
-        await all_history_main(request_session)
-    except Exception as e:
-        print(e)
-    return {"status": 200}
+    return await _start_load("history", request, user)
 
 
 @router.get('/load-merge-script')
 async def load_merge_script(
         request: Request,
+        user: User = Depends(current_user),
         required: bool = Depends(RoleChecker(required_permissions={"Administrator", "Superuser"}))
 ) -> dict:
-    try:
-        request_session = request.session
-        await merge_main(request_session)
-    except Exception as e:
-        print(e)
-    return {"status": 200}
+    return await _start_load("merge", request, user)
+
+
+async def _get_config_load_job(job_id: uuid.UUID, request: Request) -> LoadJob:
+    job = await get_load_job(job_id)
+    if job is None or job.config_id != request.session.get("config", {}).get("config_id"):
+        raise HTTPException(status_code=404, detail="Выгрузка не найдена")
+    return job
+
+
+@router.get('/load-jobs/{job_id}')
+async def load_job_status(
+        job_id: uuid.UUID,
+        request: Request,
+        user: User = Depends(current_user),
+) -> dict:
+    return load_job_to_dict(await _get_config_load_job(job_id, request))
+
+
+def _job_events(request: Request, job, get_job, to_dict) -> StreamingResponse:
+    """SSE с состоянием фоновой задачи, пока она не завершится"""
+    async def events():
+        nonlocal job
+        last = None
+        while True:
+            data = to_dict(job)
+            payload = json.dumps(data, ensure_ascii=False)
+            if payload != last:
+                yield f"data: {payload}\n\n"
+                last = payload
+            if data["status"] in (LoadJobStatus.done.value, LoadJobStatus.failed.value):
+                break
+            if await request.is_disconnected():
+                break
+            await asyncio.sleep(1)
+            job = await get_job(job.id)
+            if job is None:
+                # запись задачи удалили (очистка старых задач) - последнее событие и конец потока
+                gone = {**data, "status": LoadJobStatus.failed.value, "message": "Задача удалена"}
+                yield f"data: {json.dumps(gone, ensure_ascii=False)}\n\n"
+                break
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get('/load-jobs/{job_id}/events')
+async def load_job_events(
+        job_id: uuid.UUID,
+        request: Request,
+        user: User = Depends(current_user),
+):
+    job = await _get_config_load_job(job_id, request)
+    return _job_events(request, job, get_load_job, load_job_to_dict)
+
+
+@router.post('/export-jobs/{kind}/{fmt}')
+async def start_export(
+        kind: str,
+        fmt: str,
+        request: Request,
+        data_request: dict,
+        user: User = Depends(current_user),
+) -> dict:
+    if kind not in EXPORT_KINDS or fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=404, detail="Неизвестный отчет")
+    if request.session.get("config", {}).get("config_id", -1) == -1:
+        raise HTTPException(status_code=400, detail="Конфигурация не выбрана")
+    job, created = await start_export_job(kind, fmt, data_request, request.session, user.id)
+    return {"status": 200, "created": created, "job": export_job_to_dict(job)}
+
+
+async def _get_config_export_job(job_id: uuid.UUID, request: Request) -> ExportJob:
+    job = await get_export_job(job_id)
+    if job is None or job.config_id != request.session.get("config", {}).get("config_id"):
+        raise HTTPException(status_code=404, detail="Отчет не найден")
+    return job
+
+
+@router.get('/export-jobs/{job_id}')
+async def export_job_status(
+        job_id: uuid.UUID,
+        request: Request,
+        user: User = Depends(current_user),
+) -> dict:
+    return export_job_to_dict(await _get_config_export_job(job_id, request))
+
+
+@router.get('/export-jobs/{job_id}/events')
+async def export_job_events(
+        job_id: uuid.UUID,
+        request: Request,
+        user: User = Depends(current_user),
+):
+    job = await _get_config_export_job(job_id, request)
+    return _job_events(request, job, get_export_job, export_job_to_dict)
+
+
+@router.get('/export-jobs/{job_id}/file')
+async def export_job_file(
+        job_id: uuid.UUID,
+        request: Request,
+        user: User = Depends(current_user),
+):
+    job = await _get_config_export_job(job_id, request)
+    if job.status != LoadJobStatus.done or not job.file_path or not os.path.exists(job.file_path):
+        raise HTTPException(status_code=404, detail="Файл отчета не готов или уже удален")
+    return FileResponse(job.file_path, media_type=EXPORT_FORMATS[job.format],
+                        headers={"Content-Disposition": f"attachment;filename='{job.kind}.{job.format}'"})
+
+
+@router.get('/db-pool-stats')
+async def db_pool_stats(
+        required: bool = Depends(RoleChecker(required_permissions={"Superuser"}))
+) -> dict:
+    return tenant_engines.stats()
+
+
+@router.get('/response-cache-stats')
+async def response_cache_stats(
+        required: bool = Depends(RoleChecker(required_permissions={"Superuser"}))
+) -> dict:
+    return {**response_cache.stats(), "sidebar": sidebar_cache.stats()}
+
+
+@router.get('/serp-cache-stats')
+async def serp_cache_stats(
+        required: bool = Depends(RoleChecker(required_permissions={"Administrator", "Superuser"}))
+) -> list[dict]:
+    return await get_serp_cache_stats()
 
 
 @router.post('/load-live-search')
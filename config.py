@@ -15,12 +15,54 @@ REDIS_HOST = os.environ.get("REDIS_HOST")
 REDIS_PORT = os.environ.get("REDIS_PORT")
 REDIS_PASSWORD = os.environ.get("REDIS_PASSWORD")
 REDIS_DB = os.environ.get("REDIS_DB")
+# кэш ответов табличных эндпоинтов: в Redis, если задан REDIS_HOST, иначе в памяти процесса
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 86400))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+# группы, конфиги и роли для меню страниц, секунды
+SIDEBAR_CACHE_TTL = int(os.environ.get("SIDEBAR_CACHE_TTL", 300))
+# как часто RoleChecker сверяет роль из токена с БД (блокировка, смена роли), секунды
+AUTH_STATE_CACHE_TTL = int(os.environ.get("AUTH_STATE_CACHE_TTL", 30))
 
 
 MONTHLY_REQUEST_LIMIT = os.environ.get("MONTHLY__REQUEST_LIMIT")
 
 DATABASE_GENERAL_NAME = os.environ.get("DATABASE_GENERAL_NAME")
 
+TENANT_POOL_SIZE = int(os.environ.get("TENANT_POOL_SIZE", 5))
+TENANT_MAX_OVERFLOW = int(os.environ.get("TENANT_MAX_OVERFLOW", 5))
+TENANT_POOL_RECYCLE = int(os.environ.get("TENANT_POOL_RECYCLE", 1800))
+TENANT_ENGINES_LIMIT = int(os.environ.get("TENANT_ENGINES_LIMIT", 20))
+# движок тенанта без держателей и запросов дольше стольких секунд закрывается плановой чисткой
+TENANT_ENGINE_IDLE_TTL = int(os.environ.get("TENANT_ENGINE_IDLE_TTL", 600))
+
+WEBMASTER_MAX_CONCURRENCY = int(os.environ.get("WEBMASTER_MAX_CONCURRENCY", 4))
+WEBMASTER_MAX_RETRIES = int(os.environ.get("WEBMASTER_MAX_RETRIES", 5))
+WEBMASTER_RPS = float(os.environ.get("WEBMASTER_RPS", 5))
+WEBMASTER_TIMEOUT = int(os.environ.get("WEBMASTER_TIMEOUT", 60))
+
+# лимиты тарифа xmlstock: одновременные запросы на поисковую систему и запросы в секунду
+XMLSTOCK_YANDEX_CONCURRENCY = int(os.environ.get("XMLSTOCK_YANDEX_CONCURRENCY", 10))
+XMLSTOCK_GOOGLE_CONCURRENCY = int(os.environ.get("XMLSTOCK_GOOGLE_CONCURRENCY", 10))
+XMLSTOCK_RPS = float(os.environ.get("XMLSTOCK_RPS", 10))
+XMLSTOCK_MAX_RETRIES = int(os.environ.get("XMLSTOCK_MAX_RETRIES", 3))
+XMLSTOCK_TIMEOUT = int(os.environ.get("XMLSTOCK_TIMEOUT", 60))
+MERGE_CONCURRENCY = int(os.environ.get("MERGE_CONCURRENCY", 10))
+LIVE_SEARCH_FLUSH_SIZE = int(os.environ.get("LIVE_SEARCH_FLUSH_SIZE", 50))
+LIVE_SEARCH_PARALLEL_UNITS = int(os.environ.get("LIVE_SEARCH_PARALLEL_UNITS", 4))
+# кэш выдачи xmlstock: сколько позиций хранить и сколько дней держать записи для статистики
+SERP_CACHE_TOP_N = int(os.environ.get("SERP_CACHE_TOP_N", 100))
+SERP_CACHE_RETENTION_DAYS = int(os.environ.get("SERP_CACHE_RETENTION_DAYS", 7))
+# одновременные обращения к кэшу выдачи на процесс: он живет в общей базе, пул которой нужен и остальному API
+SERP_CACHE_CONCURRENCY = int(os.environ.get("SERP_CACHE_CONCURRENCY", 5))
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", "exports")
+EXPORT_RETENTION_HOURS = int(os.environ.get("EXPORT_RETENTION_HOURS", 24))
+EXPORT_DEDUPE_WINDOW = int(os.environ.get("EXPORT_DEDUPE_WINDOW", 900))
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+
 @dataclass
 class XMLConfig:
     API_URL: str
@@ -1,13 +1,17 @@
+import base64
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
+import json
 from typing import List
 
 from fastapi import logger
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import asc, case, select, distinct, delete, text
+from sqlalchemy import Float, Numeric, asc, case, cast, literal, select, distinct, delete, text, tuple_
 from sqlalchemy import and_
 from sqlalchemy import desc, func, or_
+from sqlalchemy.dialects.postgresql import insert
 
-from db.models import QueryIndicator, QueryUrlTop, QueryUrlsMerge, Url
+from db.models import MetricsDailySummary, QueryIndicator, QueryUrlTop, QueryUrlsMerge, Url
 from db.models import Metrics
 from db.models import Query
 from db.models import MetricsQuery
@@ -22,6 +26,239 @@ from const import date_format
 ###########################################################
 
 
+# порядок колонок для COPY в metrics / metrics_query (id заполняется последовательностью)
+METRICS_COPY_COLUMNS = ("date", "position", "ctr", "impression", "demand", "clicks")
+
+# сколько строк выгрузки забирать из серверного курсора за раз
+EXPORT_YIELD_PER = 2000
+
+
+async def _driver_connection(db_session: AsyncSession):
+    connection = await db_session.connection()
+    raw_connection = await connection.get_raw_connection()
+    return raw_connection.driver_connection
+
+
+@asynccontextmanager
+async def bulk_transaction(db_session: AsyncSession):
+    """Одна транзакция asyncpg поверх AUTOCOMMIT-сессии для пакетной загрузки"""
+    driver_connection = await _driver_connection(db_session)
+    async with driver_connection.transaction():
+        yield
+
+
+async def _copy_metrics(db_session: AsyncSession, table, key_column, records):
+    if not records:
+        return
+    driver_connection = await _driver_connection(db_session)
+    await driver_connection.copy_records_to_table(
+        table, records=records, columns=(key_column, *METRICS_COPY_COLUMNS)
+    )
+
+
+async def _insert_keys(db_session: AsyncSession, model, key_column, keys):
+    if not keys:
+        return
+    await db_session.execute(
+        insert(model).on_conflict_do_nothing(index_elements=[key_column]),
+        [{key_column: key} for key in dict.fromkeys(keys)],
+    )
+
+
+async def _stream_rows(db_session: AsyncSession, query, yield_per: int = EXPORT_YIELD_PER):
+    """Строки запроса через один серверный курсор: память не зависит от объема выгрузки"""
+    # курсор asyncpg живет только внутри транзакции, а сессии тенантов работают в AUTOCOMMIT
+    async with bulk_transaction(db_session):
+        result = await db_session.stream(query.execution_options(yield_per=yield_per))
+        async for row in result:
+            yield row
+
+
+def encode_cursor(sort_value, key) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, key]).encode()).decode()
+
+
+def decode_cursor(cursor: str | None):
+    if not cursor:
+        return None
+    try:
+        sort_value, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    return sort_value, key
+
+
+async def _next_cursor(db_session: AsyncSession, sub, key_name, per_page, descending) -> str | None:
+    """Cursor of the last entity on the page, None when there are no more pages.
+
+    Taken from the page subquery itself: entities without metrics in the range
+    are not in the joined rows, but they still take a place on the page.
+    """
+    if per_page is None or int(per_page) <= 0:
+        return None
+    order = desc if descending else asc
+    sub_key = sub.c[key_name]
+    # подзапрос уже ограничен per_page: строка со смещением per_page - 1 есть только у полной страницы
+    last = (await db_session.execute(
+        select(sub.c.sort_value, sub_key)
+        .order_by(order(sub.c.sort_value), order(sub_key))
+        .offset(int(per_page) - 1)
+        .limit(1)
+    )).first()
+    if last is None:
+        return None
+
+    return encode_cursor(*last)
+
+
+def _page_descending(state=None, sort_desc=None) -> bool:
+    if sort_desc is not None or not state:
+        return bool(sort_desc)
+    return state == "decrease"
+
+
+def _metric_pointers(metrics, metric_type, descending):
+    """
+    Sort key of a url/query on one date and over the whole range.
+
+    Empty position/CTR values and ranges without impressions always go to the end of the list.
+    """
+    missing = float('-inf') if descending else float('inf')
+    if metric_type == "P":
+        return (
+            case((metrics.position == 0, missing), else_=metrics.position),
+            func.coalesce(func.avg(func.nullif(metrics.position, 0, type_=Float)), missing),
+        )
+    if metric_type == "K":
+        return metrics.clicks, func.sum(metrics.clicks)
+    if metric_type == "R":
+        return metrics.impression, func.sum(metrics.impression)
+    if metric_type == "C":
+        return (
+            case((metrics.ctr == 0, missing), else_=metrics.ctr),
+            func.coalesce(func.sum(metrics.clicks) / func.nullif(func.sum(metrics.impression), 0, type_=Float), missing),
+        )
+
+
+def _keyset_condition(sort_column, key_column, cursor, descending):
+    sort_value, key = cursor
+    if sort_column is key_column:
+        return key_column < key if descending else key_column > key
+    if descending:
+        return tuple_(sort_column, key_column) < tuple_(sort_value, key)
+    return tuple_(sort_column, key_column) > tuple_(sort_value, key)
+
+
+def _page_subquery(
+        entity,
+        metrics,
+        page,
+        per_page,
+        date_start,
+        date_end,
+        search_text=None,
+        state=None,
+        state_date=None,
+        metric_type=None,
+        state_type=None,
+        sort_desc=None,
+        uri_list=None,
+        cursor=None,
+):
+    """
+    Subquery with one page of urls/queries: (sort_value, url|query).
+
+    With cursor the page is selected by keyset on (sort_value, url|query)
+    instead of OFFSET, so deep pages cost the same as the first one.
+    """
+    cursor = decode_cursor(cursor)
+    metrics_key = getattr(metrics, entity.key)
+
+    descending = _page_descending(state, sort_desc)
+    order = desc if descending else asc
+
+    if sort_desc is not None or not state:
+        # сортировка по алфавиту (без сортировки - по возрастанию)
+        sort_column = entity
+        sub = select(entity.label("sort_value"), entity)
+        if uri_list is not None:
+            sub = sub.filter(entity.in_(uri_list))
+        if search_text:
+            sub = sub.filter(entity.like(f"%{search_text.strip()}%"))
+        if cursor:
+            sub = sub.where(_keyset_condition(sort_column, entity, cursor, descending))
+        sub = sub.order_by(order(entity))
+
+    else:
+        pointer, result_pointer = _metric_pointers(metrics, metric_type, descending)
+
+        if state_type == "date":
+            sort_column = pointer
+            sub = select(pointer.label("sort_value"), metrics_key).where(metrics.date == state_date)
+        else:
+            sort_column = result_pointer
+            sub = select(result_pointer.label("sort_value"), metrics_key).where(
+                and_(metrics.date >= date_start, metrics.date <= date_end))
+        if uri_list is not None:
+            sub = sub.filter(metrics_key.in_(uri_list))
+        if search_text:
+            sub = sub.filter(metrics_key.like(f"%{search_text.strip()}%"))
+
+        if state_type != "date":
+            sub = sub.group_by(metrics_key)
+            if cursor:
+                sub = sub.having(_keyset_condition(sort_column, metrics_key, cursor, descending))
+        elif cursor:
+            sub = sub.where(_keyset_condition(sort_column, metrics_key, cursor, descending))
+        sub = sub.order_by(order(sort_column), order(metrics_key))
+
+    if per_page is None:
+        # выгрузка целиком: порядок задает внешний запрос
+        return sub.order_by(None).subquery()
+    if not cursor:
+        sub = sub.offset(page)
+    return sub.limit(per_page).subquery()
+
+
+def _result_columns(metrics, metrics_key):
+    """Per url/query totals over the date range computed with window functions"""
+    window = {"partition_by": metrics_key}
+    clicks = func.sum(metrics.clicks).over(**window)
+    impression = func.sum(metrics.impression).over(**window)
+    position = func.avg(func.nullif(metrics.position, 0, type_=Float)).over(**window)
+    return (
+        case(
+            (and_(impression > 0, position.isnot(None)), cast(func.round(cast(position, Numeric), 2), Float)),
+            else_=0,
+        ).label("result_position"),
+        clicks.label("result_clicks"),
+        impression.label("result_impression"),
+        case(
+            (and_(impression > 0, position.isnot(None)), cast(func.round(cast(clicks * 100 / impression, Numeric), 2), Float)),
+            else_=0,
+        ).label("result_ctr"),
+    )
+
+
+def _metrics_page_query(metrics, metrics_key, sub, date_start, date_end, descending):
+    """
+    Metrics of the page for every day of the range:
+    (date, position, clicks, impression, ctr,
+     result_position, result_clicks, result_impression, result_ctr, sort_value, url|query)
+
+    Rows are ordered like the page itself, then by date.
+    """
+    sub_key = sub.c[metrics_key.key]
+    order = desc if descending else asc
+    return select(
+        metrics.date, metrics.position, metrics.clicks, metrics.impression, metrics.ctr,
+        *_result_columns(metrics, metrics_key),
+        sub,
+    ).join(sub, metrics_key == sub_key).where(
+        and_(metrics.date >= date_start, metrics.date <= date_end)
+    ).order_by(order(sub.c.sort_value), order(sub_key), metrics.date)
+
+
 class UrlDAL:
     """Data Access Layer for operating user info"""
 
@@ -30,13 +267,65 @@ class UrlDAL:
 
     async def add_new_urls(
             self,
-            add_values
+            add_values,
+            bulk: bool = False,
     ):
+        # bulk: add_values - строки url, уже существующие пропускаются одним INSERT ... ON CONFLICT DO NOTHING
+        if bulk:
+            await _insert_keys(self.db_session, Url, "url", add_values)
+            return
         for value in add_values:
             await self.db_session.merge(value)
         await self.db_session.flush()
         return
 
+    async def _get_list_filter(self, list_name, general_db):
+        if list_name == "None":
+            return None
+
+        list_id = (await general_db.execute(
+            select(List_model.id).where(List_model.name == list_name)
+        )).fetchone()[0]
+
+        uri_list = (await general_db.execute(
+            select(ListURI.uri).where(ListURI.list_id == list_id)
+        )).scalars().all()
+
+        return uri_list
+
+    async def _get_page(self, page, per_page, date_start, date_end, list_name, general_db, cursor, **kwargs):
+        uri_list = await self._get_list_filter(list_name, general_db)
+
+        sub = _page_subquery(Url.url, Metrics, page, per_page, date_start, date_end,
+                             uri_list=uri_list, cursor=cursor, **kwargs)
+        descending = _page_descending(kwargs.get("state"), kwargs.get("sort_desc"))
+        query = _metrics_page_query(Metrics, Metrics.url, sub, date_start, date_end, descending)
+
+        res = await self.db_session.execute(query)
+        product_row = res.fetchall()
+        cursor = await _next_cursor(self.db_session, sub, Url.url.key, per_page, descending)
+        return product_row or None, cursor
+
+    async def stream_export(self, date_start, date_end, list_name, general_db, **kwargs):
+        """
+        Все url выгрузки одним запросом в порядке страницы, затем по дате - строки как у _get_page.
+        kwargs - фильтры и сортировка _page_subquery (search_text, state, ..., sort_desc).
+        """
+        uri_list = await self._get_list_filter(list_name, general_db)
+
+        sub = _page_subquery(Url.url, Metrics, 0, None, date_start, date_end, uri_list=uri_list, **kwargs)
+        descending = _page_descending(kwargs.get("state"), kwargs.get("sort_desc"))
+        query = _metrics_page_query(Metrics, Metrics.url, sub, date_start, date_end, descending)
+
+        async for row in _stream_rows(self.db_session, query):
+            yield row
+
+    async def count_export(self, date_start, date_end, list_name, general_db, **kwargs):
+        """Сколько url попадет в stream_export с теми же фильтрами"""
+        uri_list = await self._get_list_filter(list_name, general_db)
+        sub = _page_subquery(Url.url, Metrics, 0, None, date_start, date_end, uri_list=uri_list, **kwargs)
+        return (await self.db_session.execute(select(func.count()).select_from(sub))).scalar_one()
+
     async def get_urls_with_pagination(
             self, 
             page, 
@@ -48,132 +337,13 @@ class UrlDAL:
             metric_type, 
             state_type, 
             list_name,
-            general_db
+            general_db,
+            cursor=None,
             ):
-        
-        filter_query = None
-        if list_name != "None":
-            list_id = (await general_db.execute(
-                select(List_model.id).where(List_model.name == list_name)
-            )).fetchone()[0]
-
-            uri_list = (await general_db.execute(
-                select(ListURI.uri).where(ListURI.list_id == list_id)
-            )).scalars().all()
-            
-            filter_query = Url.url.in_(uri_list)
-
-            filter_query_result = Metrics.url.in_(uri_list)
-
-        if metric_type == "P":
-            pointer = Metrics.position
-            result_pointer = func.avg(Metrics.position)
-        if metric_type == "K":
-            pointer = Metrics.clicks
-            result_pointer = func.sum(Metrics.clicks)
-        if metric_type == "R":
-            pointer = Metrics.impression
-            result_pointer = func.sum(Metrics.impression)
-        if metric_type == "C":
-            pointer = Metrics.ctr
-            result_pointer = func.avg(Metrics.ctr)
-        
-        sub_query = select(Url)
-
-        sub_query_result = select(Metrics.url)
-            
-        if filter_query is not None:
-            sub_query = sub_query.filter(filter_query)
-
-            sub_query_result = sub_query_result.filter(filter_query_result)
-
-        if not state:
-            
-            sub = sub_query.offset(page).limit(per_page).subquery()
-            query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                        Metrics.ctr, sub).join(sub,
-                                                    Metrics.url == sub.c.url).group_by(
-                sub.c.url,
-                Metrics.date,   
-                Metrics.position,
-                Metrics.clicks,
-                Metrics.impression,
-                Metrics.ctr,
-            ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-
-        elif state == "decrease":
-            if state_type == "date":
-
-                sub = sub_query_result.where(Metrics.date == state_date).order_by(desc(pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                            Metrics.ctr, sub).join(sub,
-                                                        Metrics.url == sub.c.url).group_by(
-                    sub.c.url,
-                    Metrics.date,
-                    Metrics.position,
-                    Metrics.clicks,
-                    Metrics.impression,
-                    Metrics.ctr,
-                ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-            else:
-
-                sub = sub_query_result.where(
-                    and_(Metrics.date >= date_start, Metrics.date <= date_end)).group_by(Metrics.url).order_by(
-                    desc(result_pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                            Metrics.ctr, sub).join(sub,
-                                                        Metrics.url == sub.c.url).group_by(
-                    sub.c.url,
-                    Metrics.date,
-                    Metrics.position,
-                    Metrics.clicks,
-                    Metrics.impression,
-                    Metrics.ctr,
-                ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-        
-        elif state == "increase":
-            if pointer == Metrics.position:
-                    pointer = case(
-                        (pointer == 0, float('inf')),  # если pointer == 0, заменяем на float('inf')
-                        else_=pointer  # иначе используем значение pointer
-                    )
-            if state_type == "date":
-
-                sub = sub_query_result.where(Metrics.date == state_date).order_by(asc(pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                            Metrics.ctr, sub).join(sub,
-                                                        Metrics.url == sub.c.url).group_by(
-                    sub.c.url,
-                    Metrics.date,
-                    Metrics.position,
-                    Metrics.clicks,
-                    Metrics.impression,
-                    Metrics.ctr,
-                ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-            else:
-
-                sub = sub_query_result.where(
-                    and_(Metrics.date >= date_start, Metrics.date <= date_end)).group_by(Metrics.url).order_by(
-                    asc(result_pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                            Metrics.ctr, sub).join(sub,
-                                                        Metrics.url == sub.c.url).group_by(
-                    sub.c.url,
-                    Metrics.date,
-                    Metrics.position,
-                    Metrics.clicks,
-                    Metrics.impression,
-                    Metrics.ctr,
-                ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-
-        res = await self.db_session.execute(query)
-        product_row = res.fetchall()
-        if len(product_row) != 0:
-            return product_row
+        return await self._get_page(
+            page, per_page, date_start, date_end, list_name, general_db, cursor,
+            state=state, state_date=state_date, metric_type=metric_type, state_type=state_type,
+        )
 
     async def get_urls_with_pagination_and_like(
             self, 
@@ -188,133 +358,13 @@ class UrlDAL:
             state_type,
             list_name,
             general_db,
+            cursor=None,
             ):
-        
-        filter_query = None
-
-        if list_name != "None":
-            list_id = (await general_db.execute(
-                select(List_model.id).where(List_model.name == list_name)
-            )).fetchone()[0]
-
-            uri_list = (await general_db.execute(
-                select(ListURI.uri).where(ListURI.list_id == list_id)
-            )).scalars().all()
-
-
-            filter_query = Url.url.in_(uri_list)
-
-            filter_query_result = Metrics.url.in_(uri_list)
-
-        if metric_type == "P":
-            pointer = Metrics.position
-            result_pointer = func.avg(Metrics.position)
-        if metric_type == "K":
-            pointer = Metrics.clicks
-            result_pointer = func.sum(Metrics.clicks)
-        if metric_type == "R":
-            pointer = Metrics.impression
-            result_pointer = func.sum(Metrics.impression)
-        if metric_type == "C":
-            pointer = Metrics.ctr
-            result_pointer = func.avg(Metrics.ctr)
-        
-        sub_query = select(Url)
-
-        sub_query_result = select(Metrics.url)
-            
-        if filter_query is not None:
-            sub_query = sub_query.filter(filter_query)
-
-            sub_query_result = sub_query_result.filter(filter_query_result)
-
-        if not state:
-            sub = sub_query.filter(Url.url.like(f"%{search_text.strip()}%")).offset(page).limit(
-                per_page).subquery()
-            query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                        Metrics.ctr, sub).join(sub,
-                                                    Metrics.url == sub.c.url).group_by(
-                sub.c.url,
-                Metrics.date,
-                Metrics.position,
-                Metrics.clicks,
-                Metrics.impression,
-                Metrics.ctr,
-            ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-
-        elif state == "decrease":
-            if state_type == "date":
-                
-                sub = sub_query_result.filter(Metrics.url.like(f"%{search_text.strip()}%")).where(Metrics.date == state_date).order_by(desc(pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                            Metrics.ctr, sub).join(sub,
-                                                        Metrics.url == sub.c.url).group_by(
-                    sub.c.url,
-                    Metrics.date,
-                    Metrics.position,
-                    Metrics.clicks,
-                    Metrics.impression,
-                    Metrics.ctr,
-                ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-            else:
-
-                sub = sub_query_result.filter(Metrics.url.like(f"%{search_text.strip()}%")).where(
-                    and_(Metrics.date >= date_start, Metrics.date <= date_end)).group_by(Metrics.url).order_by(
-                    desc(result_pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                            Metrics.ctr, sub).join(sub,
-                                                        Metrics.url == sub.c.url).group_by(
-                    sub.c.url,
-                    Metrics.date,
-                    Metrics.position,
-                    Metrics.clicks,
-                    Metrics.impression,
-                    Metrics.ctr,
-                ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-        
-        elif state == "increase":
-            if pointer == Metrics.position:
-                    pointer = case(
-                        (pointer == 0, float('inf')),  # если pointer == 0, заменяем на float('inf')
-                        else_=pointer  # иначе используем значение pointer
-                    )
-            if state_type == "date":
-
-                sub = sub_query_result.filter(Metrics.url.like(f"%{search_text.strip()}%")).where(Metrics.date == state_date).order_by(asc(pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                            Metrics.ctr, sub).join(sub,
-                                                        Metrics.url == sub.c.url).group_by(
-                    sub.c.url,
-                    Metrics.date,
-                    Metrics.position,
-                    Metrics.clicks,
-                    Metrics.impression,
-                    Metrics.ctr,
-                ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-            else:
-
-                sub = sub_query_result.filter(Metrics.url.like(f"%{search_text.strip()}%")).where(
-                    and_(Metrics.date >= date_start, Metrics.date <= date_end)).group_by(Metrics.url).order_by(
-                    asc(result_pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression,
-                            Metrics.ctr, sub).join(sub,
-                                                        Metrics.url == sub.c.url).group_by(
-                    sub.c.url,
-                    Metrics.date,
-                    Metrics.position,
-                    Metrics.clicks,
-                    Metrics.impression,
-                    Metrics.ctr,
-                ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-
-        res = await self.db_session.execute(query)
-        product_row = res.fetchall()
-        if len(product_row) != 0:
-            return product_row
+        return await self._get_page(
+            page, per_page, date_start, date_end, list_name, general_db, cursor,
+            search_text=search_text, state=state, state_date=state_date, metric_type=metric_type,
+            state_type=state_type,
+        )
 
     async def get_urls_with_pagination_sort(
             self, 
@@ -325,45 +375,12 @@ class UrlDAL:
             sort_desc,
             list_name,
             general_db,
+            cursor=None,
             ):
-
-        filter_query = None
-
-        if list_name != "None":
-            list_id = (await general_db.execute(
-                select(List_model.id).where(List_model.name == list_name)
-            )).fetchone()[0]
-
-            uri_list = (await general_db.execute(
-                select(ListURI.uri).where(ListURI.list_id == list_id)
-            )).scalars().all()
-
-            filter_query = Url.url.in_(uri_list)
-        
-        sub_query = select(Url)
-            
-        if filter_query is not None:
-            sub_query = sub_query.filter(filter_query)
-            
-        if sort_desc:
-            sub = sub_query.order_by(desc(Url.url)).offset(page).limit(
-                per_page).subquery()
-        else:
-            sub = sub_query.order_by(Url.url).offset(page).limit(
-                per_page).subquery()
-        query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression, Metrics.ctr, sub).join(sub,
-                                                                                                                  Metrics.url == sub.c.url).group_by(
-            sub.c.url,
-            Metrics.date,
-            Metrics.position,
-            Metrics.clicks,
-            Metrics.impression,
-            Metrics.ctr,
-        ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-        res = await self.db_session.execute(query)
-        product_row = res.fetchall()
-        if len(product_row) != 0:
-            return product_row
+        return await self._get_page(
+            page, per_page, date_start, date_end, list_name, general_db, cursor,
+            sort_desc=sort_desc,
+        )
 
     async def get_urls_with_pagination_and_like_sort(
             self, 
@@ -375,45 +392,12 @@ class UrlDAL:
             sort_desc,
             list_name,
             general_db,
+            cursor=None,
             ):
-
-        filter_query = None
-
-        if list_name != "None":
-            list_id = (await general_db.execute(
-                select(List_model.id).where(List_model.name == list_name)
-            )).fetchone()[0]
-
-            uri_list = (await general_db.execute(
-                select(ListURI.uri).where(ListURI.list_id == list_id)
-            )).scalars().all()
-
-            filter_query = Url.url.in_(uri_list)
-        
-        sub_query = select(Url)
-            
-        if filter_query is not None:
-            sub_query = sub_query.filter(filter_query)
-
-        if sort_desc:
-            sub = sub_query.filter(Url.url.like(f"%{search_text.strip()}%")).order_by(desc(Url.url)).offset(
-                page).limit(per_page).subquery()
-        else:
-            sub = sub_query.filter(Url.url.like(f"%{search_text.strip()}%")).order_by(Url.url).offset(page).limit(
-                per_page).subquery()
-        query = select(Metrics.date, Metrics.position, Metrics.clicks, Metrics.impression, Metrics.ctr, sub).join(sub,
-                                                                                                                  Metrics.url == sub.c.url).group_by(
-            sub.c.url,
-            Metrics.date,
-            Metrics.position,
-            Metrics.clicks,
-            Metrics.impression,
-            Metrics.ctr,
-        ).having(and_(Metrics.date <= date_end, Metrics.date >= date_start))
-        res = await self.db_session.execute(query)
-        product_row = res.fetchall()
-        if len(product_row) != 0:
-            return product_row
+        return await self._get_page(
+            page, per_page, date_start, date_end, list_name, general_db, cursor,
+            search_text=search_text, sort_desc=sort_desc,
+        )
         
     async def get_metrics_daily_summary_like(self, date_start, date_end, search_text, list_name, general_db):
 
@@ -460,6 +444,13 @@ class UrlDAL:
 
     async def get_metrics_daily_summary(self, date_start, date_end, list_name, general_db):
 
+        if list_name == "None":
+            product_row = await DailySummaryDAL(self.db_session).get_summary("url", date_start, date_end)
+            total_records = await self.db_session.execute(select(func.count()).select_from(Url))
+            if len(product_row) != 0:
+                return product_row, total_records.first()
+            return
+
         filter_query = None
 
         if list_name != "None":
@@ -531,6 +522,12 @@ class UrlDAL:
         
     async def get_not_void_count_daily_summary(self, date_start, date_end, list_name, general_db):
 
+        if list_name == "None":
+            product_row = await DailySummaryDAL(self.db_session).get_not_void_count("url", date_start, date_end)
+            if len(product_row) != 0:
+                return product_row
+            return
+
         filter_query = None
 
         if list_name != "None":
@@ -571,8 +568,13 @@ class MetricDAL:
 
     async def add_new_metrics(
             self,
-            add_values
+            add_values,
+            bulk: bool = False,
     ):
+        # bulk: add_values - кортежи (url, *METRICS_COPY_COLUMNS), пишутся через COPY
+        if bulk:
+            await _copy_metrics(self.db_session, "metrics", "url", add_values)
+            return
         self.db_session.add_all(add_values)
         await self.db_session.flush()
         return
@@ -592,6 +594,7 @@ class MetricDAL:
     ):
         query = delete(Metrics).where(Metrics.date == date)
         await self.db_session.execute(query)
+        await DailySummaryDAL(self.db_session).delete_from("url", date, date)
         await self.db_session.commit()
 
 
@@ -603,252 +606,69 @@ class QueryDAL:
 
     async def add_new_urls(
             self,
-            add_values
+            add_values,
+            bulk: bool = False,
     ):
+        # bulk: add_values - строки query, уже существующие пропускаются одним INSERT ... ON CONFLICT DO NOTHING
+        if bulk:
+            await _insert_keys(self.db_session, Query, "query", add_values)
+            return
         for value in add_values:
             await self.db_session.merge(value)
         await self.db_session.flush()
         return
 
-    async def get_urls_with_pagination(self, page, per_page, date_start, date_end, state, state_date, metric_type, state_type):
-        if metric_type == "P":
-            pointer = MetricsQuery.position
-            result_pointer = func.avg(MetricsQuery.position)
-        if metric_type == "K":
-            pointer = MetricsQuery.clicks
-            result_pointer = func.sum(MetricsQuery.clicks)
-        if metric_type == "R":
-            pointer = MetricsQuery.impression
-            result_pointer = func.sum(MetricsQuery.impression)
-        if metric_type == "C":
-            pointer = MetricsQuery.ctr
-            result_pointer = func.avg(MetricsQuery.ctr)
-        if not state:
-            sub = select(Query).offset(page).limit(
-                per_page).subquery()
-            query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                        MetricsQuery.ctr, sub).join(sub,
-                                                    MetricsQuery.query == sub.c.query).group_by(
-                sub.c.query,
-                MetricsQuery.date,
-                MetricsQuery.position,
-                MetricsQuery.clicks,
-                MetricsQuery.impression,
-                MetricsQuery.ctr,
-            ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-
-        elif state == "decrease":
-            if state_type == "date":
-                sub = select(MetricsQuery.query).where(MetricsQuery.date == state_date).order_by(desc(pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                            MetricsQuery.ctr, sub).join(sub,
-                                                        MetricsQuery.query == sub.c.query).group_by(
-                    sub.c.query,
-                    MetricsQuery.date,
-                    MetricsQuery.position,
-                    MetricsQuery.clicks,
-                    MetricsQuery.impression,
-                    MetricsQuery.ctr,
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-            else:
-                sub = select(MetricsQuery.query).where(
-                    and_(MetricsQuery.date >= date_start, MetricsQuery.date <= date_end)).group_by(MetricsQuery.query).order_by(
-                    desc(result_pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                            MetricsQuery.ctr, sub).join(sub,
-                                                        MetricsQuery.query == sub.c.query).group_by(
-                    sub.c.query,
-                    MetricsQuery.date,
-                    MetricsQuery.position,
-                    MetricsQuery.clicks,
-                    MetricsQuery.impression,
-                    MetricsQuery.ctr,
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-        
-        elif state == "increase":
-            if state_type == "date":
-                if pointer == MetricsQuery.position:
-                    pointer = case(
-                        (pointer == 0, float('inf')),  # если pointer == 0, заменяем на float('inf')
-                        else_=pointer  # иначе используем значение pointer
-                    )
-                sub = select(MetricsQuery.query).where(MetricsQuery.date == state_date).order_by(asc(pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                            MetricsQuery.ctr, sub).join(sub,
-                                                        MetricsQuery.query == sub.c.query).group_by(
-                    sub.c.query,
-                    MetricsQuery.date,
-                    MetricsQuery.position,
-                    MetricsQuery.clicks,
-                    MetricsQuery.impression,
-                    MetricsQuery.ctr,
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-            else:
-                sub = select(MetricsQuery.query).where(
-                    and_(MetricsQuery.date >= date_start, MetricsQuery.date <= date_end)).group_by(MetricsQuery.query).order_by(
-                    asc(result_pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                            MetricsQuery.ctr, sub).join(sub,
-                                                        MetricsQuery.query == sub.c.query).group_by(
-                    sub.c.query,
-                    MetricsQuery.date,
-                    MetricsQuery.position,
-                    MetricsQuery.clicks,
-                    MetricsQuery.impression,
-                    MetricsQuery.ctr,
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
+    async def _get_page(self, page, per_page, date_start, date_end, cursor, **kwargs):
+        sub = _page_subquery(Query.query, MetricsQuery, page, per_page, date_start, date_end,
+                             cursor=cursor, **kwargs)
+        descending = _page_descending(kwargs.get("state"), kwargs.get("sort_desc"))
+        query = _metrics_page_query(MetricsQuery, MetricsQuery.query, sub, date_start, date_end, descending)
 
         res = await self.db_session.execute(query)
         product_row = res.fetchall()
-        if len(product_row) != 0:
-            return product_row
-
-    async def get_urls_with_pagination_and_like(self, page, per_page, date_start, date_end, search_text, state, state_date, metric_type, state_type):
-        if metric_type == "P":
-            pointer = MetricsQuery.position
-            result_pointer = func.avg(MetricsQuery.position)
-        if metric_type == "K":
-            pointer = MetricsQuery.clicks
-            result_pointer = func.sum(MetricsQuery.clicks)
-        if metric_type == "R":
-            pointer = MetricsQuery.impression
-            result_pointer = func.sum(MetricsQuery.impression)
-        if metric_type == "C":
-            pointer = MetricsQuery.ctr
-            result_pointer = func.avg(MetricsQuery.ctr)
-        if not state:
-            sub = select(Query).filter(Query.query.like(f"%{search_text.strip()}%")).offset(page).limit(
-                per_page).subquery()
-            query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                        MetricsQuery.ctr, sub).join(sub,
-                                                    MetricsQuery.query == sub.c.query).group_by(
-                sub.c.query,
-                MetricsQuery.date,
-                MetricsQuery.position,
-                MetricsQuery.clicks,
-                MetricsQuery.impression,
-                MetricsQuery.ctr,
-            ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-
-        elif state == "decrease":
-            if state_type == "date":
-                sub = select(MetricsQuery.query).filter(MetricsQuery.query.like(f"%{search_text.strip()}%")).where(MetricsQuery.date == state_date).order_by(desc(pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                            MetricsQuery.ctr, sub).join(sub,
-                                                        MetricsQuery.query == sub.c.query).group_by(
-                    sub.c.query,
-                    MetricsQuery.date,
-                    MetricsQuery.position,
-                    MetricsQuery.clicks,
-                    MetricsQuery.impression,
-                    MetricsQuery.ctr,
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-            else:
-                sub = select(MetricsQuery.query).filter(MetricsQuery.query.like(f"%{search_text.strip()}%")).where(
-                    and_(MetricsQuery.date >= date_start, MetricsQuery.date <= date_end)).group_by(MetricsQuery.query).order_by(
-                    desc(result_pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                            MetricsQuery.ctr, sub).join(sub,
-                                                        MetricsQuery.query == sub.c.query).group_by(
-                    sub.c.query,
-                    MetricsQuery.date,
-                    MetricsQuery.position,
-                    MetricsQuery.clicks,
-                    MetricsQuery.impression,
-                    MetricsQuery.ctr,
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-        
-        elif state == "increase":
-            if pointer == MetricsQuery.position:
-                    pointer = case(
-                        (pointer == 0, float('inf')),  # если pointer == 0, заменяем на float('inf')
-                        else_=pointer  # иначе используем значение pointer
-                    )
-            if state_type == "date":
-                sub = select(MetricsQuery.query).filter(MetricsQuery.query.like(f"%{search_text.strip()}%")).where(MetricsQuery.date == state_date).order_by(asc(pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                            MetricsQuery.ctr, sub).join(sub,
-                                                        MetricsQuery.query == sub.c.query).group_by(
-                    sub.c.query,
-                    MetricsQuery.date,
-                    MetricsQuery.position,
-                    MetricsQuery.clicks,
-                    MetricsQuery.impression,
-                    MetricsQuery.ctr,
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-            else:
-                sub = select(MetricsQuery.query).filter(MetricsQuery.query.like(f"%{search_text.strip()}%")).where(
-                    and_(MetricsQuery.date >= date_start, MetricsQuery.date <= date_end)).group_by(MetricsQuery.query).order_by(
-                    asc(result_pointer)).offset(page).limit(per_page).subquery()
-
-                query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                            MetricsQuery.ctr, sub).join(sub,
-                                                        MetricsQuery.query == sub.c.query).group_by(
-                    sub.c.query,
-                    MetricsQuery.date,
-                    MetricsQuery.position,
-                    MetricsQuery.clicks,
-                    MetricsQuery.impression,
-                    MetricsQuery.ctr,
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-
-        res = await self.db_session.execute(query)
-        product_row = res.fetchall()
-        if len(product_row) != 0:
-            return product_row
-
-    async def get_urls_with_pagination_sort(self, page, per_page, date_start, date_end, sort_desc):
-        if sort_desc:
-            sub = select(Query).order_by(desc(Query.query)).offset(page).limit(
-                per_page).subquery()
-        else:
-            sub = select(Query).order_by(Query.query).offset(page).limit(
-                per_page).subquery()
-        query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                       MetricsQuery.ctr, sub).join(sub,
-                                                   MetricsQuery.query == sub.c.query).group_by(
-            sub.c.query,
-            MetricsQuery.date,
-            MetricsQuery.position,
-            MetricsQuery.clicks,
-            MetricsQuery.impression,
-            MetricsQuery.ctr,
-        ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-        res = await self.db_session.execute(query)
-        product_row = res.fetchall()
-        if len(product_row) != 0:
-            return product_row
+        cursor = await _next_cursor(self.db_session, sub, Query.query.key, per_page, descending)
+        return product_row or None, cursor
+
+    async def stream_export(self, date_start, date_end, **kwargs):
+        """Все запросы выгрузки одним запросом, см. UrlDAL.stream_export"""
+        sub = _page_subquery(Query.query, MetricsQuery, 0, None, date_start, date_end, **kwargs)
+        descending = _page_descending(kwargs.get("state"), kwargs.get("sort_desc"))
+        query = _metrics_page_query(MetricsQuery, MetricsQuery.query, sub, date_start, date_end, descending)
+
+        async for row in _stream_rows(self.db_session, query):
+            yield row
+
+    async def count_export(self, date_start, date_end, **kwargs):
+        sub = _page_subquery(Query.query, MetricsQuery, 0, None, date_start, date_end, **kwargs)
+        return (await self.db_session.execute(select(func.count()).select_from(sub))).scalar_one()
+
+    async def get_urls_with_pagination(self, page, per_page, date_start, date_end, state, state_date, metric_type, state_type,
+                                       cursor=None):
+        return await self._get_page(
+            page, per_page, date_start, date_end, cursor,
+            state=state, state_date=state_date, metric_type=metric_type, state_type=state_type,
+        )
+
+    async def get_urls_with_pagination_and_like(self, page, per_page, date_start, date_end, search_text, state, state_date, metric_type, state_type,
+                                                cursor=None):
+        return await self._get_page(
+            page, per_page, date_start, date_end, cursor,
+            search_text=search_text, state=state, state_date=state_date, metric_type=metric_type,
+            state_type=state_type,
+        )
+
+    async def get_urls_with_pagination_sort(self, page, per_page, date_start, date_end, sort_desc, cursor=None):
+        return await self._get_page(
+            page, per_page, date_start, date_end, cursor,
+            sort_desc=sort_desc,
+        )
 
     async def get_urls_with_pagination_and_like_sort(self, page, per_page, date_start, date_end, search_text,
-                                                     sort_desc):
-        if sort_desc:
-            sub = select(Query).filter(Query.query.like(f"%{search_text.strip()}%")).order_by(desc(Query.query)).offset(
-                page).limit(per_page).subquery()
-        else:
-            sub = select(Query).filter(Query.query.like(f"%{search_text.strip()}%")).order_by(Query.query).offset(
-                page).limit(
-                per_page).subquery()
-        query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                       MetricsQuery.ctr, sub).join(sub,
-                                                   MetricsQuery.query == sub.c.query).group_by(
-            sub.c.query,
-            MetricsQuery.date,
-            MetricsQuery.position,
-            MetricsQuery.clicks,
-            MetricsQuery.impression,
-            MetricsQuery.ctr,
-        ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-        res = await self.db_session.execute(query)
-        product_row = res.fetchall()
-        if len(product_row) != 0:
-            return product_row
+                                                     sort_desc, cursor=None):
+        return await self._get_page(
+            page, per_page, date_start, date_end, cursor,
+            search_text=search_text, sort_desc=sort_desc,
+        )
 
     async def get_metrics_daily_summary_like(self, date_start, date_end, search_text):
         sub = select(Query).filter(Query.query.like(f"%{search_text.strip()}%")).subquery()
@@ -868,13 +688,7 @@ class QueryDAL:
             return product_row, total_records.first()
 
     async def get_metrics_daily_summary(self, date_start, date_end):
-        query = select(MetricsQuery.date, 
-                    func.sum(MetricsQuery.clicks).label('total_clicks'),
-                    func.sum(MetricsQuery.impression).label('total_impressions')
-                    ).group_by(MetricsQuery.date,
-                    ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
-        res = await self.db_session.execute(query)
-        product_row = res.fetchall()
+        product_row = await DailySummaryDAL(self.db_session).get_summary("query", date_start, date_end)
         
         query = select(func.count()).select_from(Query).limit(1)
         total_records = await self.db_session.execute(query)
@@ -897,14 +711,8 @@ class QueryDAL:
         if len(product_row) != 0:
             return product_row
         
-    async def get_not_void_count_daily_summary(self, date_start, date_end):   
-        sub_count_query = select(MetricsQuery.date.label("date"), func.count().label("count_line")                
-                ).where(MetricsQuery.position > 0
-                ).group_by(MetricsQuery.date
-                ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start)
-                )
-        res = await self.db_session.execute(sub_count_query)
-        product_row = res.fetchall()
+    async def get_not_void_count_daily_summary(self, date_start, date_end):
+        product_row = await DailySummaryDAL(self.db_session).get_not_void_count("query", date_start, date_end)
         
         if len(product_row) != 0:
             return product_row
@@ -917,8 +725,13 @@ class MetricQueryDAL:
 
     async def add_new_metrics(
             self,
-            add_values
+            add_values,
+            bulk: bool = False,
     ):
+        # bulk: add_values - кортежи (query, *METRICS_COPY_COLUMNS), пишутся через COPY
+        if bulk:
+            await _copy_metrics(self.db_session, "metrics_query", "query", add_values)
+            return
         self.db_session.add_all(add_values)
         await self.db_session.flush()
         return
@@ -949,6 +762,7 @@ class MetricQueryDAL:
     ):
         query = delete(MetricsQuery).where(MetricsQuery.date == date)
         await self.db_session.execute(query)
+        await DailySummaryDAL(self.db_session).delete_from("query", date, date)
         await self.db_session.commit()
     
 
@@ -962,6 +776,8 @@ class MetricQueryDAL:
 
         await self.db_session.execute(query)
 
+        await DailySummaryDAL(self.db_session).delete_from("query", target_date)
+
         await self.db_session.commit()
 
         logger.info(f"Из таблицы query были удалены данные до: {target_date}")
@@ -969,6 +785,83 @@ class MetricQueryDAL:
         return 
 
 
+class DailySummaryDAL:
+    """Суточные агрегаты по метрикам url/query (таблица metrics_daily_summary)"""
+
+    metrics_models = {"url": Metrics, "query": MetricsQuery}
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    async def refresh(self, metrics_type, date_from=None):
+        """Пересчитывает агрегаты за даты строго позже date_from (все даты, если date_from не задан)"""
+        metrics = self.metrics_models[metrics_type]
+
+        source = select(
+            literal(metrics_type).label("metrics_type"),
+            metrics.date,
+            func.coalesce(func.sum(metrics.clicks), 0),
+            func.coalesce(func.sum(metrics.impression), 0),
+            func.count().filter(metrics.position > 0),
+            func.coalesce(func.avg(metrics.position).filter(metrics.position > 0), 0),
+            func.count(),
+        ).group_by(metrics.date)
+        if date_from is not None:
+            source = source.where(metrics.date > date_from)
+
+        query = insert(MetricsDailySummary).from_select(
+            ["metrics_type", "date", "clicks", "impression", "not_void_count", "position", "count"],
+            source,
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[MetricsDailySummary.metrics_type, MetricsDailySummary.date],
+            set_={
+                "clicks": query.excluded.clicks,
+                "impression": query.excluded.impression,
+                "not_void_count": query.excluded.not_void_count,
+                "position": query.excluded.position,
+                "count": query.excluded.count,
+            },
+        )
+        await self.db_session.execute(query)
+        await self.db_session.commit()
+
+    async def delete_from(self, metrics_type, date_start, date_end=None):
+        query = delete(MetricsDailySummary).where(
+            MetricsDailySummary.metrics_type == metrics_type,
+            MetricsDailySummary.date >= date_start,
+        )
+        if date_end is not None:
+            query = query.where(MetricsDailySummary.date <= date_end)
+        await self.db_session.execute(query)
+
+    async def get_summary(self, metrics_type, date_start, date_end):
+        query = select(
+            MetricsDailySummary.date,
+            MetricsDailySummary.clicks.label("total_clicks"),
+            MetricsDailySummary.impression.label("total_impressions"),
+        ).where(
+            MetricsDailySummary.metrics_type == metrics_type,
+            MetricsDailySummary.date >= date_start,
+            MetricsDailySummary.date <= date_end,
+        ).order_by(MetricsDailySummary.date)
+        res = await self.db_session.execute(query)
+        return res.fetchall()
+
+    async def get_not_void_count(self, metrics_type, date_start, date_end):
+        query = select(
+            MetricsDailySummary.date.label("date"),
+            MetricsDailySummary.not_void_count.label("count_line"),
+        ).where(
+            MetricsDailySummary.metrics_type == metrics_type,
+            MetricsDailySummary.date >= date_start,
+            MetricsDailySummary.date <= date_end,
+            MetricsDailySummary.not_void_count > 0,
+        ).order_by(MetricsDailySummary.date)
+        res = await self.db_session.execute(query)
+        return res.fetchall()
+
+
 class IndicatorDAL:
 
     def __init__(self, session: AsyncSession):
@@ -1039,6 +932,16 @@ class MergeDAL:
     def __init__(self, session: AsyncSession):
         self.session = session
 
+    async def add_merge(self, values: dict, date):
+        """values: url -> список запросов; одна пачка INSERT на все url"""
+        if not values:
+            return
+        await self.session.execute(
+            insert(QueryUrlsMerge),
+            [{"url": url, "queries": queries, "date": date} for url, queries in values.items()],
+        )
+        await self.session.commit()
+
     async def get_merge_with_pagination(self, date, page, per_page):
         query = select(QueryUrlsMerge.url, QueryUrlsMerge.queries).offset(page).limit(
             per_page).where(QueryUrlsMerge.date == datetime.strptime(date.split()[0], date_format))
@@ -1047,18 +950,26 @@ class MergeDAL:
         if len(product_row) != 0:
             return product_row
 
+    async def stream_export(self, date, search_text_url="", search_text_query="", sort_desc=None):
+        """Все (url, queries) merge за дату одним серверным курсором, с фильтрами и сортировкой как у страниц"""
+        query = select(QueryUrlsMerge.url, QueryUrlsMerge.queries).where(
+            QueryUrlsMerge.date == datetime.strptime(date.split()[0], date_format))
+        if search_text_query:
+            query = query.filter(
+                text("EXISTS (SELECT 1 FROM unnest(queries) AS query WHERE query LIKE :search_text)")
+            ).params(search_text='%' + search_text_query.strip() + '%')
+        elif search_text_url:
+            query = query.filter(QueryUrlsMerge.url.like(f"%{search_text_url.strip()}%"))
+        if sort_desc is not None:
+            query = query.order_by(desc(QueryUrlsMerge.url) if sort_desc else QueryUrlsMerge.url)
+
+        async for row in _stream_rows(self.session, query):
+            yield row
+
     async def get_merge_queries(self, date_start, date_end, queries: List[str]):
-        sub = select(Query).where(Query.query.in_(queries)).subquery()
         query = select(MetricsQuery.date, MetricsQuery.position, MetricsQuery.clicks, MetricsQuery.impression,
-                       MetricsQuery.ctr, sub).join(sub,
-                                                   MetricsQuery.query == sub.c.query).group_by(
-            sub.c.query,
-            MetricsQuery.date,
-            MetricsQuery.position,
-            MetricsQuery.clicks,
-            MetricsQuery.impression,
-            MetricsQuery.ctr,
-        ).having(and_(MetricsQuery.date <= date_end, MetricsQuery.date >= date_start))
+                       MetricsQuery.ctr, MetricsQuery.query).where(
+            and_(MetricsQuery.query.in_(queries), MetricsQuery.date >= date_start, MetricsQuery.date <= date_end))
         res = await self.session.execute(query)
         product_row = res.fetchall()
         if len(product_row) != 0:
@@ -0,0 +1,38 @@
+import asyncio
+
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from sqlalchemy import select
+
+from api.config.models import Config
+from config import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+from db.session import async_session_general
+
+
+def upgrade_tenant_database(database_name: str, revision: str = "head") -> None:
+    # Применение миграций Alembic к базе конфига
+    alembic_cfg = AlembicConfig("alembic.ini")
+    alembic_cfg.set_main_option("sqlalchemy.url",
+                                f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{database_name}")
+    command.upgrade(alembic_cfg, revision)
+
+
+async def upgrade_all_tenant_databases(revision: str = "head") -> dict[str, str]:
+    async with async_session_general() as session:
+        database_names = (await session.execute(select(Config.database_name).distinct())).scalars().all()
+
+    result = {}
+    for database_name in database_names:
+        try:
+            # alembic синхронный, поэтому выполняем в отдельном потоке
+            await asyncio.to_thread(upgrade_tenant_database, database_name, revision)
+            result[database_name] = "ok"
+            print(f"UPGRADE DATABASE {database_name}: successfully")
+        except Exception as e:
+            result[database_name] = str(e)
+            print(f"UPGRADE DATABASE {database_name}: {e}")
+    return result
+
+
+if __name__ == '__main__':
+    asyncio.run(upgrade_all_tenant_databases())
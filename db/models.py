@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Float, Enum, ARRAY
+from sqlalchemy import Float, Enum, ARRAY, Index, UniqueConstraint
 from sqlalchemy import Column
 from sqlalchemy import String
 from sqlalchemy import Integer
@@ -15,12 +15,22 @@ Base = declarative_base()
 
 class Url(Base):
     __tablename__ = "url"
+    __table_args__ = (
+        Index("ix_url_url_trgm", "url", postgresql_using="gin", postgresql_ops={"url": "gin_trgm_ops"}),
+    )
 
     url = Column(String, nullable=False, unique=True, primary_key=True)
 
 
 class Metrics(Base):
     __tablename__ = "metrics"
+    __table_args__ = (
+        Index("ix_metrics_url_date", "url", "date",
+              postgresql_include=["position", "clicks", "impression", "ctr"]),
+        Index("ix_metrics_date_position", "date", "position", postgresql_include=["url"]),
+        Index("ix_metrics_date_clicks", "date", "clicks", postgresql_include=["url"]),
+        Index("ix_metrics_date_impression", "date", "impression", postgresql_include=["url"]),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     url = Column(String, nullable=False)
@@ -34,12 +44,22 @@ class Metrics(Base):
 
 class Query(Base):
     __tablename__ = "query"
+    __table_args__ = (
+        Index("ix_query_query_trgm", "query", postgresql_using="gin", postgresql_ops={"query": "gin_trgm_ops"}),
+    )
 
     query = Column(String, nullable=False, unique=True, primary_key=True)
 
 
 class MetricsQuery(Base):
     __tablename__ = "metrics_query"
+    __table_args__ = (
+        Index("ix_metrics_query_query_date", "query", "date",
+              postgresql_include=["position", "clicks", "impression", "ctr"]),
+        Index("ix_metrics_query_date_position", "date", "position", postgresql_include=["query"]),
+        Index("ix_metrics_query_date_clicks", "date", "clicks", postgresql_include=["query"]),
+        Index("ix_metrics_query_date_impression", "date", "impression", postgresql_include=["query"]),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     query = Column(String, nullable=False)
@@ -64,6 +84,10 @@ class QueryIndicator(Base):
 
 class QueryUrlsMerge(Base):
     __tablename__ = "query_urls_merge"
+    __table_args__ = (
+        Index("ix_query_urls_merge_url_trgm", "url", postgresql_using="gin", postgresql_ops={"url": "gin_trgm_ops"}),
+        Index("ix_query_urls_merge_date_url", "date", "url"),
+    )
 
     id = Column(Integer, nullable=False, primary_key=True, autoincrement=True)
     url = Column(String, nullable=False, primary_key=True)
@@ -96,4 +120,20 @@ class LastUpdateDate(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     date = Column(DateTime, nullable=False)
-    metrics_type = Column(String, nullable=False)
\ No newline at end of file
+    metrics_type = Column(String, nullable=False)
+
+
+class MetricsDailySummary(Base):
+    __tablename__ = "metrics_daily_summary"
+    __table_args__ = (
+        UniqueConstraint("metrics_type", "date", name="uq_metrics_daily_summary_type_date"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    metrics_type = Column(String, nullable=False)
+    date = Column(DateTime, nullable=False)
+    clicks = Column(Float, nullable=False)
+    impression = Column(Float, nullable=False)
+    not_void_count = Column(Integer, nullable=False)
+    position = Column(Float, nullable=False)
+    count = Column(Integer, nullable=False)
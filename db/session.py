@@ -1,10 +1,14 @@
+import asyncio
+import time
+import weakref
+from collections import OrderedDict
 from typing import Generator
 
 from fastapi import Depends
 
 import config
 
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
 
@@ -29,16 +33,134 @@ engine_general = create_async_engine(
 async_session_general = sessionmaker(engine_general, expire_on_commit=False, class_=AsyncSession)
 
 
-async def connect_db(db_name: str):
-    db_name_bound = f"{db_name}"
-    try:
-        REAL_DATABASE_URL = f"postgresql+asyncpg://{config.DB_USER}:{config.DB_PASSWORD}@{config.DB_HOST}:{config.DB_PORT}/{db_name_bound}"
-        engine = create_async_engine(
+class TenantEngineRegistry:
+    """Process-wide registry of tenant engines keyed by database name.
+
+    Every connect_db caller gets its own sessionmaker bound to the shared engine. The engine counts
+    as held while any of these sessionmakers is alive (background jobs keep theirs for the whole run)
+    or while it has checked out connections; only engines nobody holds are disposed.
+    """
+
+    def __init__(
+            self,
+            pool_size: int = config.TENANT_POOL_SIZE,
+            max_overflow: int = config.TENANT_MAX_OVERFLOW,
+            pool_recycle: int = config.TENANT_POOL_RECYCLE,
+            engines_limit: int = config.TENANT_ENGINES_LIMIT,
+            idle_ttl: int = config.TENANT_ENGINE_IDLE_TTL,
+    ):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_recycle = pool_recycle
+        self.engines_limit = engines_limit
+        self.idle_ttl = idle_ttl
+        self._engines: OrderedDict[str, AsyncEngine] = OrderedDict()
+        self._holders: dict[str, weakref.WeakSet] = {}
+        self._last_used: dict[str, float] = {}
+        self._lock = asyncio.Lock()
+        self.created = 0
+        self.evicted = 0
+
+    def _create_engine(self, db_name: str) -> AsyncEngine:
+        REAL_DATABASE_URL = f"postgresql+asyncpg://{config.DB_USER}:{config.DB_PASSWORD}@{config.DB_HOST}:{config.DB_PORT}/{db_name}"
+        return create_async_engine(
             REAL_DATABASE_URL,
             future=True,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=True,
             execution_options={"isolation_level": "AUTOCOMMIT"},
         )
-        async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+    async def get_session(self, db_name: str) -> sessionmaker:
+        async with self._lock:
+            engine = self._engines.get(db_name)
+            if engine is not None:
+                self._engines.move_to_end(db_name)
+            else:
+                engine = self._create_engine(db_name)
+                self._engines[db_name] = engine
+                self._holders[db_name] = weakref.WeakSet()
+                self.created += 1
+            self._last_used[db_name] = time.monotonic()
+
+            # своя фабрика сессий на вызывающего: пока на нее есть ссылка, движок не вытесняется
+            async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            self._holders[db_name].add(async_session)
+
+            await self._evict()
+            return async_session
+
+    def _is_idle(self, db_name: str) -> bool:
+        return not self._holders[db_name] and self._engines[db_name].pool.checkedout() == 0
+
+    async def _evict(self, idle_ttl: int | None = None):
+        # Вытесняем давно не использованные движки сверх лимита (а с idle_ttl - и простаивающие дольше него),
+        # если их никто не держит
+        now = time.monotonic()
+        for db_name in list(self._engines):
+            over_limit = len(self._engines) > self.engines_limit
+            expired = idle_ttl is not None and now - self._last_used[db_name] >= idle_ttl
+            if not (over_limit or expired) or not self._is_idle(db_name):
+                continue
+            await self._remove(db_name)
+            self.evicted += 1
+
+    async def _remove(self, db_name: str):
+        engine = self._engines.pop(db_name)
+        del self._holders[db_name]
+        del self._last_used[db_name]
+        await engine.dispose()
+
+    async def sweep_idle(self):
+        """Плановая чистка: закрывает движки без держателей, не использованные дольше idle_ttl"""
+        async with self._lock:
+            await self._evict(self.idle_ttl)
+
+    async def dispose(self, db_name: str | None = None):
+        async with self._lock:
+            names = [db_name] if db_name else list(self._engines)
+            for name in names:
+                if name in self._engines:
+                    await self._remove(name)
+
+    def stats(self) -> dict:
+        tenants = {}
+        for db_name, engine in self._engines.items():
+            pool = engine.pool
+            tenants[db_name] = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "holders": len(self._holders[db_name]),
+            }
+        return {
+            "engines": len(self._engines),
+            "engines_limit": self.engines_limit,
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "max_connections": self.engines_limit * (self.pool_size + self.max_overflow),
+            "idle_ttl": self.idle_ttl,
+            "created": self.created,
+            "evicted": self.evicted,
+            "tenants": tenants,
+        }
+
+
+tenant_engines = TenantEngineRegistry()
+
+
+def get_db_name(async_session: sessionmaker) -> str:
+    """Имя БД тенанта по фабрике сессий из connect_db"""
+    return async_session.kw["bind"].url.database
+
+
+async def connect_db(db_name: str):
+    db_name_bound = f"{db_name}"
+    try:
+        async_session = await tenant_engines.get_session(db_name_bound)
     except Exception as e:
         print("Ошибка при подключении к БД:", e)
         return -1
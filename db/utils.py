@@ -1,5 +1,8 @@
 from sqlalchemy import select, distinct, func
 
+from db.session import get_db_name
+from services.response_cache import response_cache
+
 date_format = "%Y-%m-%d"
 
 
@@ -17,6 +20,8 @@ async def add_last_update_date(session, db_name, date):
 
         await s.commit()
 
+    await response_cache.invalidate(get_db_name(session))
+
 
 async def get_all_dates(session, db_name):
     async with session() as s:
@@ -22,14 +22,25 @@ from api.config.router import router as config_router
 
 from api.auth.router import router as auth_router
 from config import SECRET
+from db.session import tenant_engines
+from services.export_jobs import fail_interrupted_export_jobs, purge_export_jobs
+from services.load_jobs import fail_interrupted_load_jobs
+from services.responses import CompressionMiddleware, ORJSONResponse
+from services.serp_cache import purge_serp_cache
 from scheduler import CronTrigger, scheduler
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await fail_interrupted_load_jobs()
+    await fail_interrupted_export_jobs()
     scheduler.start()
     scheduler.add_job(print_scheduler_jobs, trigger=CronTrigger(second="*/10", day_of_week="0,1,2,3"), id="scheduler jobs logger")
+    scheduler.add_job(purge_serp_cache, trigger=CronTrigger(hour=3), id="serp cache purge")
+    scheduler.add_job(purge_export_jobs, trigger=CronTrigger(minute=0), id="export jobs purge")
+    scheduler.add_job(tenant_engines.sweep_idle, trigger=CronTrigger(minute="*"), id="tenant engines sweep")
     yield
+    await tenant_engines.dispose()
 
 
 async def print_scheduler_jobs():
@@ -40,6 +51,7 @@ app = FastAPI(
     redoc_url=None,
     docs_url="/docs",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -62,6 +74,8 @@ app.add_middleware(
 
 app.add_middleware(SessionMiddleware, secret_key=SECRET)
 
+app.add_middleware(CompressionMiddleware)
+
 main_api_router = APIRouter()
 main_api_router.include_router(admin_router, prefix="/admin")
 
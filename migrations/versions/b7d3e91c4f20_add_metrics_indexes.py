@@ -0,0 +1,55 @@
+"""add metrics indexes
+
+Revision ID: b7d3e91c4f20
+Revises: 5a94ef525b78
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e91c4f20'
+down_revision = '5a94ef525b78'
+branch_labels = None
+depends_on = None
+
+
+# (имя индекса, таблица, определение)
+INDEXES = [
+    # выборка метрик страницы: join по url/query + диапазон дат
+    ("ix_metrics_url_date", "metrics",
+     "(url, date) INCLUDE (position, clicks, impression, ctr)"),
+    ("ix_metrics_query_query_date", "metrics_query",
+     "(query, date) INCLUDE (position, clicks, impression, ctr)"),
+
+    # сортировка по метрике на выбранную дату, get_approach_query
+    ("ix_metrics_date_position", "metrics", "(date, position) INCLUDE (url)"),
+    ("ix_metrics_date_clicks", "metrics", "(date, clicks) INCLUDE (url)"),
+    ("ix_metrics_date_impression", "metrics", "(date, impression) INCLUDE (url)"),
+    ("ix_metrics_query_date_position", "metrics_query", "(date, position) INCLUDE (query)"),
+    ("ix_metrics_query_date_clicks", "metrics_query", "(date, clicks) INCLUDE (query)"),
+    ("ix_metrics_query_date_impression", "metrics_query", "(date, impression) INCLUDE (query)"),
+
+    # поиск like('%text%')
+    ("ix_url_url_trgm", "url", "USING gin (url gin_trgm_ops)"),
+    ("ix_query_query_trgm", "query", "USING gin (query gin_trgm_ops)"),
+    ("ix_query_urls_merge_url_trgm", "query_urls_merge", "USING gin (url gin_trgm_ops)"),
+
+    ("ix_query_urls_merge_date_url", "query_urls_merge", "(date, url)"),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, definition in INDEXES:
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition}")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
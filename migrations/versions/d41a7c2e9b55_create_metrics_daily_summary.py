@@ -0,0 +1,47 @@
+"""create metrics daily summary
+
+Revision ID: d41a7c2e9b55
+Revises: b7d3e91c4f20
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a7c2e9b55'
+down_revision = 'b7d3e91c4f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('metrics_daily_summary',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('metrics_type', sa.String(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('clicks', sa.Float(), nullable=False),
+    sa.Column('impression', sa.Float(), nullable=False),
+    sa.Column('not_void_count', sa.Integer(), nullable=False),
+    sa.Column('position', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('metrics_type', 'date', name='uq_metrics_daily_summary_type_date')
+    )
+
+    # Заполняем сводку по уже загруженным данным
+    for metrics_type, table in (("url", "metrics"), ("query", "metrics_query")):
+        op.execute(f"""
+            INSERT INTO metrics_daily_summary (metrics_type, date, clicks, impression, not_void_count, position, count)
+            SELECT '{metrics_type}', date, coalesce(sum(clicks), 0), coalesce(sum(impression), 0),
+                   count(*) FILTER (WHERE position > 0),
+                   coalesce(avg(position) FILTER (WHERE position > 0), 0),
+                   count(*)
+            FROM {table}
+            GROUP BY date
+        """)
+
+
+def downgrade() -> None:
+    op.drop_table('metrics_daily_summary')
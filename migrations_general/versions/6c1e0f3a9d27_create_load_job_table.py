@@ -0,0 +1,47 @@
+"""create load job table
+
+Revision ID: 6c1e0f3a9d27
+Revises: 292230311e1f
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+LOAD_JOB_STATUS_ENUM_NAME = 'loadjobstatus'
+
+# revision identifiers, used by Alembic.
+revision: str = '6c1e0f3a9d27'
+down_revision: Union[str, None] = '292230311e1f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('load_job',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('config_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('status', sa.Enum('queued', 'running', 'done', 'failed', name=LOAD_JOB_STATUS_ENUM_NAME), nullable=False),
+    sa.Column('author', sa.Integer(), nullable=True),
+    sa.Column('pages_done', sa.Integer(), nullable=False),
+    sa.Column('pages_total', sa.Integer(), nullable=True),
+    sa.Column('rows_written', sa.Integer(), nullable=False),
+    sa.Column('message', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['config_id'], ['config.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['author'], ['user.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('uq_load_job_active', 'load_job', ['config_id', 'kind'], unique=True,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+
+def downgrade() -> None:
+    op.drop_index('uq_load_job_active', table_name='load_job')
+    op.drop_table('load_job')
+    op.execute(f"DROP TYPE {LOAD_JOB_STATUS_ENUM_NAME}")
@@ -0,0 +1,41 @@
+"""create live search run table
+
+Revision ID: a83f2d6b1c04
+Revises: 6c1e0f3a9d27
+Create Date: 2026-10-18 15:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a83f2d6b1c04'
+down_revision: Union[str, None] = '6c1e0f3a9d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('live_search_run',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('lr_list_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('queries_total', sa.Integer(), nullable=False),
+    sa.Column('done_query_ids', sa.ARRAY(sa.Integer()), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['lr_list_id'], ['list_lr_search_system.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_live_search_run_lr_list_id_date', 'live_search_run', ['lr_list_id', 'date'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_live_search_run_lr_list_id_date', table_name='live_search_run')
+    op.drop_table('live_search_run')
@@ -0,0 +1,55 @@
+"""create export job table
+
+Revision ID: b8d4e6f2a7c1
+Revises: e5b7c9a1f3d2
+Create Date: 2026-10-18 19:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# тип создан миграцией load_job
+LOAD_JOB_STATUS_ENUM_NAME = 'loadjobstatus'
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d4e6f2a7c1'
+down_revision: Union[str, None] = 'e5b7c9a1f3d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('export_job',
+    sa.Column('id', sa.Uuid(), nullable=False),
+    sa.Column('config_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('format', sa.String(), nullable=False),
+    sa.Column('params', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('params_hash', sa.String(), nullable=False),
+    sa.Column('status', postgresql.ENUM('queued', 'running', 'done', 'failed', name=LOAD_JOB_STATUS_ENUM_NAME,
+                                        create_type=False), nullable=False),
+    sa.Column('author', sa.Integer(), nullable=True),
+    sa.Column('rows_done', sa.Integer(), nullable=False),
+    sa.Column('rows_total', sa.Integer(), nullable=True),
+    sa.Column('file_path', sa.String(), nullable=True),
+    sa.Column('file_size', sa.Integer(), nullable=True),
+    sa.Column('message', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['config_id'], ['config.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['author'], ['user.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_export_job_dedupe', 'export_job', ['config_id', 'params_hash', 'created_at'], unique=False)
+    op.create_index(op.f('ix_export_job_expires_at'), 'export_job', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_export_job_expires_at'), table_name='export_job')
+    op.drop_index('ix_export_job_dedupe', table_name='export_job')
+    op.drop_table('export_job')
@@ -0,0 +1,38 @@
+"""create serp cache table
+
+Revision ID: e5b7c9a1f3d2
+Revises: a83f2d6b1c04
+Create Date: 2026-10-18 17:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b7c9a1f3d2'
+down_revision: Union[str, None] = 'a83f2d6b1c04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('serp_cache',
+    sa.Column('search_system', sa.String(), nullable=False),
+    sa.Column('lr', sa.String(), nullable=False),
+    sa.Column('query', sa.String(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('results', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('hits', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('search_system', 'lr', 'query', 'date')
+    )
+    op.create_index(op.f('ix_serp_cache_date'), 'serp_cache', ['date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_serp_cache_date'), table_name='serp_cache')
+    op.drop_table('serp_cache')
@@ -0,0 +1,92 @@
+"""Микробенчмарк разбора ответов xmlstock (Yandex XML).
+
+Сравнивает прежний разбор (ET.fromstring + findall/find по XPath на каждую группу)
+с потоковым iter_yandex_groups. Время - процессорное на один ответ: именно его
+event loop тратит на каждый запрос живого поиска при высокой параллельности.
+
+    python -m scripts.bench_serp_xml [каталог с сохраненными *.xml] [--domain example.ru]
+
+Без каталога ответы генерируются по образцу выдачи xmlstock.
+"""
+import argparse
+import pathlib
+import time
+import xml.etree.ElementTree as ET
+
+from services.serp_xml import iter_yandex_groups
+
+DOC_TEMPLATE = """<group><categ attr="d" name="{domain}"/><doccount>1</doccount><relevance/>
+<doc id="Z{i}"><relevance/><url>https://{domain}/catalog/item-{i}/</url><domain>{domain}</domain>
+<title>Товар <hlword>{i}</hlword> купить в интернет-магазине</title>
+<headline>Описание товара {i}, доставка по всей России, гарантия производителя.</headline>
+<modtime>20240501T120000</modtime><size>{size}</size><charset>utf-8</charset>
+<passages><passage>Купить товар {i} по выгодной цене с доставкой.</passage></passages>
+<properties><_PassagesType>0</_PassagesType><lang>ru</lang></properties>
+<mime-type>text/html</mime-type><saved-copy-url>https://hghltd.yandex.net/yandbtm?text={i}</saved-copy-url></doc></group>"""
+
+
+def make_response(groups: int, target_position: int | None, target_domain: str) -> bytes:
+    docs = []
+    for i in range(1, groups + 1):
+        domain = target_domain if i == target_position else f"site{i}.ru"
+        docs.append(DOC_TEMPLATE.format(i=i, domain=domain, size=1000 + i))
+    return ("<?xml version=\"1.0\" encoding=\"utf-8\"?><yandexsearch version=\"1.0\"><request/>"
+            "<response date=\"20240501T120000\"><reqid>1</reqid><found priority=\"all\">1000</found>"
+            "<results><grouping attr=\"d\" mode=\"deep\" groups-on-page=\"100\" docs-in-group=\"1\">"
+            f"{''.join(docs)}</grouping></results></response></yandexsearch>").encode("utf-8")
+
+
+def legacy_find(body: bytes, target_domain: str):
+    # прежний разбор: декодирование в текст и обратно, XPath-поиск от корня для каждой группы
+    root = ET.fromstring(body.decode("utf-8").encode("utf-8"))
+    found = None
+    group_count = len(root.findall(".//group"))
+    for i in range(1, group_count + 1):
+        domain = root.find(f".//group[{i}]/doc/domain").text
+        url = root.find(f".//group[{i}]/doc/url")
+        url = url.text if url is not None else "URL не найден"
+        if domain == target_domain and found is None:
+            found = (url, i)
+    return found
+
+
+def streaming_find(body: bytes, target_domain: str):
+    for position, url, domain in iter_yandex_groups(body):
+        if domain == target_domain:
+            return url, position
+    return None
+
+
+def measure(func, bodies, target_domain, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for body in bodies:
+            func(body, target_domain)
+    return (time.process_time() - start) / (repeat * len(bodies)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("responses", nargs="?", help="каталог с сохраненными ответами xmlstock (*.xml)")
+    parser.add_argument("--domain", default="example.ru")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.responses:
+        bodies = [path.read_bytes() for path in sorted(pathlib.Path(args.responses).glob("*.xml"))]
+        cases = [(f"{args.responses} ({len(bodies)} ответов)", bodies)]
+    else:
+        cases = []
+        for groups in (10, 50, 100):
+            for position, label in ((3, "в топ-3"), (groups, "последний"), (None, "нет в выдаче")):
+                cases.append((f"{groups} групп, сайт {label}", [make_response(groups, position, args.domain)]))
+
+    for name, bodies in cases:
+        assert all(legacy_find(b, args.domain) == streaming_find(b, args.domain) for b in bodies)
+        legacy = measure(legacy_find, bodies, args.domain, args.repeat)
+        streaming = measure(streaming_find, bodies, args.domain, args.repeat)
+        print(f"{name:<40} findall/find: {legacy:9.1f} мкс   iterparse: {streaming:9.1f} мкс   x{legacy / streaming:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Бенчмарк ответа /admin/url/: сериализация и сжатие.
+
+Страница url (50 строк) за 7/30/90 дней в html-режиме (как ее строит get_urls) и в компактном
+формате (format: "compact"). Для каждой - время сериализации прежним путем
+(jsonable_encoder + JSONResponse) и через ORJSONResponse, размер ответа без сжатия, с gzip
+и с brotli (если установлен) и время сжатия.
+
+    python -m scripts.bench_url_payload [--rows 50] [--repeat 20]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from const import date_format_2
+from services.metric_matrix import MetricMatrix
+from services.responses import ORJSONResponse, brotli, compress
+from services.table_payload import compact_response, metrics_page
+
+
+def make_grouped_data(rows: int, days: int) -> list:
+    """Строки _metrics_page_query: по строке на url и день"""
+    end_date = datetime(2024, 6, 30)
+    grouped_data = []
+    for i in range(rows):
+        url = f"https://example.ru/catalog/section-{i % 7}/item-{i}/"
+        stats = []
+        for day in range(days):
+            position = round(random.uniform(1, 60), 2)
+            clicks = random.randint(0, 40)
+            impression = random.randint(clicks, 400)
+            ctr = round(clicks * 100 / impression, 2) if impression else 0
+            stats.append((end_date - timedelta(days=days - day - 1), position, clicks, impression, ctr,
+                          Decimal("12.34"), 500, 7000, Decimal("7.14"), url, url))
+        grouped_data.append((url, stats))
+    return grouped_data
+
+
+def html_page(grouped_data: list) -> list[dict]:
+    # та же разметка, что в get_urls
+    data = []
+    for key, stats in grouped_data:
+        res = {"url": f"<div style='width:355px; height: 55px; overflow: auto; white-space: nowrap;'><span>{key}</span></div>"}
+        for k, stat in enumerate(stats):
+            up = 0
+            if k + 1 < len(stats):
+                up = round(stats[k][1] - stats[k - 1][1], 2)
+            color, color_text = "#9DE8BD", "green"
+            if up > 0:
+                color, color_text = "#FDC4BD", "red"
+            if stat[1] <= 3:
+                color, color_text = "#B4D7ED", "blue"
+            res[stat[0].strftime(date_format_2)] = f"""<div style='height: 55px; width: 100px; margin: 0px; padding: 0px; background-color: {color}'>
+              <span style='font-size: 18px'>{stat[1]}</span><span style="margin-left: 5px; font-size: 10px; color: {color_text}">{abs(up)}</span><br>
+              <span style='font-size: 10px'>Клики</span><span style='font-size: 10px; margin-left: 10px'>CTR {stat[4]}%</span><br>
+              <span style='font-size: 10px'>{stat[2]}</span> <span style='font-size: 10px; margin-left: 20px'>R {int(stat[3])}</span>
+              </div>"""
+        result_position, total_clicks, impressions, result_ctr = stats[0][5:9]
+        res["result"] = f"""<div style='height: 55px; width: 100px; margin: 0px; padding: 0px; background-color: #9DE8BD'>
+                              <span style='font-size: 15px'>Позиция:{result_position}</span>
+                              <span style='font-size: 15px'>Клики:{total_clicks}</span>
+                              <span style='font-size: 8px'>Показы:{impressions}</span>
+                              <span style='font-size: 7px'>ctr:{result_ctr}%</span>
+                              </div>"""
+        data.append(res)
+    return data
+
+
+def measure(func, repeat: int) -> tuple[float, object]:
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    random.seed(1)
+
+    encodings = ["gzip", "br"] if brotli is not None else ["gzip"]
+    if brotli is None:
+        print("brotli не установлен - только gzip")
+
+    for days in (7, 30, 90):
+        grouped_data = make_grouped_data(args.rows, days)
+
+        build_html, data = measure(lambda: html_page(grouped_data), args.repeat)
+        legacy, body = measure(lambda: JSONResponse({"data": jsonable_encoder(data), "cursor": None}).body,
+                               args.repeat)
+        orjson_html, orjson_body = measure(lambda: ORJSONResponse({"data": data, "cursor": None}).body, args.repeat)
+        rows = [stat for _, stats in grouped_data for stat in stats]
+        build_compact, compact_body = measure(
+            lambda: compact_response(metrics_page(MetricMatrix.from_rows(rows))).body, args.repeat)
+        assert len(orjson_body) == len(body.decode().encode())
+
+        print(f"\n{args.rows} url x {days} дней")
+        print(f"  html:    разметка {build_html:7.2f} мс, jsonable_encoder+json {legacy:7.2f} мс, "
+              f"orjson {orjson_html:7.2f} мс")
+        print(f"  compact: матрица, сборка и orjson {build_compact:7.2f} мс")
+        for name, payload in (("html", orjson_body), ("compact", compact_body)):
+            sizes = [f"{len(payload) / 1024:8.1f} КБ"]
+            for encoding in encodings:
+                elapsed, compressed = measure(lambda: compress(payload, encoding), max(args.repeat // 4, 1))
+                sizes.append(f"{encoding} {len(compressed) / 1024:7.1f} КБ ({elapsed:6.2f} мс)")
+            print(f"  {name:<8} {'   '.join(sizes)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+from functools import lru_cache
+import urllib.parse
+
+import idna
+
+HOST_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=HOST_CACHE_SIZE)
+def decode_host(host: str) -> str:
+    """Хост в юникоде и нижнем регистре (xn--...  ->  кириллица). Кэш общий для всех прогонов."""
+    host = host.strip().rstrip(".").lower()
+    try:
+        return idna.decode(host)
+    except (idna.IDNAError, UnicodeError):
+        return host  # Если ошибка, оставляем как есть
+
+
+class DomainMatcher:
+    """Проверка, что результат выдачи принадлежит сайту: хост совпадает с доменом сайта
+    или является его поддоменом. Строится один раз на прогон.
+
+    Домен сайта можно передать как "site.ru", "https://site.ru/" или "https:site.ru:443" (host_id Вебмастера).
+    """
+
+    def __init__(self, main_domain: str):
+        main_domain = main_domain.strip()
+        if main_domain.startswith(("http:", "https:")) and "//" not in main_domain:
+            # host_id Вебмастера: "https:site.ru:443"
+            main_domain = main_domain.split(":")[1]
+        if "//" not in main_domain:
+            main_domain = f"//{main_domain}"
+        self.domain = decode_host(urllib.parse.urlsplit(main_domain).hostname or "")
+        self._suffix = f".{self.domain}"
+
+    def match_host(self, host: str) -> bool:
+        host = decode_host(host)
+        return bool(self.domain) and (host == self.domain or host.endswith(self._suffix))
+
+    def match_url(self, url: str) -> bool:
+        return bool(self.domain) and self.match_host(urllib.parse.urlsplit(url).hostname or "")
@@ -0,0 +1,214 @@
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, select, update
+
+from api.actions.actions import get_last_load_marker
+from api.config.models import ExportJob, LoadJobStatus
+from config import EXPORT_DEDUPE_WINDOW, EXPORT_DIR, EXPORT_RETENTION_HOURS
+from db.session import async_session_general, connect_db
+from services.load_jobs import ACTIVE_STATUSES
+from services.metrics_export import XLSX_MEDIA_TYPE, count_export_rows, iter_csv, iter_export_rows, write_xlsx
+
+EXPORT_KINDS = ("url", "query")
+EXPORT_FORMATS = {"csv": "text/csv", "xlsx": XLSX_MEDIA_TYPE}
+
+# поля тела запроса, которые относятся к странице таблицы, а не к содержимому отчета
+PAGE_KEYS = ("length", "start", "cursor")
+HEADER_ROWS = 2
+
+# задачи выгрузок этого процесса; ссылки держим, чтобы задачи не собрал GC
+_tasks: dict[uuid.UUID, asyncio.Task] = {}
+# поиск такой же выгрузки и постановка новой не должны пересекаться
+_start_lock = asyncio.Lock()
+
+
+class ExportProgress:
+    """Счетчик строк отчета. В базу пишется не чаще раза в FLUSH_INTERVAL секунд."""
+
+    FLUSH_INTERVAL = 2
+
+    def __init__(self, job_id: uuid.UUID):
+        self.job_id = job_id
+        self.rows_done = 0
+        self.rows_total = None
+        self._flushed_at = 0.0
+
+    async def set_total(self, rows_total: int):
+        self.rows_total = rows_total
+        await self.flush()
+
+    async def track(self, rows):
+        """Пропускает строки отчета дальше, считая строки данных"""
+        count = 0
+        async for row in rows:
+            yield row
+            count += 1
+            if count > HEADER_ROWS:
+                self.rows_done += 1
+                loop_time = asyncio.get_running_loop().time()
+                if loop_time - self._flushed_at >= self.FLUSH_INTERVAL:
+                    await self.flush()
+
+    async def flush(self, **fields):
+        self._flushed_at = asyncio.get_running_loop().time()
+        await _update_job(self.job_id, rows_done=self.rows_done, rows_total=self.rows_total, **fields)
+
+
+async def _update_job(job_id: uuid.UUID, **fields):
+    async with async_session_general() as session:
+        await session.execute(update(ExportJob).where(ExportJob.id == job_id).values(**fields))
+        await session.commit()
+
+
+def export_params_hash(database_name: str, kind: str, fmt: str, params: dict, load_marker: str = "") -> str:
+    """load_marker - последняя загрузка тенанта: после новой загрузки тот же запрос дает новый отчет"""
+    normalized = json.dumps({"database_name": database_name, "kind": kind, "format": fmt, "params": params,
+                             "load_marker": load_marker},
+                            sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def export_path(job_id: uuid.UUID, fmt: str) -> str:
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return os.path.join(EXPORT_DIR, f"{job_id}.{fmt}")
+
+
+def _remove_file(path: str | None):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+async def _write_csv(rows, path: str):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        async for chunk in iter_csv(rows):
+            await asyncio.to_thread(f.write, chunk)
+
+
+async def _run_export_job(job_id: uuid.UUID, kind: str, fmt: str, params: dict, database_name: str):
+    progress = ExportProgress(job_id)
+    await _update_job(job_id, status=LoadJobStatus.running, started_at=datetime.now())
+    path = export_path(job_id, fmt)
+    # пока отчет пишется, файл лежит под другим именем и не отдается
+    part_path = f"{path}.part"
+    try:
+        async_session = await connect_db(database_name)
+        if async_session == -1:
+            raise RuntimeError("Нет подключения к БД")
+        await progress.set_total(await count_export_rows(kind, params, async_session))
+        rows = progress.track(iter_export_rows(kind, params, async_session))
+        if fmt == "xlsx":
+            await write_xlsx(rows, part_path)
+        else:
+            await _write_csv(rows, part_path)
+        os.replace(part_path, path)
+    except Exception as e:
+        print(f"Ошибка выгрузки отчета {kind} ({job_id}): {e}")
+        _remove_file(part_path)
+        await progress.flush(status=LoadJobStatus.failed, message=str(e), finished_at=datetime.now())
+        return
+
+    finished_at = datetime.now()
+    await progress.flush(status=LoadJobStatus.done, file_path=path, file_size=os.path.getsize(path),
+                         finished_at=finished_at, expires_at=finished_at + timedelta(hours=EXPORT_RETENTION_HOURS))
+
+
+async def start_export_job(kind: str, fmt: str, data_request: dict, request_session: dict,
+                           user_id: int | None) -> tuple[ExportJob, bool]:
+    """Ставит выгрузку отчета в очередь. Если такой же отчет этого конфига по тем же данным (без новых
+    загрузок) уже готов или готовится (за последние EXPORT_DEDUPE_WINDOW секунд), возвращает его (created=False)."""
+    config = request_session["config"]
+    params = {key: value for key, value in data_request.items() if key not in PAGE_KEYS}
+    async_session = await connect_db(config["database_name"])
+    load_marker = await get_last_load_marker(async_session) if async_session != -1 else ""
+    params_hash = export_params_hash(config["database_name"], kind, fmt, params, load_marker)
+    now = datetime.now()
+
+    async with _start_lock:
+        async with async_session_general() as session:
+            recent = (await session.execute(
+                select(ExportJob).where(
+                    ExportJob.config_id == config["config_id"],
+                    ExportJob.params_hash == params_hash,
+                    ExportJob.created_at >= now - timedelta(seconds=EXPORT_DEDUPE_WINDOW),
+                    ExportJob.status != LoadJobStatus.failed,
+                    or_(ExportJob.expires_at.is_(None), ExportJob.expires_at > now),
+                ).order_by(ExportJob.created_at.desc())
+            )).scalars().first()
+            if recent is not None:
+                return recent, False
+
+            job = ExportJob(config_id=config["config_id"], kind=kind, format=fmt, params=params,
+                            params_hash=params_hash, author=user_id, status=LoadJobStatus.queued, rows_done=0,
+                            created_at=now)
+            session.add(job)
+            await session.commit()
+
+    task = asyncio.create_task(_run_export_job(job.id, kind, fmt, params, config["database_name"]))
+    _tasks[job.id] = task
+    task.add_done_callback(lambda _: _tasks.pop(job.id, None))
+    return job, True
+
+
+async def get_export_job(job_id: uuid.UUID) -> ExportJob | None:
+    async with async_session_general() as session:
+        return (await session.execute(select(ExportJob).where(ExportJob.id == job_id))).scalars().first()
+
+
+async def purge_export_jobs(retention_hours: int = EXPORT_RETENTION_HOURS):
+    """Удаляет просроченные отчеты с диска и их записи, а также старые записи неудачных выгрузок"""
+    now = datetime.now()
+    async with async_session_general() as session:
+        paths = (await session.execute(
+            delete(ExportJob).where(or_(
+                ExportJob.expires_at < now,
+                and_(ExportJob.status == LoadJobStatus.failed,
+                     ExportJob.created_at < now - timedelta(hours=retention_hours)),
+            )).returning(ExportJob.file_path)
+        )).scalars().all()
+        await session.commit()
+    for path in paths:
+        _remove_file(path)
+
+
+async def fail_interrupted_export_jobs():
+    """Как и выгрузки данных, отчеты пишутся в процессе приложения: после перезапуска их никто не допишет"""
+    async with async_session_general() as session:
+        await session.execute(
+            update(ExportJob).where(ExportJob.status.in_(ACTIVE_STATUSES)).values(
+                status=LoadJobStatus.failed,
+                message="Прервано перезапуском сервера",
+                finished_at=datetime.now(),
+            )
+        )
+        await session.commit()
+    for path in glob.glob(os.path.join(EXPORT_DIR, "*.part")):
+        _remove_file(path)
+
+
+def export_job_to_dict(job: ExportJob) -> dict:
+    percent = None
+    if job.rows_total:
+        percent = round(min(job.rows_done / job.rows_total, 1) * 100, 1)
+    elif job.rows_total == 0 and job.status == LoadJobStatus.done:
+        percent = 100.0
+    return {
+        "id": str(job.id),
+        "kind": job.kind,
+        "format": job.format,
+        "status": job.status.value,
+        "rows_done": job.rows_done,
+        "rows_total": job.rows_total,
+        "percent": percent,
+        "file_size": job.file_size,
+        "message": job.message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+    }
@@ -1,74 +1,30 @@
-import re
-import aiohttp
-import aiofiles
-import asyncio
-import xml.etree.ElementTree as ET
-import urllib.parse
-from datetime import datetime
 import sys
 
-import idna
+from services.domain_matcher import DomainMatcher
+from services.serp_fetcher import SerpFetcher
 
-from config import xml_config
 
-completed_task = 0
+def find_position(results, matcher):
+    for i, url, domain in results:
+        if matcher.match_url(url):
+            return [url, i]
+    return None
 
 
-async def urlencode_string(string):
-    return urllib.parse.quote(string)
-
-
-async def process_query(query, MAIN_DOMAIN, lr, query_info):
-    global completed_task
-    encoded_query = await urlencode_string(query)
-    API_URL = f"https://xmlstock.com/google/json/"
-    request_url = f"""{API_URL}?
-                    user={xml_config.USER_ID}&
-                    key={xml_config.API_KEY}&
-                    query={encoded_query}&
-                    groupby={xml_config.GROUP_BY}&
-                    domain={xml_config.DOMAIN}&
-                    lr={lr}&
-                    device={xml_config.DEVICE}"""
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(request_url) as response:
-                response_text = await response.json()
-                response_text_json = response_text["results"]
-                for key, value in response_text_json.items():
-                    url = value["url"]
-                    parsed_url = urllib.parse.urlparse(url)
-                    # Проверяем и декодируем домен
-                    try:
-                        decoded_netloc = idna.decode(parsed_url.netloc)
-                    except idna.IDNAError:
-                        decoded_netloc = parsed_url.netloc  # Если ошибка, оставляем как есть
-
-                    # Собираем обратно URL
-                    decoded_url = urllib.parse.urlunparse((parsed_url.scheme, decoded_netloc, parsed_url.path, parsed_url.params, parsed_url.query, parsed_url.fragment))
-                    pattern = fr'{re.escape(MAIN_DOMAIN)}'
-                    if re.search(pattern, decoded_url):
-                        if query not in query_info:
-                            query_info[query] = [value["url"], int(key)]
-    except Exception as e:
-        print(f"Error processing query '{query}': {e}", file=sys.stderr)
+async def iter_query_results(main_domain, lr, queries):
+    """(query, [url, позиция] или None) по мере получения выдачи"""
+    matcher = DomainMatcher(main_domain)
+    async with SerpFetcher("google") as fetcher:
+        async for query, found in fetcher.iter_results(queries, lr, lambda results: find_position(results, matcher)):
+            yield query, found
 
 
 async def run_script_async(main_domain, lr, queries):
-    tasks = []
     query_info = {}
-    for query in queries:
-        query = query.strip()
-        task = asyncio.create_task(process_query(query, main_domain, lr, query_info))
-        tasks.append(task)
-
-        await asyncio.gather(*tasks)
+    async for query, found in iter_query_results(main_domain, lr, [query.strip() for query in queries]):
+        if found:
+            query_info[query] = found
 
     print(f"Processing completed.", file=sys.stderr)
 
     return query_info
-
-
-# Запуск асинхронного процесса
-if __name__ == "__main__":
-    asyncio.run(run_script_async())
\ No newline at end of file
@@ -2,8 +2,6 @@ import asyncio
 from datetime import datetime, timedelta
 from itertools import groupby
 
-import requests
-
 from api.actions.actions import add_last_load_date
 from api.actions.indicators import _add_new_indicators, _add_top
 from api.actions.metrics_queries import _get_top_data_query
@@ -12,38 +10,32 @@ from api.actions.top import get_last_date_update_for
 from db.models import QueryIndicator, QueryUrlTop
 
 from db.session import connect_db
+from services.webmaster_client import WebmasterClient
 from db.utils import get_last_update_date
 
 date_format = "%Y-%m-%d"
 
 
-def create_url(USER_ID, HOST_ID):
+QUERY_INDICATORS = ("TOTAL_SHOWS", "TOTAL_CLICKS", "AVG_SHOW_POSITION", "AVG_CLICK_POSITION")
+
+
+def get_date_range():
     date_to = datetime.now() - timedelta(days=2)
     date_to = date_to.date()
     date_from = date_to - timedelta(days=365)
     print(f"date_from: {date_from} date_to: {date_to}")
-    return (f"https://api.webmaster.yandex.net/v4/user/{USER_ID}/hosts/{HOST_ID}/search-queries/all/history?"
-            f"query_indicator=TOTAL_SHOWS&"
-            f"query_indicator=TOTAL_CLICKS&"
-            f"query_indicator=AVG_SHOW_POSITION&"
-            f"query_indicator=AVG_CLICK_POSITION&"
-            f"date_from={date_from}&"
-            f"date_to={date_to}")
+    return date_from, date_to
 
 
 async def get_response(async_session, USER_ID, HOST_ID, ACCESS_TOKEN):
     print("Начало выгрузки")
-    URL = create_url(USER_ID, HOST_ID)
-    if URL == -1:
-        return -1
-    response = requests.get(URL, headers={'Authorization': f'OAuth {ACCESS_TOKEN}',
-                                          "Content-Type": "application/json; charset=UTF-8"})
-
-    return response
+    date_from, date_to = get_date_range()
+    async with WebmasterClient(ACCESS_TOKEN) as client:
+        return await client.get_search_queries_history(USER_ID, HOST_ID, date_from, date_to, QUERY_INDICATORS)
 
 
-async def add_data(response: requests.models.Response, async_session):
-    indicators = response.json()["indicators"]
+async def add_data(response: dict, async_session):
+    indicators = response["indicators"]
 
     data_for_db = list()
     data_for_total_ctr = dict()
@@ -116,7 +108,7 @@ async def add_top(async_session):
     await _add_top(add_values, async_session)
 
 
-async def main(request_session):
+async def main(request_session, progress=None):
     config, group = request_session["config"], request_session["group"]
     DATABASE_NAME, ACCESS_TOKEN, USER_ID, HOST_ID, group = (config['database_name'],
                                                             config['access_token'],
@@ -127,8 +119,12 @@ async def main(request_session):
 
     await add_last_load_date(async_session, "history")
 
+    if progress:
+        await progress.set_total(1)
     response = await get_response(async_session, USER_ID, HOST_ID, ACCESS_TOKEN)
-    await add_data(response, async_session)
+    data_for_db = await add_data(response, async_session)
+    if progress:
+        await progress.page_done(len(data_for_db))
     print("Indicators загружены. Начинаем загрузку TOP")
     await add_top(async_session)
     print("Выгрузка завершена")
@@ -1,14 +1,14 @@
 import asyncio
 from datetime import datetime
 from psycopg2 import IntegrityError
-import requests
 from sqlalchemy import select
 
-from db.models import LastUpdateDate, Query
+from db.models import LastUpdateDate
 from db.models import MetricsQuery
-from api.actions.queries import _add_new_urls
-from api.actions.metrics_queries import _add_new_metrics
+from api.actions.metrics_queries import _bulk_add_metrics
+from api.actions.daily_summary import _refresh_daily_summary
 from db.session import connect_db
+from services.webmaster_client import WebmasterClient
 from db.utils import get_last_update_date
 
 from api.actions.actions import add_last_load_date
@@ -19,10 +19,12 @@ from const import date_format
 
 
 async def add_data(data, last_update_date, async_session, mx_date=None):
+    # вся страница копится в буферах и пишется в базу одной транзакцией
+    new_urls = []
+    metrics = []
     for query in data['text_indicator_to_statistics']:
         query_name = query['text_indicator']['value']
-        new_url = [Query(query=query_name)]
-        metrics = []
+        new_urls.append(query_name)
         date = query['statistics'][0]["date"]
         data_add = {
             "date": date,
@@ -41,14 +43,14 @@ async def add_data(data, last_update_date, async_session, mx_date=None):
                 if mx_date:
                     mx_date[0] = max(mx_date[0], date)
                 if date > last_update_date:
-                    metrics.append(MetricsQuery(
-                        query=query_name,
-                        date=date,
-                        ctr=data_add['ctr'],
-                        position=data_add['position'],
-                        impression=data_add['impression'],
-                        demand=data_add['demand'],
-                        clicks=data_add['clicks']
+                    metrics.append((
+                        query_name,
+                        date,
+                        data_add['position'],
+                        data_add['ctr'],
+                        data_add['impression'],
+                        data_add['demand'],
+                        data_add['clicks'],
                     ))
                 date = el['date']
                 data_add = {
@@ -71,30 +73,11 @@ async def add_data(data, last_update_date, async_session, mx_date=None):
                 data_add["ctr"] = el["value"]
             elif field == "POSITION":
                 data_add["position"] = el["value"]
-        await _add_new_urls(new_url, async_session)
-        await _add_new_metrics(metrics, async_session)
-
-
-async def get_data_by_page(page, last_update_date, URL, ACCESS_TOKEN, async_session):
-    body = {
-        "offset": page,
-        "limit": 500,
-        "device_type_indicator": "ALL",
-        "text_indicator": "QUERY",
-        "region_ids": [],
-        "filters": {}
-    }
-
-    response = requests.post(URL, json=body, headers={'Authorization': f'OAuth {ACCESS_TOKEN}',
-                                                      "Content-Type": "application/json; charset=UTF-8"})
-
-    # print(response.text[:100])
-    data = response.json()
+    await _bulk_add_metrics(new_urls, metrics, async_session)
+    return len(metrics)
 
-    await add_data(data, last_update_date, async_session)
 
-
-async def get_all_data(request_session):
+async def get_all_data(request_session, progress=None):
     config, group = request_session["config"], request_session["group"]
     DATABASE_NAME, ACCESS_TOKEN, USER_ID, HOST_ID, group = (config['database_name'],
                                                                   config['access_token'],
@@ -106,49 +89,46 @@ async def get_all_data(request_session):
 
     await add_last_load_date(async_session, "query")
 
-    # Формируем URL для запроса мониторинга поисковых запросов
-    URL = f"https://api.webmaster.yandex.net/v4/user/{USER_ID}/hosts/{HOST_ID}/query-analytics/list"
-
-    # async_session = await create_db(DATABASE_NAME)
-    body = {
-        "offset": 0,
-        "limit": 500,
-        "device_type_indicator": "ALL",
-        "text_indicator": "QUERY",
-        "region_ids": [],
-        "filters": {}
-    }
-
-    response = requests.post(URL, json=body, headers={'Authorization': f'OAuth {ACCESS_TOKEN}',
-                                                      "Content-Type": "application/json; charset=UTF-8"})
-
-    data = response.json()
-    count = data.get("count", 0)
-    last_update_date = await get_last_update_date(async_session, MetricsQuery)
-    print("last update date:", last_update_date)
-    if not last_update_date:
-        last_update_date = datetime.strptime("1900-01-01", date_format)
-    mx_date = [datetime.strptime("1900-01-01", date_format)]
-    query_count = 0
-    try:
-        await add_data(data, last_update_date, async_session, mx_date)
-        query_count += 500
-    except Exception as e:
-        print("Erorr: ", e)
-    if mx_date[0] <= last_update_date:
-        return {"status": 400,
-                "detail": "Data is not up-to-date. Please refresh data before executing the script."
-                }
-    for offset in range(500, count, 500):
-        print(f"[INFO] PAGE{offset} DONE!")
-        curr = datetime.now()
+    async with WebmasterClient(ACCESS_TOKEN) as client:
+        data = await client.get_query_analytics(USER_ID, HOST_ID, "QUERY")
+        count = data.get("count", 0)
+        last_update_date = await get_last_update_date(async_session, MetricsQuery)
+        print("last update date:", last_update_date)
+        if not last_update_date:
+            last_update_date = datetime.strptime("1900-01-01", date_format)
+        mx_date = [datetime.strptime("1900-01-01", date_format)]
+        query_count = 0
+        if progress:
+            await progress.set_total((count + 499) // 500)
         try:
+            rows = await add_data(data, last_update_date, async_session, mx_date)
             query_count += 500
-            await get_data_by_page(offset, last_update_date, URL, ACCESS_TOKEN, async_session)
+            if progress:
+                await progress.page_done(rows)
         except Exception as e:
             print("Error: ", e)
-        print(datetime.now() - curr)
-    
+        print(mx_date, last_update_date)
+        if mx_date[0] <= last_update_date:
+            return {"status": 400,
+                    "detail": "Data is not up-to-date. Please refresh data before executing the script."
+                    }
+        # Страницы качаются параллельно (не больше WEBMASTER_MAX_CONCURRENCY), а пишутся в базу по порядку
+        curr = datetime.now()
+        async for offset, data in client.iter_query_analytics(USER_ID, HOST_ID, "QUERY", range(500, count, 500)):
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                rows = await add_data(data, last_update_date, async_session)
+                query_count += 500
+                if progress:
+                    await progress.page_done(rows)
+            except Exception as e:
+                print("Error: ", e)
+            print(f"[INFO] PAGE{offset} DONE!", datetime.now() - curr)
+            curr = datetime.now()
+
+    await _refresh_daily_summary("query", last_update_date, async_session)
+
     return {"status": 200,
             "message": f"load {query_count} records"
             }
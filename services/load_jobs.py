@@ -0,0 +1,148 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from api.config.models import LoadJob, LoadJobStatus
+from db.session import async_session_general
+from services.load_all_history import main as all_history_main
+from services.load_all_queries import get_all_data as get_all_data_queries
+from services.load_all_urls import get_all_data as get_all_data_urls
+from services.load_query_url_merge import main as merge_main
+from services.response_cache import response_cache
+
+LOADERS = {
+    "queries": get_all_data_queries,
+    "urls": get_all_data_urls,
+    "history": all_history_main,
+    "merge": merge_main,
+}
+
+ACTIVE_STATUSES = (LoadJobStatus.queued, LoadJobStatus.running)
+
+# задачи выгрузок этого процесса; ссылки держим, чтобы задачи не собрал GC
+_tasks: dict[uuid.UUID, asyncio.Task] = {}
+
+
+class LoadProgress:
+    """Счетчики выгрузки. В базу пишутся не чаще раза в FLUSH_INTERVAL секунд."""
+
+    FLUSH_INTERVAL = 2
+
+    def __init__(self, job_id: uuid.UUID):
+        self.job_id = job_id
+        self.pages_done = 0
+        self.pages_total = None
+        self.rows_written = 0
+        self._flushed_at = 0.0
+
+    async def set_total(self, pages_total: int):
+        self.pages_total = pages_total
+        await self.flush()
+
+    async def page_done(self, rows: int = 0):
+        self.pages_done += 1
+        self.rows_written += rows or 0
+        loop_time = asyncio.get_running_loop().time()
+        if loop_time - self._flushed_at >= self.FLUSH_INTERVAL:
+            await self.flush()
+
+    async def flush(self, **fields):
+        self._flushed_at = asyncio.get_running_loop().time()
+        await _update_job(self.job_id,
+                          pages_done=self.pages_done,
+                          pages_total=self.pages_total,
+                          rows_written=self.rows_written,
+                          **fields)
+
+
+async def _update_job(job_id: uuid.UUID, **fields):
+    async with async_session_general() as session:
+        await session.execute(update(LoadJob).where(LoadJob.id == job_id).values(**fields))
+        await session.commit()
+
+
+async def _run_load_job(job_id: uuid.UUID, kind: str, request_session: dict):
+    progress = LoadProgress(job_id)
+    await _update_job(job_id, status=LoadJobStatus.running, started_at=datetime.now())
+    status, message = LoadJobStatus.done, None
+    try:
+        res = await LOADERS[kind](request_session, progress=progress)
+        if isinstance(res, dict):
+            if res.get("status") == 400:
+                status, message = LoadJobStatus.failed, "Нет новых обновлений"
+            else:
+                message = res.get("message")
+    except Exception as e:
+        print(f"Ошибка выгрузки {kind} ({job_id}): {e}")
+        status, message = LoadJobStatus.failed, str(e)
+    # add_last_load_date сбрасывает кэш в начале выгрузки; ответы, посчитанные по ходу, тоже устарели
+    await response_cache.invalidate(request_session["config"]["database_name"])
+    await progress.flush(status=status, message=message, finished_at=datetime.now())
+
+
+async def start_load_job(kind: str, request_session: dict, user_id: int | None) -> tuple[LoadJob, bool]:
+    """Ставит выгрузку в очередь. Если такая же уже идет для этого конфига, возвращает ее (created=False)."""
+    config_id = request_session["config"]["config_id"]
+    async with async_session_general() as session:
+        job = LoadJob(config_id=config_id, kind=kind, author=user_id, status=LoadJobStatus.queued,
+                      pages_done=0, rows_written=0, created_at=datetime.now())
+        session.add(job)
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            active = (await session.execute(
+                select(LoadJob).where(LoadJob.config_id == config_id,
+                                      LoadJob.kind == kind,
+                                      LoadJob.status.in_(ACTIVE_STATUSES))
+            )).scalars().first()
+            if active is not None:
+                return active, False
+            raise
+
+    task = asyncio.create_task(_run_load_job(job.id, kind, dict(request_session)))
+    _tasks[job.id] = task
+    task.add_done_callback(lambda _: _tasks.pop(job.id, None))
+    return job, True
+
+
+async def get_load_job(job_id: uuid.UUID) -> LoadJob | None:
+    async with async_session_general() as session:
+        return (await session.execute(select(LoadJob).where(LoadJob.id == job_id))).scalars().first()
+
+
+async def fail_interrupted_load_jobs():
+    """Выгрузки живут в процессе приложения: после перезапуска незавершенные уже никто не ведет"""
+    async with async_session_general() as session:
+        await session.execute(
+            update(LoadJob).where(LoadJob.status.in_(ACTIVE_STATUSES)).values(
+                status=LoadJobStatus.failed,
+                message="Прервано перезапуском сервера",
+                finished_at=datetime.now(),
+            )
+        )
+        await session.commit()
+
+
+def load_job_to_dict(job: LoadJob) -> dict:
+    throughput = None
+    if job.started_at:
+        elapsed = ((job.finished_at or datetime.now()) - job.started_at).total_seconds()
+        if elapsed > 0:
+            throughput = round(job.rows_written / elapsed, 2)
+    return {
+        "id": str(job.id),
+        "kind": job.kind,
+        "status": job.status.value,
+        "pages_done": job.pages_done,
+        "pages_total": job.pages_total,
+        "rows_written": job.rows_written,
+        "rows_per_second": throughput,
+        "message": job.message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
@@ -1,104 +1,160 @@
 from datetime import datetime
-from sqlalchemy import and_, delete, select
+from sqlalchemy import Integer, and_, delete, func, select, update
+from sqlalchemy.dialects.postgresql import array
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.auth.models import User
-from api.config.models import LiveSearchListQuery, QueryLiveSearchGoogle, QueryLiveSearchYandex, UserQueryCount
+from api.config.models import LiveSearchListQuery, LiveSearchRun, QueryLiveSearchGoogle, QueryLiveSearchYandex, \
+    UserQueryCount
+from config import LIVE_SEARCH_FLUSH_SIZE
+from db.dals import bulk_transaction
 
-from services.live_search_parser_async_yandex import run_script_async as run_script_async_yandex
-from services.live_search_parser_async_google import run_script_async as run_script_async_google
+from services.live_search_parser_async_yandex import iter_query_results as iter_query_results_yandex
+from services.live_search_parser_async_google import iter_query_results as iter_query_results_google
 
 from const import date_format
 
+SEARCH_SYSTEMS = {
+    "Yandex": (QueryLiveSearchYandex, iter_query_results_yandex),
+    "Google": (QueryLiveSearchGoogle, iter_query_results_google),
+}
+
+
+async def get_run(session: AsyncSession, lr_list_id: int, user: User, date: datetime, queries_total: int) -> LiveSearchRun:
+    """Незавершенный съем за сегодня продолжаем, иначе начинаем новый"""
+    run = (await session.execute(
+        select(LiveSearchRun)
+        .where(and_(LiveSearchRun.lr_list_id == lr_list_id, LiveSearchRun.date == date))
+        .order_by(LiveSearchRun.id.desc())
+    )).scalars().first()
+
+    if run is None or run.status == "done":
+        run = LiveSearchRun(lr_list_id=lr_list_id, user_id=user.id, date=date, status="running",
+                            queries_total=queries_total, done_query_ids=[], started_at=datetime.now())
+        session.add(run)
+    else:
+        run.status = "running"
+        run.queries_total = queries_total
+    await session.commit()
+    return run
+
+
+async def reserve_queries(session: AsyncSession, user: User, count: int) -> bool:
+    """Списывает count запросов лимита, если их хватает - одним UPDATE, так что параллельные
+    съемы одного пользователя не уводят лимит в минус"""
+    if count <= 0:
+        return True
+    reserved = (await session.execute(
+        update(UserQueryCount)
+        .where(and_(UserQueryCount.user_id == user.id, UserQueryCount.query_count >= count))
+        .values(query_count=UserQueryCount.query_count - count)
+        .returning(UserQueryCount.query_count)
+    )).scalar_one_or_none()
+    await session.commit()
+    return reserved is not None
+
+
+async def release_queries(session: AsyncSession, user: User, count: int):
+    """Возвращает в лимит зарезервированные, но не полученные запросы"""
+    if count <= 0:
+        return
+    await session.execute(
+        update(UserQueryCount).where(UserQueryCount.user_id == user.id).values(
+            query_count=UserQueryCount.query_count + count
+        )
+    )
+    await session.commit()
+
+
+async def flush_results(session: AsyncSession, run: LiveSearchRun, model, batch, approach_query):
+    """Пачка полученных запросов: позиции и чекпоинт - одной транзакцией. Лимит за них уже
+    зарезервирован в reserve_queries.
+
+    batch - только запросы, по которым пришла настоящая выдача (found=None - сайта в ней нет).
+    Ответы с ошибкой xmlstock сюда не попадают: SerpFetcher.iter_results их пропускает, поэтому
+    они остаются в чекпоинте незавершенными, а их резерв возвращается в лимит.
+    """
+    query_ids = list(dict.fromkeys(approach_query[query] for query, _ in batch))
+    async with bulk_transaction(session):
+        await session.execute(
+            delete(model).where(and_(
+                model.query_id.in_(query_ids),
+                model.date == run.date,
+                model.lr_list_id == run.lr_list_id,
+            ))
+        )
+        session.add_all([
+            model(query_id=approach_query[query], url=found[0], position=found[1], date=run.date, lr_list_id=run.lr_list_id)
+            for query, found in batch if found
+        ])
+        await session.flush()
+        await session.execute(
+            update(LiveSearchRun).where(LiveSearchRun.id == run.id).values(
+                done_query_ids=func.array_cat(LiveSearchRun.done_query_ids, array(query_ids, type_=Integer))
+            )
+        )
+
+
 async def main(
         lr_list_id: int,
-        list_id:int, 
-        main_domain: str, 
-        lr:int, 
+        list_id:int,
+        main_domain: str,
+        lr:int,
         search_system: str,
         user: User,
         session: AsyncSession
 ):
     approach_query = dict((await session.execute(select(LiveSearchListQuery.query, LiveSearchListQuery.id).where(LiveSearchListQuery.list_id == list_id))).fetchall())
 
-    user_query_model = (await session.execute(select(UserQueryCount).where(UserQueryCount.user_id == user.id))).scalars().first()
+    date = datetime.strptime(datetime.now().strftime(date_format), date_format)
+    run = await get_run(session, lr_list_id, user, date, len(approach_query))
 
-    approach_query_names = approach_query.keys()
+    done_query_ids = set(run.done_query_ids)
+    remaining_queries = [query for query, query_id in approach_query.items() if query_id not in done_query_ids]
 
-    if user_query_model.query_count - len(approach_query) < 0:
+    # лимит резервируется на все оставшиеся запросы сразу, неполученные возвращаются в конце
+    if not await reserve_queries(session, user, len(remaining_queries)):
         return 0
-    
-    user_query_model.query_count -= len(approach_query)
+
+    model, iter_query_results = SEARCH_SYSTEMS[search_system]
+    done_count = len(approach_query) - len(remaining_queries)
+    remaining = set(remaining_queries)
+    batch = []
 
     try:
-        if search_system == "Yandex":
-            query_info = await run_script_async_yandex(main_domain, lr, approach_query_names)
-            query_info_for_db = list()
-
-            for key, value in query_info.items():
-                query_info_for_db.append(QueryLiveSearchYandex(
-                    query_id=approach_query[key],
-                    url=value[0],
-                    position=value[1],
-                    date=datetime.strptime(datetime.now().strftime(date_format), date_format),
-                    lr_list_id=lr_list_id,
-                ))
-
-                
-            
-            stmt = (
-                delete(QueryLiveSearchYandex)
-                .where(
-                    and_(
-                        QueryLiveSearchYandex.query_id.in_(approach_query.values()),
-                        QueryLiveSearchYandex.date == datetime.strptime(datetime.now().strftime(date_format), date_format
-                        ),
-                        QueryLiveSearchYandex.lr_list_id == lr_list_id,
-                    )
-                )
-            )
-            
-            # Выполнение запроса на удаление
-            await session.execute(stmt)
-            await session.commit()  # Коммит для фиксации изменений в базе данных
-        
-        elif search_system == "Google":
-            print(approach_query_names)
-            query_info = await run_script_async_google(main_domain, lr, approach_query_names)
-            query_info_for_db = list()
-
-            for key, value in query_info.items():
-                query_info_for_db.append(QueryLiveSearchGoogle(
-                    query_id=approach_query[key],
-                    url=value[0],
-                    position=value[1],
-                    date=datetime.strptime(datetime.now().strftime(date_format), date_format),
-                    lr_list_id=lr_list_id,
-                ))
-            
-            stmt = (
-                delete(QueryLiveSearchGoogle)
-                .where(
-                    and_(
-                        QueryLiveSearchGoogle.query_id.in_(approach_query.values()),
-                        QueryLiveSearchGoogle.date == datetime.strptime(datetime.now().strftime(date_format), date_format
-                        ),
-                        QueryLiveSearchGoogle.lr_list_id == lr_list_id,
-                    )
-                )
-            )
-            
-            await session.execute(stmt)
-            await session.commit()
-        
-        session.add_all(query_info_for_db)
-        await session.commit()
+        async for query, found in iter_query_results(main_domain, lr, remaining_queries):
+            # каждый запрос учитывается и отмечается в чекпоинте один раз
+            if query not in remaining:
+                continue
+            remaining.discard(query)
+            batch.append((query, found))
+            if len(batch) >= LIVE_SEARCH_FLUSH_SIZE:
+                await flush_results(session, run, model, batch, approach_query)
+                done_count += len(batch)
+                batch = []
+        if batch:
+            await flush_results(session, run, model, batch, approach_query)
+            done_count += len(batch)
+            batch = []
 
     except Exception as e:
+        await session.rollback()
         print(
             f"Произошло досрочное выключение xmlstock. Search System:{search_system} Ошибка: {e}")
-    
-    return 1
-
+    finally:
+        # резерв за неполученные запросы (remaining) и полученные, но не записанные из-за ошибки (batch)
+        await release_queries(session, user, len(remaining) + len(batch))
 
+    # запросы, которые так и не загрузились, остаются в чекпоинте незавершенными до следующего запуска
+    if done_count < len(approach_query):
+        print(f"Не получена выдача по {len(approach_query) - done_count} запросам, они будут сняты при повторном запуске. "
+              f"Search System:{search_system}")
+    await session.execute(
+        update(LiveSearchRun).where(LiveSearchRun.id == run.id).values(
+            status="done" if done_count >= len(approach_query) else "failed",
+            finished_at=datetime.now(),
+        )
+    )
+    await session.commit()
 
+    return 1
@@ -1,30 +1,20 @@
-import config
 import asyncio
-from datetime import datetime
-import requests
-from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
 
-from db.models import Url
-from db.models import Metrics
-from db.session import async_session
-from api.actions.urls import _add_new_urls
-from api.actions.metrics_url import _add_new_metrics, _delete_data
-
-ACCESS_TOKEN = f"{config.ACCESS_TOKEN}"
-USER_ID = f"{config.USER_ID}"
-HOST_ID = f"{config.HOST_ID}"
+from db.session import connect_db
+from api.actions.metrics_url import _bulk_add_metrics, _delete_data
+from api.actions.daily_summary import _refresh_daily_summary
+from services.webmaster_client import WebmasterClient
 
 date_format = "%Y-%m-%d"
 
-# Формируем URL для запроса мониторинга поисковых запросов
-URL = f"https://api.webmaster.yandex.net/v4/user/{USER_ID}/hosts/{HOST_ID}/query-analytics/list"
-
 
-async def add_data(data, date):
+async def add_data(data, date, async_session):
+    new_urls = []
+    metrics = []
     for query in data['text_indicator_to_statistics']:
         query_name = query['text_indicator']['value']
-        new_url = [Url(url=query_name)]
-        metrics = []
+        new_urls.append(query_name)
         data_add = {
             "date": date,
             "ctr": 0,
@@ -46,70 +36,60 @@ async def add_data(data, date):
                     data_add["ctr"] = el["value"]
                 elif field == "POSITION":
                     data_add["position"] = el["value"]
-        metrics.append(Metrics(
-            url=query_name,
-            date=datetime.strptime(date, date_format),
-            ctr=data_add['ctr'],
-            position=data_add['position'],
-            impression=data_add['impression'],
-            demand=data_add['demand'],
-            clicks=data_add['clicks']
+        metrics.append((
+            query_name,
+            datetime.strptime(date, date_format),
+            data_add['position'],
+            data_add['ctr'],
+            data_add['impression'],
+            data_add['demand'],
+            data_add['clicks'],
         ))
-        try:
-            await _add_new_urls(new_url, async_session)
-        except IntegrityError:
-            pass
-        await _add_new_metrics(metrics, async_session)
-
-
-async def get_data_by_page(page, date):
-    body = {
-        "offset": page,
-        "limit": 500,
-        "device_type_indicator": "ALL",
-        "text_indicator": "URL",
-        "region_ids": [],
-        "filters": {}
-    }
-
-    response = requests.post(URL, json=body, headers={'Authorization': f'OAuth {ACCESS_TOKEN}',
-                                                      "Content-Type": "application/json; charset=UTF-8"})
+    await _bulk_add_metrics(new_urls, metrics, async_session)
 
-    print(response.text[:100])
-    data = response.json()
 
-    await add_data(data, date)
-
-
-async def get_all_data():
-    date_input = input("Введите дату, которую необходимо обновить (в формате YYYY-MM-DD): ")
+async def get_all_data(request_session, date_input):
+    config = request_session["config"]
+    DATABASE_NAME, ACCESS_TOKEN, USER_ID, HOST_ID = (config['database_name'],
+                                                     config['access_token'],
+                                                     config['user_id'],
+                                                     config['host_id'])
 
     try:
         # Преобразование строки в объект даты
-        date_obj = datetime.strptime(date_input, "%Y-%m-%d")
+        date_obj = datetime.strptime(date_input, date_format)
         print(f"Введенная дата: {date_obj}")
     except ValueError:
         print("Неверный формат даты. Пожалуйста, введите дату в формате YYYY-MM-DD.")
+        return
+
+    async_session = await connect_db(DATABASE_NAME)
+
     await _delete_data(date_obj, async_session)
-    body = {
-        "offset": 0,
-        "limit": 500,
-        "device_type_indicator": "ALL",
-        "text_indicator": "URL",
-        "region_ids": [],
-        "filters": {}
-    }
 
-    response = requests.post(URL, json=body, headers={'Authorization': f'OAuth {ACCESS_TOKEN}',
-                                                      "Content-Type": "application/json; charset=UTF-8"})
+    async with WebmasterClient(ACCESS_TOKEN) as client:
+        data = await client.get_query_analytics(USER_ID, HOST_ID, "URL")
+        count = data["count"]
+        await add_data(data, date_input, async_session)
+        async for offset, data in client.iter_query_analytics(USER_ID, HOST_ID, "URL", range(500, count, 500)):
+            if isinstance(data, Exception):
+                print("Error: ", data)
+                continue
+            await add_data(data, date_input, async_session)
+            print(f"[INFO] PAGE{offset} DONE!")
 
-    data = response.json()
-    count = data["count"]
-    await add_data(data, date_obj)
-    for offset in range(500, count, 500):
-        print(f"[INFO] PAGE{offset} DONE!")
-        await get_data_by_page(offset, date_obj)
+    # _delete_data удалила и строку metrics_daily_summary за этот день - пересобираем ее
+    await _refresh_daily_summary("url", date_obj - timedelta(days=1), async_session)
 
 
 if __name__ == '__main__':
-    asyncio.run(get_all_data())
+    cfg = {
+        "config": {
+            "database_name": input("Имя базы данных: "),
+            "access_token": input("OAuth-токен: "),
+            "user_id": input("USER_ID: "),
+            "host_id": input("HOST_ID: "),
+        }
+    }
+    date_input = input("Введите дату, которую необходимо обновить (в формате YYYY-MM-DD): ")
+    asyncio.run(get_all_data(cfg, date_input))
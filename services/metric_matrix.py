@@ -0,0 +1,139 @@
+"""Матрица метрик страницы таблицы на NumPy.
+
+Строки запроса (дата, метрики..., url|запрос) раскладываются в плотный массив
+values[сущность, день, метрика], пропущенные дни - NaN, признак наличия строки - present[сущность, день].
+Разницы с предыдущим днем, суммы, средние и число ненулевых дней считаются по всей странице сразу,
+а не циклом по строкам каждого url/запроса. В JSON (orjson) NaN уходит как null.
+"""
+from itertools import chain, repeat
+from operator import itemgetter
+
+import numpy as np
+
+# метрики строк _metrics_page_query и _get_merge_query: (date, position, clicks, impression, ctr, ...)
+PAGE_METRICS = ("position", "clicks", "impressions", "ctr")
+PAGE_METRIC_COLUMNS = (1, 2, 3, 4)
+
+
+class MetricMatrix:
+    def __init__(self, keys: list, dates: list, values: np.ndarray, present: np.ndarray,
+                 metrics: tuple = PAGE_METRICS, labels: np.ndarray | None = None, first_rows: list | None = None):
+        self.keys = keys
+        self.dates = dates
+        self.values = values
+        self.present = present
+        self.metrics = metrics
+        self.labels = labels
+        # первая строка запроса по каждой сущности: в ней итоги, посчитанные в SQL
+        self.first_rows = first_rows
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.date_index = {date: i for i, date in enumerate(dates)}
+
+    @classmethod
+    def from_rows(cls, rows, key_column: int = -1, date_column: int = 0,
+                  metric_columns: tuple = PAGE_METRIC_COLUMNS, metrics: tuple = PAGE_METRICS,
+                  keys: list | None = None, dates: list | None = None, label_column: int | None = None):
+        """keys - порядок сущностей (по умолчанию - порядок первого появления в rows), dates - дни
+        по возрастанию (по умолчанию - все даты rows). Строки вне keys/dates пропускаются, при повторе
+        сущности и дня остается последняя строка."""
+        rows = list(rows or [])
+        if keys is None:
+            keys = list(dict.fromkeys(row[key_column] for row in rows))
+        if dates is None:
+            dates = sorted({row[date_column] for row in rows})
+        key_index = {key: i for i, key in enumerate(keys)}
+        date_index = {date: i for i, date in enumerate(dates)}
+
+        values = np.full((len(keys), len(dates), len(metrics)), np.nan)
+        present = np.zeros((len(keys), len(dates)), dtype=bool)
+        labels = np.full((len(keys), len(dates)), None, dtype=object) if label_column is not None else None
+        first_rows = [None] * len(keys)
+
+        if rows:
+            count = len(rows)
+            entity = np.fromiter(map(key_index.get, map(itemgetter(key_column), rows), repeat(-1)),
+                                 dtype=np.intp, count=count)
+            day = np.fromiter(map(date_index.get, map(itemgetter(date_column), rows), repeat(-1)),
+                              dtype=np.intp, count=count)
+            keep = (entity >= 0) & (day >= 0)
+            get_metrics = itemgetter(*metric_columns)
+            if len(metric_columns) == 1:
+                # с одной колонкой itemgetter возвращает число, а не кортеж
+                get_metrics = lambda row, column=metric_columns[0]: (row[column],)
+            data = np.fromiter(chain.from_iterable(map(get_metrics, rows)), dtype=float,
+                               count=count * len(metric_columns)).reshape(count, len(metric_columns))
+            values[entity[keep], day[keep]] = data[keep]
+            present[entity[keep], day[keep]] = True
+            if labels is not None:
+                labels[entity[keep], day[keep]] = np.array([row[label_column] for row in rows], dtype=object)[keep]
+            kept = np.flatnonzero(keep)
+            found, first = np.unique(entity[kept], return_index=True)
+            for row, i in zip(found.tolist(), kept[first].tolist()):
+                first_rows[row] = rows[i]
+
+        return cls(keys, dates, values, present, metrics, labels, first_rows)
+
+    def metric(self, name: str) -> np.ndarray:
+        """[сущность, день] одной метрики"""
+        return self.values[:, :, self.metrics.index(name)]
+
+    def take(self, order) -> "MetricMatrix":
+        """Та же матрица с сущностями в порядке order"""
+        order = np.asarray(order, dtype=np.intp)
+        return MetricMatrix([self.keys[i] for i in order], self.dates, self.values[order], self.present[order],
+                            self.metrics, None if self.labels is None else self.labels[order],
+                            [self.first_rows[i] for i in order])
+
+    def order_by_day(self, name: str, date, descending: bool = False) -> "MetricMatrix":
+        """Сортировка сущностей по метрике за день date; нет строки или значение 0 - в конце"""
+        fill = -np.inf if descending else np.inf
+        day = self.date_index.get(date)
+        if day is None:
+            sort_key = np.full(len(self.keys), fill)
+        else:
+            value = self.metric(name)[:, day]
+            sort_key = np.where(self.present[:, day] & (value != 0), value, fill)
+        return self.take(np.argsort(-sort_key if descending else sort_key, kind="stable"))
+
+    def deltas(self, name: str = "position", skip_missing: bool = True) -> np.ndarray:
+        """Разница с предыдущим днем, [сущность, день]; NaN - нет строки или нет предыдущего дня.
+
+        skip_missing=True - с предыдущим днем, за который есть строка; False - с предыдущим
+        календарным днем, пропущенный день считается нулем.
+        """
+        value = self.metric(name)
+        delta = np.full(value.shape, np.nan)
+        if value.shape[1] < 2:
+            return delta
+        if skip_missing:
+            days = np.arange(value.shape[1])
+            last_seen = np.maximum.accumulate(np.where(self.present, days, -1), axis=1)
+            prev_day = last_seen[:, :-1]
+            prev_value = np.take_along_axis(value, np.maximum(prev_day, 0), axis=1)
+            delta[:, 1:] = np.where(prev_day >= 0, value[:, 1:] - prev_value, np.nan)
+        else:
+            filled = np.where(self.present, value, 0)
+            delta[:, 1:] = filled[:, 1:] - filled[:, :-1]
+        delta[~self.present] = np.nan
+        return np.round(delta, 2)
+
+    def totals(self) -> np.ndarray:
+        """Суммы по дням, [сущность, метрика]; пропущенные дни - ноль"""
+        return np.where(self.present[:, :, None], self.values, 0).sum(axis=1)
+
+    def nonzero_counts(self, name: str = "position") -> np.ndarray:
+        """Число дней с метрикой больше нуля, [сущность]"""
+        return np.count_nonzero(self.present & (self.metric(name) > 0), axis=1)
+
+    def averages(self, name: str, count_by: str = "position") -> np.ndarray:
+        """Сумма метрики, деленная на число дней с count_by > 0 (0, если таких дней нет), [сущность]"""
+        total = self.totals()[:, self.metrics.index(name)]
+        count = self.nonzero_counts(count_by)
+        return np.divide(total, count, out=np.zeros_like(total), where=count > 0)
+
+    def cell(self, row: int, day: int) -> list:
+        """Метрики ячейки как числа Python, для html-разметки"""
+        return self.values[row, day].tolist()
+
+    def present_days(self, row: int) -> np.ndarray:
+        return np.flatnonzero(self.present[row])
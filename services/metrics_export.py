@@ -0,0 +1,246 @@
+import asyncio
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from fastapi.responses import FileResponse
+from openpyxl import Workbook
+from starlette.background import BackgroundTask
+
+from api.actions.queries import _count_queries_export, _stream_queries_export
+from api.actions.query_url_merge import _get_merge_query, _stream_merge_export
+from api.actions.urls import _count_urls_export, _stream_urls_export
+from const import date_format_2, date_format_out
+from db.session import async_session_general
+
+METRIC_HEADER = ["Position", "Click", "R", "CTR"]
+EMPTY_METRICS = [0, 0, 0, 0]
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# сколько строк CSV собирать в один кусок ответа
+CSV_CHUNK_ROWS = 500
+# сколько url merge обрабатывать за раз: по ним одним запросом берутся метрики запросов
+MERGE_EXPORT_BATCH = 200
+
+
+def _export_filters(data_request: dict) -> dict:
+    """Фильтры и сортировка страницы из тела запроса - те же, что у табличных эндпоинтов"""
+    if data_request["sort_result"]:
+        return {"search_text": data_request["search_text"], "sort_desc": data_request["sort_desc"]}
+    state_date = None
+    if data_request["button_date"]:
+        state_date = datetime.strptime(data_request["button_date"], date_format_2)
+    return {
+        "search_text": data_request["search_text"],
+        "state": data_request["button_state"],
+        "state_date": state_date,
+        "metric_type": data_request["metric_type"],
+        "state_type": data_request["state_type"],
+    }
+
+
+def _header_rows(start_date: datetime, amount: int) -> tuple[list, list]:
+    dates = [(start_date + timedelta(days=i)).strftime(date_format_out) for i in range(amount + 1)]
+    main_header = ["Url", *["Result"] * 4, *[date for date in reversed(dates) for _ in range(4)]]
+    header = ["", *METRIC_HEADER * (amount + 2)]
+    return main_header, header
+
+
+def _entity_row(key, stats, columns) -> list:
+    # stats: строки _metrics_page_query одного url/запроса, упорядоченные по дате
+    info = {stat[0].strftime(date_format_out): [stat[1], stat[2], stat[3], stat[4]] for stat in stats}
+    info["Result"] = list(stats[0][5:9])
+    row = [key]
+    for column in columns:
+        row.extend(info.get(column, EMPTY_METRICS))
+    return row
+
+
+async def _group_rows(rows):
+    """(url|query, строки) по подряд идущим строкам одного url/запроса"""
+    key, group = None, []
+    async for row in rows:
+        if group and row[-1] != key:
+            yield key, group
+            group = []
+        key = row[-1]
+        group.append(row)
+    if group:
+        yield key, group
+
+
+async def iter_export_rows(kind: str, data_request: dict, async_session):
+    """Строки отчета "url" или "query": две строки заголовка, затем по строке на url/запрос.
+
+    Данные идут одним серверным курсором, в памяти только строки текущего url/запроса.
+    """
+    start_date = datetime.strptime(data_request["start_date"], date_format_2)
+    end_date = datetime.strptime(data_request["end_date"], date_format_2)
+    amount = int(data_request["amount"])
+    filters = _export_filters(data_request)
+
+    main_header, header = _header_rows(start_date, amount)
+    yield main_header
+    yield header
+
+    columns = ["Result", *[(start_date + timedelta(days=i)).strftime(date_format_out)
+                           for i in reversed(range(amount + 1))]]
+
+    async with async_session_general() as general_session:
+        if kind == "url":
+            rows = _stream_urls_export(start_date, end_date, data_request["list_name"], async_session,
+                                       general_session, **filters)
+        else:
+            rows = _stream_queries_export(start_date, end_date, async_session, **filters)
+        async for key, stats in _group_rows(rows):
+            yield _entity_row(key, stats, columns)
+
+
+async def count_export_rows(kind: str, data_request: dict, async_session) -> int:
+    """Сколько строк данных (без заголовка) выдаст iter_export_rows"""
+    start_date = datetime.strptime(data_request["start_date"], date_format_2)
+    end_date = datetime.strptime(data_request["end_date"], date_format_2)
+    filters = _export_filters(data_request)
+
+    if kind == "url":
+        async with async_session_general() as general_session:
+            return await _count_urls_export(start_date, end_date, data_request["list_name"], async_session,
+                                            general_session, **filters)
+    return await _count_queries_export(start_date, end_date, async_session, **filters)
+
+
+def _merge_header_rows(start_date: datetime, amount: int) -> tuple[list, list]:
+    dates = [(start_date + timedelta(days=i)).strftime(date_format_out) for i in range(amount + 1)]
+    main_header = ["Url", *["Parent Result"] * 4, "Queries", *["Result"] * 4,
+                   *[date for date in reversed(dates) for _ in range(4)]]
+    header = ["", *METRIC_HEADER, "", *METRIC_HEADER * (amount + 2)]
+    return main_header, header
+
+
+def _merge_rows(url, queries, grouped_data, columns) -> list[list]:
+    """Строки одного url merge: по строке на запрос, впереди итог по url"""
+    parent_res = []
+    parent_clicks, parent_position, parent_impression, parent_ctr = 0, 0, 0, 0
+    for query in queries:
+        res = [url, query]
+        el = grouped_data.get(query)
+        if el:
+            info = {}
+            total_clicks, position, impressions, ctr, count = 0, 0, 0, 0, 0
+            for stat in el:
+                info[stat[0].strftime(date_format_out)] = [stat[1], stat[2], stat[3], stat[4]]
+                total_clicks += stat[2]
+                position += stat[1]
+                impressions += stat[3]
+                ctr += stat[4]
+                if stat[1] > 0:
+                    count += 1
+            if impressions > 0:
+                total_position = round(position / count, 2)
+                total_ctr = round(ctr / count, 2)
+                info["Result"] = [total_position, total_clicks, impressions, round(total_clicks * 100 / impressions, 2)]
+            else:
+                total_position = 0
+                total_ctr = 0
+                info["Result"] = [total_position, total_clicks, impressions, 0]
+            parent_impression += impressions
+            parent_position += total_position
+            parent_clicks += total_clicks
+            parent_ctr += total_ctr
+            for column in columns:
+                res.extend(info.get(column, EMPTY_METRICS))
+        parent_res.append(res)
+
+    rows = []
+    for parent in parent_res:
+        parent_true = [parent_position, parent_clicks, parent_impression, parent_ctr, *parent]
+        parent_true[0], parent_true[4] = parent_true[4], parent_true[0]
+        rows.append(parent_true)
+    return rows
+
+
+async def _merge_batch_rows(batch, start_date, end_date, async_session, columns):
+    all_queries = [query for _, queries in batch for query in queries]
+    queries = await _get_merge_query(start_date, end_date, all_queries, async_session) or []
+    queries.sort(key=lambda x: (x[-1], x[0]))
+    grouped_data = {key: list(group) for key, group in groupby(queries, key=lambda x: x[-1])}
+    rows = []
+    for url, url_queries in batch:
+        rows.extend(_merge_rows(url, url_queries, grouped_data, columns))
+    return rows
+
+
+async def iter_merge_rows(data_request: dict, async_session, batch_size: int = MERGE_EXPORT_BATCH):
+    """Строки отчета merge: url идут одним серверным курсором, метрики запросов - пачками по batch_size url"""
+    start_date = datetime.strptime(data_request["start_date"], date_format_2)
+    end_date = datetime.strptime(data_request["end_date"], date_format_2)
+    amount = int(data_request["amount"])
+
+    main_header, header = _merge_header_rows(start_date, amount)
+    yield main_header
+    yield header
+
+    columns = ["Result", *[(start_date + timedelta(days=i)).strftime(date_format_out)
+                           for i in reversed(range(amount + 1))]]
+    sort_desc = data_request["sort_desc"] if data_request["sort_result"] else None
+
+    batch = []
+    async for url, queries in _stream_merge_export(data_request["date"], data_request["search_text_url"],
+                                                   data_request["search_text_query"], sort_desc, async_session):
+        batch.append((url, queries))
+        if len(batch) >= batch_size:
+            for row in await _merge_batch_rows(batch, start_date, end_date, async_session, columns):
+                yield row
+            batch = []
+    if batch:
+        for row in await _merge_batch_rows(batch, start_date, end_date, async_session, columns):
+            yield row
+
+
+async def write_xlsx(rows, path: str):
+    """XLSX в режиме write_only: строки сразу уходят во временный файл openpyxl, книга в памяти не строится"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    async for row in rows:
+        ws.append(row)
+    # сборка zip-архива - синхронная, не держим на ней event loop
+    await asyncio.to_thread(wb.save, path)
+
+
+async def spool_xlsx(rows) -> str:
+    """Пишет отчет во временный .xlsx и возвращает путь; удалить файл - забота вызывающего"""
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await write_xlsx(rows, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def xlsx_file_response(path: str) -> FileResponse:
+    """Отдает временный .xlsx кусками и удаляет его после отправки"""
+    return FileResponse(path, media_type=XLSX_MEDIA_TYPE,
+                        headers={"Content-Disposition": "attachment;filename='data.xlsx'"},
+                        background=BackgroundTask(os.remove, path))
+
+
+async def iter_csv(rows, chunk_rows: int = CSV_CHUNK_ROWS):
+    """CSV кусками по chunk_rows строк для StreamingResponse"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    async for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
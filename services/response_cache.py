@@ -0,0 +1,211 @@
+import functools
+import hashlib
+import json
+import sys
+import time
+from collections import OrderedDict
+
+from fastapi.responses import JSONResponse, Response
+
+from config import (REDIS_DB, REDIS_HOST, REDIS_PASSWORD, REDIS_PORT, RESPONSE_CACHE_MAX_ENTRIES,
+                    RESPONSE_CACHE_TTL)
+
+KEY_PREFIX = "resp:"
+LISTS_GENERATION = "lists"
+LOAD_MARKERS_MAX = 1000
+
+
+class MemoryBackend:
+    """Кэш в памяти процесса, если Redis не настроен: LRU с TTL"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float | None, bytes]] = OrderedDict()
+        # счетчики поколений хранятся отдельно, чтобы их не вытеснили ответы
+        self._counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        if key in self._counters:
+            return str(self._counters[key]).encode()
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: bytes, ttl: int | None = None):
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+
+class RedisBackend:
+    def __init__(self):
+        import redis.asyncio as redis
+
+        self._redis = redis.Redis(host=REDIS_HOST, port=int(REDIS_PORT or 6379), password=REDIS_PASSWORD,
+                                  db=int(REDIS_DB or 0))
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._redis.get(key)
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        return await self._redis.mget(keys)
+
+    async def set(self, key: str, value: bytes, ttl: int | None = None):
+        await self._redis.set(key, value, ex=ttl)
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(key)
+
+
+class ResponseCache:
+    """Ответы табличных эндпоинтов по ключу (эндпоинт, БД тенанта, тело запроса).
+
+    Ключ включает поколение тенанта: после каждой загрузки данных поколение увеличивается,
+    и старые записи просто перестают читаться, пока не истечет их TTL. Ответы, посчитанные
+    во время загрузки, сохраняются под прежним поколением и устаревших данных не отдают.
+    Списки url/запросов хранятся в общей БД, поэтому для них отдельное общее поколение.
+    """
+
+    def __init__(self, ttl: int = RESPONSE_CACHE_TTL):
+        self.ttl = ttl
+        self._backend = None
+        # последняя загрузка тенанта по префиксу ключа (БД и поколения): внутри поколения она не меняется
+        self._load_markers: dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = RedisBackend() if REDIS_HOST else MemoryBackend()
+        return self._backend
+
+    @staticmethod
+    def _generation_key(name: str) -> str:
+        return f"{KEY_PREFIX}gen:{name}"
+
+    async def key(self, endpoint: str, db_name: str, body: dict) -> str:
+        tenant_gen, lists_gen = await self.backend.mget(
+            [self._generation_key(db_name), self._generation_key(LISTS_GENERATION)]
+        )
+        normalized = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+        return f"{KEY_PREFIX}{db_name}:{int(tenant_gen or 0)}.{int(lists_gen or 0)}:{endpoint}:{digest}"
+
+    async def etag(self, key: str, db_name: str) -> str:
+        """Валидатор ответа: ключ (тело запроса и поколения) плюс последняя загрузка тенанта.
+        Поколения в памяти процесса после перезапуска начинаются заново, дата загрузки - нет."""
+        from api.actions.actions import get_last_load_marker
+        from db.session import connect_db
+
+        prefix = key.rsplit(":", 2)[0]
+        marker = self._load_markers.get(prefix)
+        if marker is None:
+            marker = await get_last_load_marker(await connect_db(db_name))
+            if len(self._load_markers) >= LOAD_MARKERS_MAX:
+                self._load_markers.clear()
+            self._load_markers[prefix] = marker
+        return f'W/"{hashlib.sha1(f"{key}|{marker}".encode()).hexdigest()}"'
+
+    async def get(self, key: str) -> bytes | None:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes):
+        await self.backend.set(key, value, self.ttl)
+
+    async def invalidate(self, db_name: str):
+        try:
+            await self.backend.incr(self._generation_key(db_name))
+        except Exception as e:
+            self.errors += 1
+            print(f"Кэш ответов недоступен: {e}", file=sys.stderr)
+
+    async def invalidate_lists(self):
+        await self.invalidate(LISTS_GENERATION)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": "redis" if REDIS_HOST else "memory",
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 4) if total else 0,
+        }
+
+
+response_cache = ResponseCache()
+
+
+def _validator_headers(etag: str | None) -> dict:
+    if etag is None:
+        return {}
+    # браузер каждый раз переспрашивает сервер, неизмененная страница приходит как 304 без тела
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def _etag_matches(request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (value.strip() for value in if_none_match.split(","))
+
+
+def cached_response(endpoint: str):
+    """Кэширует JSON-ответ POST-обработчика с аргументами request и data_request и ставит ETag:
+    на запрос с совпавшим If-None-Match отвечает 304.
+    Недоступность кэша не ломает запрос - он просто считается заново."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            request = kwargs["request"]
+            db_name = request.session.get("config", {}).get("database_name", "")
+            if not db_name:
+                return await handler(*args, **kwargs)
+
+            key = etag = None
+            try:
+                key = await response_cache.key(endpoint, db_name, kwargs["data_request"])
+                etag = await response_cache.etag(key, db_name)
+                if _etag_matches(request, etag):
+                    return Response(status_code=304, headers=_validator_headers(etag))
+                cached = await response_cache.get(key)
+                if cached is not None:
+                    return Response(content=cached, media_type="application/json", headers=_validator_headers(etag))
+            except Exception as e:
+                response_cache.errors += 1
+                print(f"Кэш ответов недоступен: {e}", file=sys.stderr)
+
+            response = await handler(*args, **kwargs)
+            if key is not None and isinstance(response, JSONResponse) and response.status_code == 200:
+                try:
+                    await response_cache.set(key, response.body)
+                except Exception as e:
+                    response_cache.errors += 1
+                    print(f"Кэш ответов недоступен: {e}", file=sys.stderr)
+                response.headers.update(_validator_headers(etag))
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,112 @@
+"""Ответы API: сериализация orjson и сжатие gzip/brotli"""
+import asyncio
+import gzip
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import BROTLI_QUALITY, COMPRESSION_MIN_SIZE, GZIP_LEVEL
+
+try:
+    import brotli
+except ImportError:  # brotli не обязателен: без него отдаем только gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+# тела больше этого сжимаются в отдельном потоке, чтобы не держать event loop
+THREAD_COMPRESSION_SIZE = 1024 * 1024
+
+
+def _orjson_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse с orjson: datetime и Decimal сериализуются без прохода jsonable_encoder"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_orjson_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """br, если клиент его принимает и brotli установлен, иначе gzip, иначе без сжатия"""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        _, _, q = params.partition("q=")
+        try:
+            if q and float(q) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Сжимает ответы, отданные одним куском (JSON, html), от minimum_size байт.
+
+    Потоковые ответы (выгрузки CSV, файлы, SSE) проходят как есть: их тело не буферизуется.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            headers = MutableHeaders(scope=start)
+            if (message.get("more_body", False)
+                    or len(body) < self.minimum_size
+                    or "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)):
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) > THREAD_COMPRESSION_SIZE:
+                body = await asyncio.to_thread(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,105 @@
+import json
+import urllib.parse
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from api.config.models import SerpCache
+from config import SERP_CACHE_RETENTION_DAYS, SERP_CACHE_TOP_N
+from const import date_format
+from db.session import async_session_general
+from services.serp_xml import SerpError, iter_yandex_groups
+
+
+def cache_date() -> datetime:
+    """Записи кэша живут в пределах дня: выдача за сегодня"""
+    return datetime.strptime(datetime.now().strftime(date_format), date_format)
+
+
+def parse_results(search_system: str, body: bytes, top_n: int = SERP_CACHE_TOP_N) -> list[list]:
+    """Ответ xmlstock -> [[позиция, url, domain], ...] по порядку выдачи, не больше top_n позиций.
+
+    Ответ с ошибкой или без выдачи - SerpError: такой результат нельзя ни учитывать, ни класть в кэш.
+    """
+    results = []
+    if search_system == "yandex":
+        for position, url, domain in iter_yandex_groups(body):
+            if position > top_n:
+                break
+            results.append([position, url, domain])
+    else:
+        try:
+            items = json.loads(body)["results"].items()
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise SerpError(f"Ответ Google без выдачи: {body[:200].decode(errors='replace')}") from e
+        for key, value in items:
+            position = int(key)
+            if position <= top_n:
+                results.append([position, value["url"], urllib.parse.urlsplit(value["url"]).hostname])
+    if not results:
+        raise SerpError(f"Пустая выдача {search_system}")
+    return results
+
+
+def _key_filter(search_system: str, lr, query: str, date: datetime):
+    return and_(
+        SerpCache.search_system == search_system,
+        SerpCache.lr == str(lr),
+        SerpCache.query == query,
+        SerpCache.date == date,
+    )
+
+
+async def get_results(search_system: str, lr, query: str, date: datetime) -> list[list] | None:
+    # поиск и учет попадания - одним запросом; пустые записи (сохраненные до проверки выдачи) - промах
+    async with async_session_general() as session:
+        return (await session.execute(
+            update(SerpCache)
+            .where(_key_filter(search_system, lr, query, date), SerpCache.results != [])
+            .values(hits=SerpCache.hits + 1)
+            .returning(SerpCache.results)
+        )).scalar_one_or_none()
+
+
+async def put_results(search_system: str, lr, query: str, date: datetime, results: list[list]):
+    if not results:
+        raise SerpError("Пустая выдача не кэшируется")
+    async with async_session_general() as session:
+        statement = insert(SerpCache).values(
+            search_system=search_system, lr=str(lr), query=query, date=date, results=results, hits=0,
+            created_at=datetime.now(),
+        )
+        # пустую запись за день заменяем полученной выдачей, непустую не трогаем
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[SerpCache.search_system, SerpCache.lr, SerpCache.query, SerpCache.date],
+            set_={"results": statement.excluded.results, "created_at": statement.excluded.created_at},
+            where=SerpCache.results == [],
+        ))
+
+
+async def purge_serp_cache(retention_days: int = SERP_CACHE_RETENTION_DAYS):
+    async with async_session_general() as session:
+        await session.execute(delete(SerpCache).where(SerpCache.date < cache_date() - timedelta(days=retention_days)))
+
+
+async def get_serp_cache_stats() -> list[dict]:
+    """По дням и поисковым системам: записей (= платных запросов), попаданий и доля попаданий"""
+    async with async_session_general() as session:
+        rows = (await session.execute(
+            select(SerpCache.date, SerpCache.search_system, func.count(), func.sum(SerpCache.hits))
+            .group_by(SerpCache.date, SerpCache.search_system)
+            .order_by(SerpCache.date.desc(), SerpCache.search_system)
+        )).all()
+
+    stats = []
+    for date, search_system, entries, hits in rows:
+        hits = int(hits or 0)
+        stats.append({
+            "date": date.strftime(date_format),
+            "search_system": search_system,
+            "entries": entries,
+            "hits": hits,
+            "hit_rate": round(hits / (hits + entries), 4) if entries else 0,
+        })
+    return stats
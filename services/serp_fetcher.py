@@ -0,0 +1,258 @@
+import asyncio
+import random
+import sys
+import time
+
+import aiohttp
+
+from config import (SERP_CACHE_CONCURRENCY, XMLSTOCK_GOOGLE_CONCURRENCY, XMLSTOCK_MAX_RETRIES, XMLSTOCK_RPS,
+                    XMLSTOCK_TIMEOUT, XMLSTOCK_YANDEX_CONCURRENCY, xml_config)
+from services.serp_cache import cache_date, get_results, parse_results, put_results
+
+SEARCH_SYSTEMS = {
+    "yandex": {"url": "https://xmlstock.com/yandex/xml/", "concurrency": XMLSTOCK_YANDEX_CONCURRENCY},
+    "google": {"url": "https://xmlstock.com/google/json/", "concurrency": XMLSTOCK_GOOGLE_CONCURRENCY},
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Не больше rate запросов в секунду в среднем, всплеск до capacity"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# лимиты общие для всех прогонов процесса: тариф xmlstock один на приложение
+_semaphores: dict[str, asyncio.Semaphore] = {}
+_buckets: dict[str, TokenBucket] = {}
+# обращения к кэшу выдачи идут через общий пул async_session_general, поэтому их число тоже ограничено
+_cache_semaphore: asyncio.Semaphore | None = None
+
+# запросы, которые сейчас в работе: одинаковые (поисковик, lr, запрос) из параллельных прогонов ждут один ответ
+_inflight: dict[tuple, asyncio.Future] = {}
+
+_WORKER_DONE = object()
+
+
+def _limits(search_system: str) -> tuple[asyncio.Semaphore, TokenBucket]:
+    if search_system not in _semaphores:
+        _semaphores[search_system] = asyncio.Semaphore(SEARCH_SYSTEMS[search_system]["concurrency"])
+        _buckets[search_system] = TokenBucket(XMLSTOCK_RPS)
+    return _semaphores[search_system], _buckets[search_system]
+
+
+def _cache_limit() -> asyncio.Semaphore:
+    global _cache_semaphore
+    if _cache_semaphore is None:
+        _cache_semaphore = asyncio.Semaphore(SERP_CACHE_CONCURRENCY)
+    return _cache_semaphore
+
+
+class SerpFetcher:
+    """Загрузка выдачи через xmlstock: одна aiohttp-сессия на прогон, лимиты на поисковую систему,
+    повторы с экспоненциальной задержкой и статистика прогона.
+
+        async with SerpFetcher("yandex") as fetcher:
+            results = await fetcher.results(query, lr)  # через кэш выдачи за день
+            body = await fetcher.fetch(query, lr)  # сырой ответ, без кэша
+    """
+
+    def __init__(self, search_system: str, max_retries: int = XMLSTOCK_MAX_RETRIES, timeout: int = XMLSTOCK_TIMEOUT):
+        self.search_system = search_system.lower()
+        self.url = SEARCH_SYSTEMS[self.search_system]["url"]
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._semaphore, self._bucket = _limits(self.search_system)
+        self._cache_semaphore = _cache_limit()
+        self._session = None
+        self._started_at = None
+        self.requests = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.shared = 0
+        self.cache_hits = 0
+        self.cache_errors = 0
+        self.bytes = 0
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=SEARCH_SYSTEMS[self.search_system]["concurrency"],
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            ),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        self._started_at = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+        print(f"[SERP] {self.stats()}", file=sys.stderr)
+
+    def _params(self, query: str, lr) -> dict:
+        params = {
+            "user": xml_config.USER_ID,
+            "key": xml_config.API_KEY,
+            "query": query,
+            "groupby": xml_config.GROUP_BY,
+            "domain": xml_config.DOMAIN,
+            "lr": lr,
+            "device": xml_config.DEVICE,
+        }
+        return {key: value for key, value in params.items() if value is not None}
+
+    async def results(self, query: str, lr) -> list[list]:
+        """Выдача топ-N [[позиция, url, domain], ...]: из кэша за сегодня, иначе платный запрос к xmlstock.
+        Обращения к кэшу ограничены SERP_CACHE_CONCURRENCY на процесс, чтобы не занимать общий пул
+        соединений. Недоступность кэша не мешает съему - запрос просто уходит в xmlstock. Ответ с ошибкой или
+        без выдачи - SerpError из parse_results, в кэш он не попадает."""
+        date = cache_date()
+        try:
+            async with self._cache_semaphore:
+                cached = await get_results(self.search_system, lr, query, date)
+        except Exception as e:
+            self.cache_errors += 1
+            print(f"SERP cache недоступен: {e}", file=sys.stderr)
+            cached = None
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+
+        results = parse_results(self.search_system, await self.fetch(query, lr))
+        try:
+            async with self._cache_semaphore:
+                await put_results(self.search_system, lr, query, date, results)
+        except Exception as e:
+            self.cache_errors += 1
+            print(f"SERP cache недоступен: {e}", file=sys.stderr)
+        return results
+
+    async def fetch(self, query: str, lr) -> bytes:
+        """Сырое тело ответа xmlstock; после max_retries неудачных попыток пробрасывает ошибку"""
+        key = (self.search_system, str(lr), query)
+        inflight = _inflight.get(key)
+        if inflight is not None:
+            await asyncio.wait([inflight])
+            # если прогон-владелец запроса отменили, загружаем сами
+            if not inflight.cancelled():
+                self.shared += 1
+                return inflight.result()
+
+        future = asyncio.get_running_loop().create_future()
+        _inflight[key] = future
+        try:
+            body = await self._fetch(query, lr)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # помечаем как полученное, даже если ожидающих нет
+            raise
+        else:
+            future.set_result(body)
+            return body
+        finally:
+            if _inflight.get(key) is future:
+                del _inflight[key]
+
+    async def _fetch(self, query: str, lr) -> bytes:
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            self.requests += 1
+            try:
+                async with self._semaphore:
+                    async with self._session.get(self.url, params=self._params(query, lr)) as response:
+                        body = await response.read()
+                if response.status < 400:
+                    self.succeeded += 1
+                    self.bytes += len(body)
+                    return body
+                if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise aiohttp.ClientResponseError(response.request_info, response.history,
+                                                      status=response.status, message=body[:200].decode(errors="replace"))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+            except aiohttp.ClientResponseError:
+                self.failed += 1
+                raise
+            self.retries += 1
+            await asyncio.sleep(min(2 ** attempt, 30) + random.uniform(0, 1))
+
+    async def iter_results(self, queries, lr, pick, concurrency: int | None = None):
+        """(query, pick(выдача топ-N)) по мере готовности запросов.
+
+        Запросы обрабатывают concurrency воркеров (по умолчанию - лимит поисковой системы); очередь
+        результатов ограничена, так что если потребитель не успевает, воркеры ждут. Запросы, которые
+        не удалось загрузить или разобрать, пропускаются (ошибка пишется в лог) - вызывающий код видит
+        только реально полученную выдачу.
+        """
+        concurrency = concurrency or SEARCH_SYSTEMS[self.search_system]["concurrency"]
+        queries = iter(queries)
+        results = asyncio.Queue(maxsize=concurrency * 4)
+
+        async def worker():
+            for query in queries:
+                try:
+                    found = pick(await self.results(query, lr))
+                except Exception as e:
+                    print(f"Error processing query '{query}': {e}", file=sys.stderr)
+                    continue
+                await results.put((query, found))
+            await results.put(_WORKER_DONE)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        completed = 0
+        try:
+            remaining = len(workers)
+            while remaining:
+                item = await results.get()
+                if item is _WORKER_DONE:
+                    remaining -= 1
+                    continue
+                completed += 1
+                if completed % 100 == 0:
+                    print(f"{completed} queries complete")
+                yield item
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            "search_system": self.search_system,
+            "requests": self.requests,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retries": self.retries,
+            "shared": self.shared,
+            "cache_hits": self.cache_hits,
+            "cache_errors": self.cache_errors,
+            "bytes": self.bytes,
+            "elapsed": round(elapsed, 2),
+            "queries_per_second": round(self.succeeded / elapsed, 2) if elapsed else 0,
+        }
@@ -0,0 +1,45 @@
+import io
+import xml.etree.ElementTree as ET
+
+NOT_FOUND_URL = "URL не найден"
+
+
+class SerpError(Exception):
+    """Ответ xmlstock без выдачи: ошибка в теле (при HTTP 200), пустое или неразборчивое тело"""
+
+
+def iter_yandex_groups(body: bytes):
+    """Группы выдачи Yandex XML по порядку: (позиция, url, domain) первого doc каждой группы.
+
+    Разбор идет потоково по сырым байтам ответа, каждая группа просматривается один раз
+    и сразу освобождается. Если потребитель прерывает цикл, оставшаяся часть ответа не разбирается.
+    На <error> в ответе, пустом или неразборчивом теле - SerpError.
+    """
+    if not body or not body.strip():
+        raise SerpError("Пустой ответ Yandex XML")
+    position = 0
+    url = domain = None
+    in_doc = False
+    try:
+        for event, elem in ET.iterparse(io.BytesIO(body), events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                if tag == "group":
+                    url = domain = None
+                elif tag == "doc" and url is None and domain is None:
+                    in_doc = True
+                continue
+            if tag == "doc":
+                in_doc = False
+            elif in_doc and tag == "url":
+                url = elem.text
+            elif in_doc and tag == "domain":
+                domain = elem.text
+            elif tag == "group":
+                position += 1
+                yield position, url if url is not None else NOT_FOUND_URL, domain
+                elem.clear()
+            elif tag == "error" and not in_doc:
+                raise SerpError(f"Ошибка Yandex XML {elem.get('code', '')}: {(elem.text or '').strip()}")
+    except ET.ParseError as e:
+        raise SerpError(f"Неразборчивый ответ Yandex XML: {e}") from e
@@ -0,0 +1,214 @@
+"""Компактный формат ответов табличных эндпоинтов.
+
+Вместо словаря html-ячеек на строку - ключи строк, список дат и числовые массивы [строка][дата]
+по каждой метрике. Цвет ячейки передается маленьким целым (COLOR_*), разметку строит шаблон
+(функции *PageRows в static/base.html). Пустая ячейка - null. Формат включается полем
+"format": "compact" в теле запроса, без него эндпоинты отдают html, как раньше.
+"""
+import math
+
+import numpy as np
+
+from const import date_format_2
+from services.metric_matrix import MetricMatrix
+from services.responses import ORJSONResponse
+
+PAYLOAD_VERSION = 1
+
+COLOR_GREEN, COLOR_RED, COLOR_BLUE, COLOR_YELLOW = 0, 1, 2, 3
+
+
+def is_compact(data_request: dict) -> bool:
+    return data_request.get("format") == "compact"
+
+
+def compact_response(payload: dict) -> ORJSONResponse:
+    return ORJSONResponse({"v": PAYLOAD_VERSION, **payload})
+
+
+def _dates(dates) -> tuple[list, dict]:
+    """Даты страницы по убыванию, как колонки таблицы, и их индексы"""
+    dates = sorted(set(dates), reverse=True)
+    return dates, {date: i for i, date in enumerate(dates)}
+
+
+def _format_dates(dates) -> list[str]:
+    return [date.strftime(date_format_2) for date in dates]
+
+
+def _matrix(height: int, width: int) -> list[list]:
+    return [[None] * width for _ in range(height)]
+
+
+def _colors(position: np.ndarray, up: np.ndarray, unknown_up: int = COLOR_GREEN) -> np.ndarray:
+    """Цвет ячеек url/запросов/merge: синий - топ-3, красный - позиция выросла, иначе зеленый.
+    unknown_up - цвет, когда сравнивать не с чем; пустые ячейки - NaN."""
+    color = np.select([position <= 3, up > 0, np.isnan(up)], [COLOR_BLUE, COLOR_RED, unknown_up], COLOR_GREEN)
+    return np.where(np.isnan(position), np.nan, color)
+
+
+def metrics_page(matrix: MetricMatrix, cursor=None) -> dict:
+    """Страница url/запросов по матрице строк _metrics_page_query, даты - по убыванию"""
+    position = matrix.metric("position")
+    up = matrix.deltas("position")
+    # колонки таблицы идут от последнего дня к первому
+    newest_first = np.s_[:, ::-1]
+    return {
+        "keys": matrix.keys,
+        "dates": _format_dates(matrix.dates[::-1]),
+        "position": position[newest_first].tolist(),
+        "clicks": matrix.metric("clicks")[newest_first].tolist(),
+        "impressions": matrix.metric("impressions")[newest_first].tolist(),
+        "ctr": matrix.metric("ctr")[newest_first].tolist(),
+        "trend": np.abs(up)[newest_first].tolist(),
+        "color": _colors(position, up)[newest_first].tolist(),
+        # итог строки: [позиция, клики, показы, ctr]
+        "result": [list(row[5:9]) for row in matrix.first_rows],
+        "cursor": cursor,
+    }
+
+
+def _top_block(tops: list, index: dict, width: int) -> dict:
+    """TOP N запросов/url: tops - [(N, строки (position, clicks, impression, count, date))]"""
+    position, clicks, impressions, count = (_matrix(len(tops), width) for _ in range(4))
+    result = []
+    for row, (_, stats) in enumerate(tops):
+        total_position, total_clicks, total_impression, total_count, count_for_avg = 0, 0, 0, 0, 0
+        for stat in stats:
+            i = index[stat[4]]
+            position[row][i], clicks[row][i], impressions[row][i], count[row][i] = stat[:4]
+            total_position += stat[0]
+            total_clicks += stat[1]
+            total_impression += stat[2]
+            total_count += stat[3]
+            if stat[0] > 0:
+                count_for_avg += 1
+        if count_for_avg > 0:
+            total_position = round(total_position / count_for_avg, 2)
+        result.append([total_position, total_clicks, total_impression, total_count])
+    return {
+        "tops": [top for top, _ in tops],
+        "position": position,
+        "clicks": clicks,
+        "impressions": impressions,
+        "count": count,
+        "result": result,
+    }
+
+
+def history_page(grouped_data: list, query_tops: list, url_tops: list) -> dict:
+    """Показатели по дням: grouped_data - [(показатель, [(name, value, date)])], плюс блоки TOP N"""
+    dates, index = _dates([*(date for _, items in grouped_data for _, _, date in items),
+                           *(stat[4] for _, stats in query_tops + url_tops for stat in stats)])
+    width = len(dates)
+
+    rows = []
+    for name, items in grouped_data:
+        values, color = [None] * width, [None] * width
+        prev_value = -math.inf
+        value_sum, count = 0, 0
+        for _, value, date in items:
+            if value > 0:
+                value_sum += value
+                count += 1
+                values[index[date]] = value
+                color[index[date]] = COLOR_GREEN if value >= prev_value else COLOR_RED
+                prev_value = value
+        if name in ("AVG_CLICK_POSITION", "TOTAL_CTR", "AVG_SHOW_POSITION"):
+            if count > 0:
+                value_sum = round(value_sum / count, 2)
+        rows.append((name, values, color, value_sum))
+    # порядок строк - как в html-режиме
+    rows[-1], rows[-2] = rows[-2], rows[-1]
+
+    return {
+        "dates": _format_dates(dates),
+        "keys": [row[0] for row in rows],
+        "percent": [int(row[0] == "TOTAL_CTR") for row in rows],
+        "values": [row[1] for row in rows],
+        "color": [row[2] for row in rows],
+        "result": [row[3] for row in rows],
+        "query_top": _top_block(query_tops, index, width),
+        "url_top": _top_block(url_tops, index, width),
+    }
+
+
+def _round(values: np.ndarray) -> np.ndarray:
+    # np.round ошибается на половинках (17.585 -> 17.58), итоги округляем как раньше - round()
+    return np.array([round(value, 2) for value in values.tolist()])
+
+
+def merge_results(matrix: MetricMatrix) -> np.ndarray:
+    """Итоги запросов merge, [запрос, (позиция, клики, показы, ctr)]: позиция - средняя по дням
+    с позицией, ctr - клики на показы; без показов позиция и ctr - 0"""
+    totals = matrix.totals()
+    clicks, impressions = totals[:, 1], totals[:, 2]
+    shown = impressions > 0
+    position = np.where(shown, matrix.averages("position"), 0)
+    ctr = np.divide(clicks * 100, impressions, out=np.zeros_like(clicks), where=shown)
+    return np.column_stack([_round(position), clicks, impressions, _round(ctr)])
+
+
+def merge_parent(results: np.ndarray) -> list | None:
+    """Итог url merge по итогам его запросов или None, если кликов нет"""
+    clicks = float(results[:, 1].sum())
+    if clicks <= 0:
+        return None
+    count = np.count_nonzero(results[:, 0] > 0)
+    position = round(float(results[:, 0].sum()) / count, 2) if count else 0
+    impressions = float(results[:, 2].sum())
+    return [position, clicks, impressions, round(clicks * 100 / impressions, 2)]
+
+
+def merge_page(urls: list, matrix: MetricMatrix) -> dict:
+    """Страница merge: urls - [(url, [запросы])], matrix - метрики запросов по всем дням периода.
+
+    Метрики запросов - массивы [url][запрос][дата], в queries только запросы с метриками.
+    parent - итог url или null.
+    """
+    position = matrix.metric("position")
+    up = matrix.deltas("position", skip_missing=False)
+    # первый день периода сравнивать не с чем - как и раньше, он считается ростом
+    color = _colors(position, up, unknown_up=COLOR_RED)
+    trend = np.abs(up)
+    results = merge_results(matrix)
+    metrics = {name: matrix.metric(name) for name in ("clicks", "impressions", "ctr")}
+
+    payload = {key: [] for key in ("keys", "queries", "position", "clicks", "impressions", "ctr",
+                                   "trend", "color", "result", "parent")}
+    payload["dates"] = _format_dates(matrix.dates)
+    for url, url_queries in urls:
+        found = [query for query in url_queries if query in matrix.index]
+        rows = [matrix.index[query] for query in found]
+        payload["keys"].append(url)
+        payload["queries"].append(found)
+        payload["position"].append(position[rows].tolist())
+        for name, values in metrics.items():
+            payload[name].append(values[rows].tolist())
+        payload["trend"].append(trend[rows].tolist())
+        payload["color"].append(color[rows].tolist())
+        payload["result"].append(results[rows].tolist())
+        payload["parent"].append(merge_parent(results[rows]))
+    return payload
+
+
+def live_search_page(matrix: MetricMatrix, all_queries) -> dict:
+    """Позиции live search по матрице (position, url - метка ячейки); запросы без позиций из all_queries
+    идут в конце пустыми строками. Позиция 0 - сайт не найден (COLOR_YELLOW)."""
+    position = matrix.metric("position")
+    up = matrix.deltas("position")
+    found = position > 0
+    color = np.select([~found, np.isnan(up) | (up < 0), up > 0], [COLOR_YELLOW, COLOR_GREEN, COLOR_RED], COLOR_BLUE)
+    color = np.where(matrix.present, color, np.nan)
+    url = np.where(found, matrix.labels, None)
+
+    current_query = set(matrix.keys)
+    extra = [query for query in all_queries if query not in current_query]
+    empty = [[None] * len(matrix.dates) for _ in extra]
+    return {
+        "keys": matrix.keys + extra,
+        "dates": _format_dates(matrix.dates[::-1]),
+        "position": position[:, ::-1].tolist() + empty,
+        "url": url[:, ::-1].tolist() + empty,
+        "color": color[:, ::-1].tolist() + empty,
+    }
@@ -0,0 +1,139 @@
+import asyncio
+import random
+import sys
+import time
+from collections import deque
+
+import aiohttp
+
+from config import WEBMASTER_MAX_CONCURRENCY, WEBMASTER_MAX_RETRIES, WEBMASTER_RPS, WEBMASTER_TIMEOUT
+
+API_URL = "https://api.webmaster.yandex.net/v4"
+
+PAGE_LIMIT = 500
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class WebmasterAPIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"Webmaster API {status}: {message}")
+        self.status = status
+
+
+class WebmasterClient:
+    """Асинхронный клиент Яндекс.Вебмастера.
+
+    Одна aiohttp-сессия на всю выгрузку, не больше max_concurrency запросов
+    одновременно и не больше rps запросов в секунду. Ответы 429/5xx и сетевые
+    ошибки повторяются с экспоненциальной задержкой (Retry-After учитывается).
+    """
+
+    def __init__(self, access_token, max_concurrency=WEBMASTER_MAX_CONCURRENCY,
+                 max_retries=WEBMASTER_MAX_RETRIES, rps=WEBMASTER_RPS, timeout=WEBMASTER_TIMEOUT):
+        self.access_token = access_token
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._interval = 1 / rps if rps > 0 else 0
+        self._next_request_at = 0.0
+        self._rate_lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            headers={"Authorization": f"OAuth {self.access_token}",
+                     "Content-Type": "application/json; charset=UTF-8"},
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+
+    async def _wait_rate_limit(self):
+        async with self._rate_lock:
+            now = time.monotonic()
+            delay = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _backoff(attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(2 ** attempt, 30) + random.uniform(0, 1)
+
+    async def request(self, method, path, **kwargs):
+        url = f"{API_URL}{path}"
+        for attempt in range(self.max_retries + 1):
+            await self._wait_rate_limit()
+            try:
+                async with self._semaphore:
+                    async with self._session.request(method, url, **kwargs) as response:
+                        if response.status < 400:
+                            return await response.json(content_type=None)
+                        text = await response.text()
+                        if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                            raise WebmasterAPIError(response.status, text[:200])
+                        delay = self._backoff(attempt, response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                text = repr(e)
+            print(f"[WEBMASTER] {method} {path}: {text[:100]}, повтор через {delay:.1f} c", file=sys.stderr)
+            await asyncio.sleep(delay)
+
+    async def get_query_analytics(self, user_id, host_id, text_indicator, offset=0, limit=PAGE_LIMIT):
+        body = {
+            "offset": offset,
+            "limit": limit,
+            "device_type_indicator": "ALL",
+            "text_indicator": text_indicator,
+            "region_ids": [],
+            "filters": {}
+        }
+        return await self.request("POST", f"/user/{user_id}/hosts/{host_id}/query-analytics/list", json=body)
+
+    async def iter_query_analytics(self, user_id, host_id, text_indicator, offsets):
+        """Отдает (offset, data) в порядке offsets, загружая до max_concurrency страниц наперед.
+
+        Если страница так и не загрузилась, вместо data отдается исключение.
+        """
+        offsets = iter(offsets)
+        pending = deque()
+
+        def schedule():
+            offset = next(offsets, None)
+            if offset is not None:
+                task = asyncio.create_task(self.get_query_analytics(user_id, host_id, text_indicator, offset))
+                pending.append((offset, task))
+
+        for _ in range(self.max_concurrency):
+            schedule()
+        try:
+            while pending:
+                offset, task = pending.popleft()
+                try:
+                    data = await task
+                except Exception as e:
+                    data = e
+                schedule()
+                yield offset, data
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def get_search_queries_history(self, user_id, host_id, date_from, date_to, query_indicators):
+        params = [("query_indicator", indicator) for indicator in query_indicators]
+        params += [("date_from", str(date_from)), ("date_to", str(date_to))]
+        return await self.request("GET", f"/user/{user_id}/hosts/{host_id}/search-queries/all/history",
+                                  params=params)
@@ -0,0 +1,151 @@
+"""MetricMatrix и итоги merge против прежних циклов по строкам (до перевода таблиц на NumPy)"""
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from services.metric_matrix import MetricMatrix
+from services.table_payload import merge_parent, merge_results
+
+START = datetime(2024, 6, 1)
+DATES = [START + timedelta(days=i) for i in range(5)]
+
+# (date, position, clicks, impression, ctr, query); у каждого запроса есть пропущенные дни
+ROWS = [
+    (DATES[0], 17.58, 2, 10, 20.0, "half"),
+    (DATES[3], 17.59, 1, 5, 20.0, "half"),
+    (DATES[1], 5.0, 0, 4, 0.0, "gaps"),
+    (DATES[2], 0, 0, 0, 0.0, "gaps"),
+    (DATES[4], 3.25, 3, 9, 33.33, "gaps"),
+    (DATES[0], 0, 0, 0, 0.0, "hidden"),
+    (DATES[2], 0, 0, 0, 0.0, "hidden"),
+    (DATES[0], 8.1, 1, 7, 14.29, "full"),
+    (DATES[1], 7.4, 0, 6, 0.0, "full"),
+    (DATES[2], 9.9, 2, 8, 25.0, "full"),
+    (DATES[3], 9.9, 1, 8, 12.5, "full"),
+    (DATES[4], 6.0, 4, 10, 40.0, "full"),
+]
+
+
+def _grouped(rows) -> dict:
+    grouped = {}
+    for row in sorted(rows, key=lambda x: (x[-1], x[0])):
+        grouped.setdefault(row[-1], []).append(row)
+    return grouped
+
+
+def _nan_to_none(values: list) -> list:
+    return [None if isinstance(value, float) and math.isnan(value) else value for value in values]
+
+
+def _loop_deltas_skip_missing(stats) -> dict:
+    # live search: сравнение с предыдущей строкой запроса, первой строке сравнивать не с чем
+    deltas, prev = {}, None
+    for stat in stats:
+        deltas[stat[0]] = None if prev is None else round(stat[1] - prev, 2)
+        prev = stat[1]
+    return deltas
+
+
+def _loop_deltas_calendar(stats) -> dict:
+    # merge: обход всех дней периода, пропущенный день - позиция 0
+    data_dict = {stat[0]: stat for stat in stats}
+    deltas, prev_position = {}, -math.inf
+    for date in DATES:
+        stat = data_dict.get(date, (-444, 0, 0, 0, 0, 0))
+        up = round(stat[1] - prev_position, 2)
+        if stat[0] != -444:
+            deltas[date] = up if math.isfinite(up) else None
+        prev_position = stat[1]
+    return deltas
+
+
+def _loop_merge(url_queries, grouped) -> tuple[list, list | None]:
+    # итоги запросов и url, как их считал обход дней в api/merge_api/router.py
+    results = []
+    parent_clicks, parent_position, parent_impression, parent_count = 0, 0, 0, 0
+    for query in url_queries:
+        stats = grouped.get(query)
+        if not stats:
+            continue
+        total_clicks, position, impressions, count = 0, 0, 0, 0
+        for stat in stats:
+            total_clicks += stat[2]
+            position += stat[1]
+            impressions += stat[3]
+            if stat[1] > 0:
+                count += 1
+        if impressions > 0:
+            total_position = round(position / count, 2)
+            results.append([total_position, total_clicks, impressions, round(total_clicks * 100 / impressions, 2)])
+        else:
+            total_position = 0
+            results.append([0, total_clicks, impressions, 0])
+        parent_clicks += total_clicks
+        parent_position += total_position
+        parent_impression += impressions
+        if total_position > 0:
+            parent_count += 1
+    parent = None
+    if parent_clicks > 0:
+        parent = [round(parent_position / parent_count, 2), parent_clicks, parent_impression,
+                  round(parent_clicks * 100 / parent_impression, 2)]
+    return results, parent
+
+
+@pytest.fixture
+def matrix() -> MetricMatrix:
+    return MetricMatrix.from_rows(ROWS, dates=DATES)
+
+
+def test_layout_keeps_gaps(matrix):
+    grouped = _grouped(ROWS)
+    for row, key in enumerate(matrix.keys):
+        days = {stat[0]: stat for stat in grouped[key]}
+        for day, date in enumerate(DATES):
+            assert matrix.present[row, day] == (date in days)
+            if date in days:
+                assert matrix.cell(row, day) == list(days[date][1:5])
+            else:
+                assert all(math.isnan(value) for value in matrix.cell(row, day))
+
+
+@pytest.mark.parametrize("skip_missing, loop", [(True, _loop_deltas_skip_missing), (False, _loop_deltas_calendar)])
+def test_deltas_match_loops(matrix, skip_missing, loop):
+    deltas = matrix.deltas("position", skip_missing=skip_missing)
+    for row, (key, stats) in enumerate(_grouped(ROWS).items()):
+        expected = loop(stats)
+        got = _nan_to_none(deltas[matrix.index[key]].tolist())
+        for day, date in enumerate(DATES):
+            assert got[day] == expected.get(date), (key, date)
+
+
+def test_totals_counts_and_averages_match_loops(matrix):
+    totals = matrix.totals()
+    counts = matrix.nonzero_counts("position")
+    averages = matrix.averages("position")
+    for key, stats in _grouped(ROWS).items():
+        row = matrix.index[key]
+        assert totals[row].tolist() == pytest.approx([sum(stat[i] for stat in stats) for i in range(1, 5)])
+        count = sum(1 for stat in stats if stat[1] > 0)
+        assert counts[row] == count
+        expected = sum(stat[1] for stat in stats) / count if count else 0
+        assert averages[row] == pytest.approx(expected)
+
+
+def test_merge_results_match_loop(matrix):
+    grouped = _grouped(ROWS)
+    results = merge_results(matrix)
+    for url_queries in (["half", "gaps", "missing", "hidden", "full"], ["hidden"], ["half"], []):
+        rows = [matrix.index[query] for query in url_queries if query in matrix.index]
+        expected, expected_parent = _loop_merge(url_queries, grouped)
+        assert results[rows].tolist() == expected
+        assert merge_parent(results[rows]) == expected_parent
+
+
+def test_merge_results_round_halves_like_round():
+    # (17.58 + 17.59) / 2 = 17.585: np.round дает 17.58, прежний round() - 17.59
+    assert np.round(np.array([(17.58 + 17.59) / 2]), 2)[0] == 17.58
+    results = merge_results(MetricMatrix.from_rows(ROWS, dates=DATES))
+    assert results[0].tolist()[0] == 17.59